@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Benchmark: time and resident memory to load a course three ways.
+
+  gpx     gpxpy.parse of the source GPX
+  json    json.load of the treadmill profile written by gpx_parser.py
+  course  CompiledCourse of the .course file, touching every column
+
+Each method runs in a fresh interpreter so RSS figures don't leak between
+them. ``--copies`` loads the course that many times in one process, as a
+server holding several courses (or several workers) would; the mapped
+file's pages are shared, parsed objects are not.
+
+Usage: python benchmarks/bench_course_load.py [--gpx FILE] [--copies 10]
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+
+DEFAULT_GPX = ROOT / 'static' / 'data' / 'courses' / 'city2surf2013.gpx'
+
+# Run in the child: load ``path`` ``copies`` times with one method, report seconds and RSS growth
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, {src!r})
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+method, path, copies = {method!r}, {path!r}, {copies}
+if method == 'gpx':
+    import gpxpy
+    load = lambda: gpxpy.parse(open(path))
+elif method == 'json':
+    load = lambda: json.load(open(path))
+else:
+    from utils.course_store import CompiledCourse
+    def load():
+        course = CompiledCourse(path)
+        for column in course.columns.values():
+            column.sum()
+        return course
+
+before = rss_kb()
+start = time.perf_counter()
+kept = [load() for _ in range(copies)]
+elapsed = time.perf_counter() - start
+print(elapsed / copies * 1000, rss_kb() - before)
+'''
+
+
+def run(method, path, copies):
+    code = CHILD.format(src=str(ROOT / 'src'), method=method, path=str(path), copies=copies)
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    ms, kb = out.stdout.split()
+    return float(ms), int(kb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gpx', type=Path, default=DEFAULT_GPX)
+    parser.add_argument('--copies', type=int, default=10)
+    args = parser.parse_args()
+
+    from utils.gpx_parser import gpx_to_treadmill_profile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / (args.gpx.stem + '.json')
+        gpx_to_treadmill_profile(str(args.gpx), str(json_path))
+        course_path = json_path.with_suffix('.course')
+        files = {'gpx': args.gpx, 'json': json_path, 'course': course_path}
+
+        print(f"\n{args.gpx.name}, {args.copies} copies per process")
+        print(f"{'method':8s} {'file KB':>8s} {'ms/load':>8s} {'RSS KB':>8s}")
+        for method, path in files.items():
+            ms, kb = run(method, path, args.copies)
+            print(f"{method:8s} {path.stat().st_size / 1024:8.0f} {ms:8.2f} {kb:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Benchmark: the replayed notification path on the default asyncio loop and on uvloop.
+
+Replays a session log as fast as the consumers allow through the real
+WoodwayTreadmill handler and ingest queue, and reports notifications per
+second, receipt-to-callback latency and event loop lag for each loop.
+Without --session a synthetic log of --frames treadmill notifications is
+written to a temporary file first. uvloop is optional; it is skipped
+when not installed.
+
+Usage: python benchmarks/bench_event_loop.py [--session run.bles] [--frames 20000] [--repeat 3]
+"""
+import argparse
+import asyncio
+import logging
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from ble.session_log import SessionRecorder, SessionReplay  # noqa: E402
+from latency import LatencyHistogram  # noqa: E402
+from loop_monitor import LoopLagMonitor  # noqa: E402
+from treadmill_manager import WoodwayTreadmill  # noqa: E402
+
+# Synthetic Woodway 4Front frame: 6.00 km/h, 128 bpm, 2.0 %; distance at bytes 8-9
+SAMPLE_FRAME = bytearray.fromhex('0000000000005802d204000000800000140000000000')
+
+
+def loop_factories():
+    factories = {'asyncio': asyncio.new_event_loop}
+    try:
+        import uvloop
+        factories['uvloop'] = uvloop.new_event_loop
+    except ImportError:
+        print("uvloop not installed, benchmarking the default loop only (pip install uvloop)")
+    return factories
+
+
+def write_session(path: Path, uuid: str, frames: int):
+    frame = bytearray(SAMPLE_FRAME)
+    with SessionRecorder(path) as recorder:
+        for i in range(frames):
+            struct.pack_into('<H', frame, 8, i // 10 % 65536)
+            recorder.record(uuid, frame, timestamp=i * 0.05)
+
+
+async def replay(session: Path):
+    treadmill = WoodwayTreadmill()
+    treadmill.gatt_cache = None
+    session_replay = SessionReplay(session, speed=0)
+    treadmill.client_factory = session_replay.client_factory()
+    latency = LatencyHistogram()
+    delivered = 0
+
+    def on_frame(result):
+        nonlocal delivered
+        delivered += 1
+        latency.record(time.monotonic() - result['received'])
+
+    treadmill.callback = on_frame
+    monitor = LoopLagMonitor(interval=0.005, threshold=float('inf'), capture_stacks=False)
+    monitor.start()
+    start = perf_counter()
+    await treadmill.connect()
+    await session_replay.done.wait()
+    while treadmill.ingest.depth:
+        await asyncio.sleep(0)
+    elapsed = perf_counter() - start
+    await treadmill.watchdog.stop()
+    await treadmill.ingest.stop()
+    await monitor.stop()
+    return session_replay.frames_sent, delivered, elapsed, latency, monitor.histogram
+
+
+def run(label, factory, session, repeat):
+    best = None
+    for _ in range(repeat):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            result = runner.run(replay(session))
+        if best is None or result[2] < best[2]:
+            best = result
+    sent, delivered, elapsed, latency, lag = best
+    rate = sent / elapsed
+    print(f"{label:<8} {rate:>10,.0f} frames/s  delivered {delivered:>7,}/{sent:,}  "
+          f"latency p50 {latency.percentile(50) * 1e6:>6.0f} us  p99 {latency.percentile(99) * 1e6:>6.0f} us  "
+          f"loop lag p99 {lag.percentile(99) * 1e3:>6.2f} ms  max {lag.max * 1e3:>6.2f} ms")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--session', help='Recorded session log to replay (default: synthetic)')
+    parser.add_argument('--frames', type=int, default=20_000, help='Frames in the synthetic session')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per loop; the fastest is reported')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('treadmill_manager').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.session:
+            session = Path(args.session)
+        else:
+            session = Path(tmp) / 'synthetic.bles'
+            write_session(session, WoodwayTreadmill().config['data_uuid'], args.frames)
+
+        rates = {label: run(label, factory, session, args.repeat)
+                 for label, factory in loop_factories().items()}
+    if 'uvloop' in rates:
+        print(f"speedup  {rates['uvloop'] / rates['asyncio']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: per-frame cost of treadmill notification decoding.
+
+Compares the original slice + struct.unpack + datetime path with the
+compiled FrameDecoder path used by WoodwayTreadmill._decode_frame.
+
+Usage: python benchmarks/bench_frame_decoder.py [--frames 200000]
+"""
+import argparse
+import logging
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from treadmill_manager import WoodwayTreadmill  # noqa: E402
+
+# Synthetic Woodway 4Front frame: 6.00 km/h, 1234 m, 128 bpm, 2.0 %
+SAMPLE_FRAME = bytearray.fromhex('0000000000005802d204000000800000140000000000')
+
+
+class LegacyDecoder:
+    """The per-frame parsing done by the original _handle_data"""
+
+    def __init__(self):
+        self.config = {
+            'byte_positions': {
+                'speed': (6, 7),
+                'distance': (8, 9),
+                'incline': (16, 17),
+                'heart_rate': 13
+            },
+            'scale_factors': {'speed': 100.0, 'distance': 1.0, 'incline': 10.0},
+            'max_speed': 25.0,
+            'max_incline': 15.0
+        }
+        self.accumulated_distance = 0.0
+        self.last_raw_distance = 0
+        self.last_update = None
+
+    def _parse_value(self, data, key):
+        start, end = self.config['byte_positions'][key]
+        raw = struct.unpack('<H', data[start:end+1])[0]
+        value = raw / self.config['scale_factors'][key]
+        if key == 'speed' and value > self.config['max_speed']:
+            return self.config['max_speed']
+        if key == 'incline' and abs(value) > self.config['max_incline']:
+            return self.config['max_incline'] * (1 if value > 0 else -1)
+        return value
+
+    def decode(self, data):
+        now = datetime.now()
+        raw_distance = struct.unpack('<H', data[8:10])[0]
+        speed_kmh = self._parse_value(data, 'speed')
+        if self.last_raw_distance < raw_distance < self.last_raw_distance + 1000:
+            self.accumulated_distance = raw_distance / self.config['scale_factors']['distance']
+            self.last_raw_distance = raw_distance
+        elif self.last_update:
+            time_elapsed = (now - self.last_update).total_seconds()
+            self.accumulated_distance += (speed_kmh / 3.6) * time_elapsed
+        self.last_update = now
+        return {
+            'speed': speed_kmh,
+            'incline': self._parse_value(data, 'incline'),
+            'distance': self.accumulated_distance,
+            'heart_rate': data[self.config['byte_positions']['heart_rate']],
+            'timestamp': now.isoformat()
+        }
+
+
+def run(label, decode, frames):
+    data = SAMPLE_FRAME
+    start = perf_counter()
+    for _ in range(frames):
+        decode(data)
+    elapsed = perf_counter() - start
+    rate = frames / elapsed
+    print(f"{label:<10} {rate:>12,.0f} frames/s  {elapsed / frames * 1e6:>7.2f} us/frame")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=200_000)
+    args = parser.parse_args()
+
+    treadmill = WoodwayTreadmill()
+    logging.getLogger('treadmill_manager').setLevel(logging.WARNING)
+
+    legacy = LegacyDecoder().decode(SAMPLE_FRAME)
+    compiled = treadmill._decode_frame(SAMPLE_FRAME)
+    for key in ('speed', 'incline', 'distance', 'heart_rate'):
+        assert legacy[key] == compiled[key], (key, legacy[key], compiled[key])
+
+    print(f"Decoder: {treadmill.decoder!r}")
+    before = run('before', LegacyDecoder().decode, args.frames)
+    after = run('after', WoodwayTreadmill()._decode_frame, args.frames)
+    print(f"speedup    {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
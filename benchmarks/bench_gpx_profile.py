@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Benchmark: gpx_to_treadmill_profile against the original per-point loop.
+
+The reference below is the original implementation: gpxpy.parse, geopy
+geodesic distance per point pair, then separate passes for gain and max
+grade. It is timed against the streaming, vectorized implementation,
+with and without reading the file. The output comparison checks the
+stated tolerance:
+
+  km     within 0.001 (one unit of the rounded output)
+  grade  within 0.1 %
+  lat, lon, ele and the kept points identical
+
+for min_segment_length of a metre or more. Below that, sub-millimetre
+hops make grade ill-conditioned in both implementations.
+
+Usage: python benchmarks/bench_gpx_profile.py [--gpx FILE] [--repeat 5]
+"""
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import gpxpy
+from geopy.distance import distance
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+
+from utils import gpx_parser  # noqa: E402
+
+DEFAULT_GPX = ROOT / 'static' / 'data' / 'courses' / 'city2surf2013.gpx'
+
+
+def reference_profile(gpx, min_segment_length=5.0):
+    """The per-point loop gpx_parser used before vectorizing"""
+    profile = []
+    total_km = 0.0
+    prev_point = None
+    for track in gpx.tracks:
+        for segment in track.segments:
+            for point in segment.points:
+                if point.elevation is None:
+                    continue
+                if prev_point:
+                    if point.latitude == prev_point.latitude and point.longitude == prev_point.longitude:
+                        continue
+                    dist_km = distance((prev_point.latitude, prev_point.longitude),
+                                       (point.latitude, point.longitude)).km
+                    if dist_km < (min_segment_length / 1000):
+                        continue
+                    total_km += dist_km
+                    grade_pct = ((point.elevation - prev_point.elevation) / (dist_km * 1000)) * 100
+                else:
+                    grade_pct = 0.0
+                profile.append({"km": round(total_km, 3), "lat": round(point.latitude, 6),
+                                "lon": round(point.longitude, 6), "ele": round(point.elevation, 1),
+                                "grade": round(grade_pct, 1)})
+                prev_point = point
+    gain = sum(max(profile[i]["ele"] - profile[i - 1]["ele"], 0) for i in range(1, len(profile)))
+    max_grade = max(abs(p["grade"]) for p in profile)
+    return profile, round(gain, 1), max_grade
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = fn()
+        times.append(perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gpx', type=Path, default=DEFAULT_GPX)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    def parse():
+        with open(args.gpx) as f:
+            return gpxpy.parse(f)
+
+    gpx = parse()
+    parse_s, _ = best_of(parse, args.repeat)
+    loop_s, (expected, gain, max_grade) = best_of(lambda: reference_profile(gpx), args.repeat)
+    total_s, output = best_of(lambda: gpx_parser.gpx_to_treadmill_profile(str(args.gpx)), args.repeat)
+    profile = output['profile']
+
+    print(f"{args.gpx.name}: {len(expected)} points kept")
+    print(f"gpxpy + loop:           {(parse_s + loop_s) * 1000:8.1f} ms  (loop alone {loop_s * 1000:.1f} ms)")
+    print(f"streaming + vectorized: {total_s * 1000:8.1f} ms  ({(parse_s + loop_s) / total_s:.0f}x)")
+
+    if len(profile) != len(expected):
+        sys.exit(f"FAIL: {len(profile)} points kept, expected {len(expected)}")
+    km_error = max(abs(a['km'] - b['km']) for a, b in zip(profile, expected))
+    grade_error = max(abs(a['grade'] - b['grade']) for a, b in zip(profile, expected))
+    exact = all(a[k] == b[k] for a, b in zip(profile, expected) for k in ('lat', 'lon', 'ele'))
+    print(f"max |km| difference {km_error:.3f}, max |grade| difference {grade_error:.1f}, "
+          f"lat/lon/ele identical: {exact}")
+    print(f"gain {output['metadata']['elevation_gain']} vs {gain}, "
+          f"max grade {output['metadata']['max_grade']} vs {max_grade}")
+    if km_error > 0.001 + 1e-9 or grade_error > 0.1 + 1e-9 or not exact:
+        sys.exit("FAIL: outside tolerance")
+
+
+if __name__ == '__main__':
+    main()
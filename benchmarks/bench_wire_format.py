@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: bytes and encode cost of one live metrics message.
+
+Compares the JSON ``system_update`` payload (ISO timestamp included) with
+the packed frame from src/wire.py. Wire sizes are whole Socket.IO packets,
+so the binary figure includes the placeholder header packet Socket.IO
+sends ahead of every binary attachment.
+
+Usage: python benchmarks/bench_wire_format.py [--messages 200000]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+from socketio import packet
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from wire import pack_metrics  # noqa: E402
+
+SAMPLE = {
+    'speed': 9.87,
+    'incline': 2.5,
+    'distance': 4321.123456789,
+    'heart_rate': 143,
+    'ages': {'hrm': 0.412, 'treadmill': 0.05},
+    'timestamp': time.time()
+}
+
+
+def json_payload(sample):
+    return {
+        'type': 'metrics',
+        'speed': float(sample['speed']),
+        'incline': float(sample['incline']),
+        'distance': float(sample['distance']),
+        'heart_rate': int(sample['heart_rate']),
+        'ages': sample['ages'],
+        'timestamp': datetime.fromtimestamp(sample['timestamp']).isoformat()
+    }
+
+
+def json_message(sample):
+    return packet.Packet(packet.EVENT, data=['system_update', json_payload(sample)]).encode()
+
+
+def binary_message(sample):
+    return packet.Packet(packet.EVENT, data=['system_update', pack_metrics(sample)]).encode()
+
+
+def wire_bytes(encoded):
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part) for part in parts)
+
+
+def bench(fn, messages):
+    start = perf_counter()
+    for _ in range(messages):
+        fn(SAMPLE)
+    return (perf_counter() - start) / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    json_bytes = wire_bytes(json_message(SAMPLE))
+    binary_bytes = wire_bytes(binary_message(SAMPLE))
+    json_us = bench(json_message, args.messages)
+    binary_us = bench(binary_message, args.messages)
+
+    print(f"JSON:   {json_bytes:4d} bytes  {json_us:6.2f} us/message")
+    print(f"binary: {binary_bytes:4d} bytes  {binary_us:6.2f} us/message")
+    print(f"size {json_bytes / binary_bytes:.1f}x smaller, encode {json_us / binary_us:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
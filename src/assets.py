@@ -0,0 +1,258 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / '.cache' / 'assets'
+COMPRESSIBLE = {'.json', '.geojson', '.gpx', '.js', '.mjs', '.css', '.html', '.svg', '.txt'}
+PREBUILD_PATTERNS = ('data/courses/*.json', 'data/courses/*.geojson', 'js/**/*.js', 'css/**/*.css')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+_STATIC_REF = re.compile(r'((?:src|href)=")(/static/)([^"?#]+)(")')
+
+mimetypes.add_type('application/geo+json', '.geojson')
+mimetypes.add_type('application/gpx+xml', '.gpx')
+mimetypes.add_type('text/javascript', '.js')
+
+
+class Asset:
+    """One file's bytes, encoded variants and validators"""
+    __slots__ = ('stat_key', 'digest', 'etag', 'content_type', 'variants', 'size')
+
+    def __init__(self, stat_key: Tuple[int, int], body: bytes, content_type: str):
+        self.stat_key = stat_key
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.digest}"'
+        self.content_type = content_type
+        self.variants: Dict[str, bytes] = {'identity': body}
+        self.size = len(body)
+
+    def add_variant(self, encoding: str, body: bytes):
+        self.variants[encoding] = body
+        self.size += len(body)
+
+
+class AssetStore:
+    """Serves files under ``root`` from memory with compression and validators.
+
+    Compressible files get gzip and, when the ``brotli`` module is
+    installed, brotli variants. These are built once per content hash and
+    kept under ``cache_dir`` so restarts don't recompress. Assets live in
+    an LRU bounded by ``max_bytes`` over all variants. A cheap ``stat``
+    per request catches edited files.
+
+    Each representation has a strong ETag, and a matching If-None-Match
+    returns 304. URLs from ``url()`` carry ``?v=<content hash>`` and are
+    served as immutable for a year. Plain URLs must revalidate.
+    """
+
+    def __init__(self, root: Union[str, Path], prefix: str = '/static',
+                 cache_dir: Union[str, Path, None] = DEFAULT_CACHE_DIR,
+                 max_bytes: int = 64 * 1024 * 1024, min_size: int = 1024):
+        self.root = Path(root).resolve()
+        self.prefix = prefix.rstrip('/')
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self._assets: 'OrderedDict[Path, Asset]' = OrderedDict()
+        self._bytes = 0
+        self._pages: Dict[Path, Tuple[tuple, Asset]] = {}
+        self._lock = threading.Lock()  # prebuild fills the cache from a worker thread
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_out = 0
+
+    def _resolve(self, relative: str) -> Optional[Path]:
+        path = (self.root / relative).resolve()
+        if path != self.root and self.root not in path.parents:
+            return None
+        return path if path.is_file() else None
+
+    def _compressed(self, digest: str, encoding: str, body: bytes) -> bytes:
+        """Encoded variant, read from the disk cache or built and stored there"""
+        cached = self.cache_dir / f'{digest}.{encoding}' if self.cache_dir else None
+        if cached is not None:
+            try:
+                return cached.read_bytes()
+            except FileNotFoundError:
+                pass
+        if encoding == 'br':
+            data = brotli.compress(body, quality=11)
+        else:
+            data = gzip.compress(body, compresslevel=9, mtime=0)
+        if cached is not None:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            # Unique temp name: the prebuild task and request threads may build
+            # the same digest's br and gzip variants at once
+            with tempfile.NamedTemporaryFile(dir=cached.parent, prefix=f'.{cached.name}.',
+                                             suffix='.tmp', delete=False) as f:
+                f.write(data)
+            try:
+                os.replace(f.name, cached)
+            except OSError:
+                os.unlink(f.name)
+                raise
+        return data
+
+    def _build(self, path: Path, stat_key: Tuple[int, int]) -> Asset:
+        body = path.read_bytes()
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        asset = Asset(stat_key, body, content_type)
+        if path.suffix in COMPRESSIBLE and len(body) >= self.min_size:
+            encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+            for encoding in encodings:
+                data = self._compressed(asset.digest, encoding, body)
+                if len(data) < len(body):
+                    asset.add_variant(encoding, data)
+        return asset
+
+    def _lookup(self, path: Path) -> Tuple[Optional[Asset], Tuple[int, int]]:
+        """Cached asset if still current, plus the file's stat key"""
+        stat = path.stat()
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is not None and asset.stat_key == stat_key:
+                self._assets.move_to_end(path)
+                self.hits += 1
+                return asset, stat_key
+            self.misses += 1
+        return None, stat_key
+
+    def _insert(self, path: Path, asset: Asset) -> Asset:
+        with self._lock:
+            previous = self._assets.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._assets[path] = asset
+            self._bytes += asset.size
+            while self._bytes > self.max_bytes and len(self._assets) > 1:
+                _, evicted = self._assets.popitem(last=False)
+                self._bytes -= evicted.size
+        return asset
+
+    def get(self, path: Path) -> Asset:
+        """Current asset for ``path``, rebuilt in the calling thread if the file changed"""
+        asset, stat_key = self._lookup(path)
+        return asset or self._insert(path, self._build(path, stat_key))
+
+    async def get_async(self, path: Path) -> Asset:
+        """``get`` that compresses in a worker thread so a miss never blocks the loop"""
+        asset, stat_key = self._lookup(path)
+        if asset is not None:
+            return asset
+        built = await asyncio.get_running_loop().run_in_executor(None, self._build, path, stat_key)
+        return self._insert(path, built)
+
+    def prebuild(self, patterns: Iterable[str] = PREBUILD_PATTERNS) -> int:
+        """Load and compress matching files ahead of the first request"""
+        count = 0
+        for pattern in patterns:
+            for path in sorted(self.root.glob(pattern)):
+                if path.is_file():
+                    self.get(path.resolve())
+                    count += 1
+        return count
+
+    async def prebuild_async(self, patterns: Iterable[str] = PREBUILD_PATTERNS):
+        """``prebuild`` in a worker thread; brotli at quality 11 takes seconds on course files"""
+        try:
+            count = await asyncio.get_running_loop().run_in_executor(None, self.prebuild, tuple(patterns))
+            logger.info(f"Prebuilt {count} static assets ({self._bytes / 1e6:.1f} MB in memory)")
+        except Exception as e:
+            logger.error(f"Asset prebuild failed: {str(e)}")
+
+    async def url(self, relative: str) -> str:
+        """Content-hashed URL for a file under ``root``"""
+        path = self._resolve(relative)
+        if path is None:
+            return f'{self.prefix}/{relative}'
+        asset = await self.get_async(path)
+        return f'{self.prefix}/{relative}?v={asset.digest}'
+
+    @staticmethod
+    def _choose(asset: Asset, accept_encoding: str) -> str:
+        if 'br' in asset.variants and 'br' in accept_encoding:
+            return 'br'
+        if 'gzip' in asset.variants and 'gzip' in accept_encoding:
+            return 'gzip'
+        return 'identity'
+
+    def _response(self, request: web.Request, asset: Asset, versioned: bool) -> web.Response:
+        encoding = self._choose(asset, request.headers.get('Accept-Encoding', ''))
+        etag = asset.etag if encoding == 'identity' else f'"{asset.digest}-{encoding}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': IMMUTABLE if versioned else REVALIDATE,
+            'Vary': 'Accept-Encoding'
+        }
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or
+                              etag in (tag.strip() for tag in if_none_match.split(','))):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        body = asset.variants[encoding]
+        self.bytes_out += len(body)
+        return web.Response(body=body, content_type=asset.content_type, headers=headers)
+
+    async def respond(self, request: web.Request, relative: str) -> web.Response:
+        path = self._resolve(relative)
+        if path is None:
+            raise web.HTTPNotFound(text=f"{relative} not found")
+        asset = await self.get_async(path)
+        return self._response(request, asset, request.query.get('v') == asset.digest)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Route handler for ``{prefix}/{path:.*}``"""
+        return await self.respond(request, request.match_info['path'])
+
+    async def page(self, request: web.Request, relative: str) -> web.Response:
+        """HTML page with its /static/ src and href links rewritten to hashed URLs"""
+        path = self._resolve(relative)
+        if path is None:
+            raise web.HTTPNotFound(text=f"{relative} not found")
+        source = await self.get_async(path)
+        html = source.variants['identity'].decode('utf-8')
+        # Keyed on the linked URLs too, so editing app.js re-renders the page
+        urls = tuple([await self.url(m.group(3)) for m in _STATIC_REF.finditer(html)])
+        cached = self._pages.get(path)
+        if cached is None or cached[0] != (source.digest, urls):
+            links = iter(urls)
+            body = _STATIC_REF.sub(lambda m: m.group(1) + next(links) + m.group(4), html).encode('utf-8')
+            rendered = Asset(source.stat_key, body, 'text/html')
+            if len(body) >= self.min_size:
+                rendered.add_variant('gzip', gzip.compress(body, mtime=0))
+            cached = self._pages[path] = ((source.digest, urls), rendered)
+        return self._response(request, cached[1], False)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'assets': len(self._assets),
+            'memory_bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'bytes_out': self.bytes_out,
+            'brotli': brotli is not None
+        }
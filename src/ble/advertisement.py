@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from bleak import BleakScanner
+
+logger = logging.getLogger(__name__)
+
+
+class AdvertisementWatcher:
+    """Wakes reconnect loops the moment a watched device advertises.
+
+    A single ``BleakScanner`` runs in detection-callback mode for the whole
+    app; each watched MAC address gets an ``asyncio.Event`` that is set when
+    an advertisement from it arrives. ``scanner_factory`` takes the
+    ``BleakScanner`` constructor keywords and can be replaced with a fake
+    that calls ``_on_advertisement`` directly when testing without a radio.
+    """
+
+    def __init__(self, scanner_factory: Callable[..., Any] = BleakScanner,
+                 scanning_mode: str = 'active'):
+        self.scanner_factory = scanner_factory
+        self.scanning_mode = scanning_mode
+        self.scanner = None
+        self.running = False
+        self._events: Dict[str, asyncio.Event] = {}
+        self.last_seen: Dict[str, float] = {}   # time.monotonic() of last advertisement
+        self.last_rssi: Dict[str, Optional[int]] = {}
+        self.advertisements = 0
+
+    def watch(self, address: str):
+        self._events.setdefault(address.lower(), asyncio.Event())
+
+    async def start(self):
+        """Start scanning; failures leave the watcher disabled, not fatal"""
+        if self.running or not self._events:
+            return
+        try:
+            self.scanner = self.scanner_factory(
+                detection_callback=self._on_advertisement,
+                scanning_mode=self.scanning_mode
+            )
+            await self.scanner.start()
+            self.running = True
+            logger.info(f"Watching advertisements for {', '.join(self._events)}")
+        except Exception as e:
+            self.scanner = None
+            logger.warning(f"Advertisement scanner unavailable, falling back to polling: {str(e)}")
+
+    async def stop(self):
+        if self.scanner and self.running:
+            try:
+                await self.scanner.stop()
+            except Exception as e:
+                logger.error(f"Scanner stop error: {str(e)}")
+        self.running = False
+
+    def _on_advertisement(self, device, advertisement_data):
+        """BleakScanner detection callback; runs for every device in range"""
+        address = device.address.lower()
+        event = self._events.get(address)
+        if event is None:
+            return
+        self.advertisements += 1
+        self.last_seen[address] = time.monotonic()
+        self.last_rssi[address] = getattr(advertisement_data, 'rssi', None)
+        event.set()
+
+    async def wait_for(self, address: str, timeout: float) -> bool:
+        """Wait for a fresh advertisement; False if ``timeout`` passed first"""
+        event = self._events[address.lower()]
+        event.clear()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,116 @@
+import struct
+from operator import truediv
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+# Field widths are implied by the YAML byte positions:
+#   heart_rate: 13        -> single byte  (uint8)
+#   speed: [6, 7]         -> two bytes    (uint16, little-endian)
+#   distance: [8, 11]     -> four bytes   (uint32, little-endian)
+_WIDTH_FORMATS = {1: 'B', 2: 'H', 4: 'I'}
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class FrameLayoutError(ValueError):
+    """Raised when a frame layout cannot be compiled"""
+    pass
+
+
+class FrameDecoder:
+    """Decode fixed-layout BLE notification frames with a single struct call.
+
+    The layout (byte positions and scale factors) is compiled once into a
+    precompiled ``struct.Struct``. Gaps between fields become pad bytes, so
+    ``unpack_from`` reads every field straight out of the notification
+    buffer without slicing or copying it.
+    """
+
+    def __init__(self, byte_positions: Dict[str, Union[int, Iterable[int]]],
+                 scale_factors: Dict[str, float] = None,
+                 signed: Iterable[str] = ()):
+        scale_factors = scale_factors or {}
+        signed = set(signed)
+
+        spans = []
+        for name, position in byte_positions.items():
+            if isinstance(position, int):
+                start, end = position, position
+            else:
+                start, end = position
+            width = end - start + 1
+            if width not in _WIDTH_FORMATS:
+                raise FrameLayoutError(f"Unsupported width {width} for field '{name}'")
+            code = _WIDTH_FORMATS[width]
+            spans.append((start, end, name, code.lower() if name in signed else code))
+        spans.sort()
+
+        fmt = '<'
+        cursor = 0
+        for start, end, name, code in spans:
+            if start < cursor:
+                raise FrameLayoutError(f"Field '{name}' overlaps the previous field")
+            if start > cursor:
+                fmt += f'{start - cursor}x'
+            fmt += code
+            cursor = end + 1
+
+        self.fields: Tuple[str, ...] = tuple(name for _, _, name, _ in spans)
+        # Fields without a scale factor (e.g. heart_rate) stay as raw ints
+        self.scales: Tuple[Optional[float], ...] = tuple(
+            float(scale_factors[name]) if name in scale_factors else None
+            for name in self.fields
+        )
+        # Largest raw value each field can carry, e.g. 65535 for a uint16 counter
+        self.maxima: Tuple[int, ...] = tuple(
+            (1 << (8 * struct.calcsize(code) - (code.islower()))) - 1 for _, _, _, code in spans
+        )
+        self.struct = struct.Struct(fmt)
+        self.min_length = self.struct.size
+        # Bound once so the hot path is a single C call
+        self.unpack = self.struct.unpack_from
+        self.scale = self._compile_scale()
+
+    @classmethod
+    def from_layout(cls, layout: dict) -> 'FrameDecoder':
+        """Build a decoder from a ``frame_layouts`` entry in the device YAML"""
+        try:
+            return cls(layout['byte_positions'],
+                       layout.get('scale_factors'),
+                       layout.get('signed', ()))
+        except (KeyError, TypeError) as e:
+            raise FrameLayoutError(f"Invalid frame layout: {e}")
+
+    def index(self, name: str) -> int:
+        """Position of a field in the tuple returned by ``unpack``"""
+        return self.fields.index(name)
+
+    def max_value(self, name: str) -> int:
+        """Largest raw value the field's width can hold"""
+        return self.maxima[self.index(name)]
+
+    def _compile_scale(self) -> Callable[[Tuple[int, ...]], Dict[str, float]]:
+        """Build the raw-tuple-to-dict function once, with the divisors precomputed.
+
+        Every field is divided in one ``map`` call; fields without a scale
+        factor (e.g. heart_rate) are then put back as their raw ints.
+        """
+        fields = self.fields
+        divisors = tuple(1 if factor is None else factor for factor in self.scales)
+        unscaled = tuple((name, i) for i, (name, factor) in enumerate(zip(fields, self.scales))
+                         if factor is None)
+        if not unscaled:
+            return lambda raw: dict(zip(fields, map(truediv, raw, divisors)))
+
+        def scale(raw):
+            result = dict(zip(fields, map(truediv, raw, divisors)))
+            for name, i in unscaled:
+                result[name] = raw[i]
+            return result
+        return scale
+
+    def decode(self, data: Buffer) -> Dict[str, float]:
+        """Unpack and scale one frame; ``scale`` applies factors to a raw tuple"""
+        return self.scale(self.unpack(data))
+
+    def __repr__(self):
+        return f"FrameDecoder(format={self.struct.format!r}, fields={self.fields})"
@@ -0,0 +1,88 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GattCache:
+    """Characteristic handles resolved earlier in this process, per device address.
+
+    After one full discovery, reconnects pass Bleak's
+    ``dangerous_use_bleak_cache`` (reuse the service collection Bleak
+    built on the previous connection instead of waiting for BlueZ to
+    resolve services again) and subscribe by the remembered handle.
+    Bleak's service cache only lives as long as the process, so the
+    handles are kept in memory too: the first connection after a restart
+    always does a full discovery. A failed subscribe by handle drops the
+    device's entry so the next attempt rediscovers.
+    """
+
+    _shared: Optional['GattCache'] = None
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, dict]] = {}
+
+    @classmethod
+    def shared(cls) -> 'GattCache':
+        """One instance per process, shared by the device managers"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def get(self, address: str, uuid: str) -> Optional[int]:
+        """Cached handle for a characteristic, or None"""
+        entry = self._entries.get(address.lower(), {}).get(uuid.lower())
+        return entry['handle'] if entry else None
+
+    def put(self, address: str, uuid: str, handle: int, service_uuid: Optional[str] = None):
+        self._entries.setdefault(address.lower(), {})[uuid.lower()] = {'handle': handle, 'service': service_uuid}
+
+    def remember(self, client, address: str, uuid: str):
+        """Store the handle a connected client resolved for ``uuid``"""
+        services = getattr(client, 'services', None)
+        if services is None:
+            return
+        characteristic = services.get_characteristic(uuid)
+        if characteristic is not None:
+            self.put(address, uuid, characteristic.handle, characteristic.service_uuid)
+
+    def invalidate(self, address: str):
+        if self._entries.pop(address.lower(), None) is not None:
+            logger.info(f"Invalidated GATT cache for {address}")
+
+
+class FirstFrameTimer:
+    """Measures connect-to-first-notification latency, split by cache use"""
+
+    def __init__(self, name: str, history: int = 20):
+        self.name = name
+        self.history = history
+        self.pending = False
+        self._started = 0.0
+        self._cached = False
+        self.samples: Dict[str, List[float]] = {'cached': [], 'uncached': []}
+
+    def start(self, cached: bool):
+        self._started = time.monotonic()
+        self._cached = cached
+        self.pending = True
+
+    def cancel(self):
+        self.pending = False
+
+    def first_frame(self):
+        """Call from the notification handler while ``pending`` is set"""
+        self.pending = False
+        latency = time.monotonic() - self._started
+        key = 'cached' if self._cached else 'uncached'
+        samples = self.samples[key]
+        samples.append(latency)
+        del samples[:-self.history]
+        logger.info(f"{self.name} connect-to-first-frame {latency * 1000:.0f} ms ({key} GATT handles)")
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            f'{key}_ms': round(sum(values) / len(values) * 1000, 1) if values else None
+            for key, values in self.samples.items()
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE_LATEST = 'coalesce_latest'
+BLOCK = 'block'
+POLICIES = (DROP_OLDEST, COALESCE_LATEST, BLOCK)
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Bounded single-consumer pipeline between BLE callbacks and consumers.
+
+    Replaces one ``asyncio.create_task`` per notification: frames are queued
+    in arrival order and delivered by one consumer task, so a slow consumer
+    can never build an unbounded backlog. When the queue is full:
+
+    - ``drop_oldest``:     discard the oldest pending frame
+    - ``coalesce_latest``: overwrite the newest pending frame
+    - ``block``:           keep the pending frames: ``put`` waits for space
+                           (lossless, for coroutine producers); ``put_nowait``
+                           rejects the new frame, counts it in ``rejected``
+                           and raises ``asyncio.QueueFull``
+
+    BLE notification handlers are synchronous and use ``put_nowait``, so on
+    a device ``block`` means "reject the newest frame" rather than waiting.
+
+    Frames sit in a plain deque (so coalescing can replace the tail) with
+    an event to wake the consumer and one to wake blocked producers.
+    """
+
+    def __init__(self, consumer: Callable[[Any], Optional[Awaitable[None]]],
+                 maxsize: int = 32, policy: str = COALESCE_LATEST, name: str = 'ingest'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.consumer = consumer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self._items: Deque[Tuple[float, Any]] = deque()  # (enqueue time, item)
+        self._ready = asyncio.Event()   # set while frames are pending
+        self._space = asyncio.Event()   # set when a frame is taken off (wakes ``put``)
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters (plain ints, updated without locks on the event loop)
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_lag = 0.0   # seconds between enqueue and delivery start
+        self.max_lag = 0.0
+
+    @classmethod
+    def from_config(cls, consumer, config: Optional[dict], name: str) -> 'IngestQueue':
+        """Build from an ``ingest`` section of a device YAML"""
+        config = config or {}
+        return cls(consumer,
+                   maxsize=int(config.get('maxsize', 32)),
+                   policy=config.get('policy', COALESCE_LATEST),
+                   name=name)
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def put_nowait(self, item: Any) -> None:
+        """Enqueue from a synchronous BLE callback, applying the overflow policy"""
+        entry = (time.monotonic(), item)
+        items = self._items
+        if len(items) >= self.maxsize:
+            if self.policy == DROP_OLDEST:
+                items.popleft()
+                self.dropped += 1
+            elif self.policy == COALESCE_LATEST:
+                items[-1] = entry
+                self.coalesced += 1
+                return
+            else:
+                self.rejected += 1
+                raise asyncio.QueueFull
+        items.append(entry)
+        self._ready.set()
+        self._count_enqueue()
+
+    async def put(self, item: Any) -> None:
+        """Enqueue from a coroutine; waits for space under the ``block`` policy"""
+        if self.policy != BLOCK:
+            self.put_nowait(item)
+            return
+        while len(self._items) >= self.maxsize:
+            self._space.clear()
+            await self._space.wait()
+        self._items.append((time.monotonic(), item))
+        self._ready.set()
+        self._count_enqueue()
+
+    def _count_enqueue(self):
+        self.enqueued += 1
+        depth = len(self._items)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def start(self) -> asyncio.Task:
+        """Start the consumer task (idempotent)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"{self.name}-consumer")
+        return self._task
+
+    async def stop(self):
+        """Cancel the consumer task; pending frames are discarded"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._items.clear()
+        self._space.set()
+
+    async def _run(self):
+        items = self._items
+        while True:
+            if not items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            enqueued_at, item = items.popleft()
+            self._space.set()
+            lag = time.monotonic() - enqueued_at
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            try:
+                result = self.consumer(item)
+                if inspect.isawaitable(result):
+                    await result
+                self.delivered += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"{self.name} consumer error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue counters"""
+        return {
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'lag_ms': round(self.last_lag * 1000, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 3)
+        }
@@ -0,0 +1,274 @@
+import asyncio
+import inspect
+import logging
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# File layout (little-endian):
+#   header:  8-byte magic
+#   records: kind (u8) | channel (u8) | monotonic seconds (f64) | length (u16) | payload
+# A CHANNEL record maps a channel number to a characteristic UUID (ASCII payload)
+# and is written the first time that UUID is seen, so frames carry 1 byte instead of 36.
+MAGIC = b'BLESES\x00\x01'
+RECORD = struct.Struct('<BBdH')
+KIND_CHANNEL = 0
+KIND_FRAME = 1
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLogError(ValueError):
+    """Raised for unreadable or corrupt session logs"""
+    pass
+
+
+class SessionRecorder:
+    """Append-only recorder for raw BLE notification payloads"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._channels: Dict[str, int] = {}
+        self.frames = 0
+
+        if self.path.exists() and self.path.stat().st_size > 0:
+            # Continue an existing log with its channel numbering, cutting off
+            # any record a killed recorder left half-written
+            with SessionLog(self.path) as log:
+                self._channels = {uuid: ch for ch, uuid in log.channels.items()}
+                end = log.end
+            self._file = open(self.path, 'ab')
+            if self._file.tell() > end:
+                self._file.truncate(end)
+        else:
+            self._file = open(self.path, 'ab')
+            self._file.write(MAGIC)
+
+    def record(self, uuid: str, data: bytearray, timestamp: Optional[float] = None):
+        """Append one notification payload; ``timestamp`` defaults to time.monotonic()"""
+        channel = self._channels.get(uuid)
+        if channel is None:
+            channel = self._add_channel(uuid)
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self._file.write(RECORD.pack(KIND_FRAME, channel, timestamp, len(data)))
+        self._file.write(data)
+        self.frames += 1
+
+    def _add_channel(self, uuid: str) -> int:
+        channel = len(self._channels)
+        if channel > 255:
+            raise SessionLogError("Too many characteristics in one session log")
+        encoded = uuid.encode('ascii')
+        self._file.write(RECORD.pack(KIND_CHANNEL, channel, 0.0, len(encoded)))
+        self._file.write(encoded)
+        self._channels[uuid] = channel
+        return channel
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionLog:
+    """Read-only, memory-mapped view of a recorded session"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SessionLogError(f"Empty session log: {self.path}")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise SessionLogError(f"Not a BLE session log: {self.path}")
+        self.channels: Dict[int, str] = {}
+        self.end = len(MAGIC)   # offset just past the last complete record
+        self._scan_channels()
+
+    def _scan_channels(self):
+        for kind, channel, _, payload in self._records():
+            if kind == KIND_CHANNEL:
+                self.channels[channel] = bytes(payload).decode('ascii')
+
+    def _records(self) -> Iterator[Tuple[int, int, float, memoryview]]:
+        view = memoryview(self._map)
+        offset = len(MAGIC)
+        end = len(view)
+        while offset + RECORD.size <= end:
+            kind, channel, timestamp, length = RECORD.unpack_from(view, offset)
+            offset += RECORD.size
+            if offset + length > end:
+                # Truncated tail from a recorder that was killed mid-write
+                logger.warning(f"Ignoring truncated record at offset {offset - RECORD.size}")
+                break
+            yield kind, channel, timestamp, view[offset:offset + length]
+            offset += length
+            self.end = offset
+
+    def __iter__(self) -> Iterator[Tuple[float, str, memoryview]]:
+        """Yield (monotonic timestamp, characteristic UUID, payload) per frame"""
+        channels = self.channels
+        for kind, channel, timestamp, payload in self._records():
+            if kind == KIND_FRAME:
+                yield timestamp, channels[channel], payload
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Payload views are still referenced by the caller; the map is
+            # released when they are garbage collected
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionReplay:
+    """Plays a recorded session back through stand-in Bleak clients.
+
+    ``speed`` is a multiplier on the recorded timing (1.0 = real time,
+    10.0 = ten times faster); ``None`` or ``0`` replays as fast as the
+    consumers allow. Playback starts when the first client subscribes.
+    """
+
+    def __init__(self, path: Union[str, Path], speed: Optional[float] = 1.0, loop: bool = False):
+        self.path = Path(path)
+        self.speed = speed or None
+        self.loop = loop
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.done = asyncio.Event()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+    def client_factory(self) -> Callable[..., 'ReplayClient']:
+        """Callable with BleakClient's constructor signature"""
+        def factory(address, *args, **kwargs):
+            return ReplayClient(self, address)
+        return factory
+
+    def subscribe(self, uuid: str, callback: Callable):
+        self._subscribers.setdefault(uuid.lower(), []).append(callback)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='session-replay')
+
+    def unsubscribe(self, uuid: str, callback: Callable):
+        callbacks = self._subscribers.get(uuid.lower(), [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                await self._play_once()
+                if not self.loop:
+                    break
+        finally:
+            self.done.set()
+
+    async def _play_once(self):
+        with SessionLog(self.path) as log:
+            start_wall = None
+            first = None
+            for timestamp, uuid, payload in log:
+                if self.speed:
+                    if start_wall is None:
+                        start_wall, first = time.monotonic(), timestamp
+                    delay = start_wall + (timestamp - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    # Max speed: still yield so queue consumers get to run
+                    await asyncio.sleep(0)
+
+                callbacks = self._subscribers.get(uuid.lower())
+                if not callbacks:
+                    self.frames_skipped += 1
+                    continue
+                for callback in list(callbacks):
+                    # Bleak hands handlers a fresh bytearray per notification
+                    result = callback(uuid, bytearray(payload))
+                    if inspect.isawaitable(result):
+                        await result
+                self.frames_sent += 1
+
+
+class ReplayClient:
+    """Minimal stand-in for ``bleak.BleakClient`` backed by a SessionReplay"""
+
+    def __init__(self, replay: SessionReplay, address: str):
+        self.replay = replay
+        self.address = address
+        self._connected = False
+        self._callbacks: Dict[str, Callable] = {}
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def connect(self, **kwargs) -> bool:
+        self._connected = True
+        return True
+
+    async def start_notify(self, uuid: str, callback: Callable, **kwargs):
+        self._callbacks[uuid] = callback
+        self.replay.subscribe(uuid, callback)
+
+    async def stop_notify(self, uuid: str):
+        callback = self._callbacks.pop(uuid, None)
+        if callback:
+            self.replay.unsubscribe(uuid, callback)
+
+    async def disconnect(self) -> bool:
+        for uuid in list(self._callbacks):
+            await self.stop_notify(uuid)
+        self._connected = False
+        return True
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 2:
+        print("Usage: python -m ble.session_log <session.bin>", file=sys.stderr)
+        sys.exit(1)
+
+    with SessionLog(sys.argv[1]) as log:
+        counts: Dict[str, int] = {}
+        first = last = None
+        for timestamp, uuid, _ in log:
+            counts[uuid] = counts.get(uuid, 0) + 1
+            first = timestamp if first is None else first
+            last = timestamp
+        print(f"Session: {log.path}")
+        print(f"Duration: {(last - first) if first is not None else 0:.1f}s")
+        for uuid, count in counts.items():
+            print(f"  {uuid}: {count} frames")
@@ -0,0 +1,126 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StallWatchdog:
+    """Detects a link that is up but has stopped notifying.
+
+    ``feed()`` is called for every notification and only updates an EWMA of
+    the inter-arrival interval. A single task sleeps until the current
+    deadline (last frame + ``missed_intervals`` learned intervals, clamped
+    to ``min_timeout``..``max_timeout``) and fires ``on_stall`` if no frame
+    moved it in the meantime. Until ``warmup`` intervals have been seen the
+    deadline is ``max_timeout``.
+    """
+
+    def __init__(self, name: str, on_stall: Callable[[], Optional[Awaitable[None]]],
+                 missed_intervals: float = 3.0, min_timeout: float = 0.5,
+                 max_timeout: float = 5.0, alpha: float = 0.1, warmup: int = 5,
+                 history: int = 20):
+        self.name = name
+        self.on_stall = on_stall
+        self.missed_intervals = missed_intervals
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.warmup = warmup
+        self.history = history
+
+        self.interval: Optional[float] = None  # learned cadence, seconds
+        self.intervals_seen = 0
+        self.last_frame: Optional[float] = None
+        self.stalls = 0
+        self.detect_times: List[float] = []
+        self._armed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, name: str, on_stall, config: Optional[dict]) -> 'StallWatchdog':
+        """Build from a ``watchdog`` section of a device YAML"""
+        config = config or {}
+        return cls(name, on_stall,
+                   missed_intervals=float(config.get('missed_intervals', 3.0)),
+                   min_timeout=float(config.get('min_timeout', 0.5)),
+                   max_timeout=float(config.get('max_timeout', 5.0)))
+
+    @property
+    def timeout(self) -> float:
+        if self.interval is None or self.intervals_seen < self.warmup:
+            return self.max_timeout
+        return min(max(self.interval * self.missed_intervals, self.min_timeout), self.max_timeout)
+
+    def feed(self):
+        """Record one notification (hot path)"""
+        now = time.monotonic()
+        last = self.last_frame
+        if last is not None:
+            gap = now - last
+            interval = self.interval
+            self.interval = gap if interval is None else interval + self.alpha * (gap - interval)
+            self.intervals_seen += 1
+        self.last_frame = now
+
+    def arm(self):
+        """Start watching after a successful connect"""
+        self.last_frame = time.monotonic()
+        self._armed.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"{self.name}-watchdog")
+
+    def disarm(self):
+        self._armed.clear()
+
+    async def stop(self):
+        self.disarm()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self._armed.wait()
+            deadline = self.last_frame + self.timeout
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                # Capped so a deadline computed before the cadence was
+                # learned doesn't hide a stall behind max_timeout
+                await asyncio.sleep(min(delay, self.min_timeout))
+                continue
+            if not self._armed.is_set():
+                continue
+
+            # Time past the moment the next frame was due
+            expected = self.last_frame + (self.interval or 0.0)
+            detect = time.monotonic() - expected
+            self.detect_times.append(detect)
+            del self.detect_times[:-self.history]
+            self.stalls += 1
+            self.disarm()
+            logger.warning(f"{self.name} stalled: no notification for "
+                           f"{time.monotonic() - self.last_frame:.2f}s "
+                           f"(cadence {(self.interval or 0) * 1000:.0f} ms)")
+            try:
+                result = self.on_stall()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"{self.name} stall handler error: {str(e)}")
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        times = self.detect_times
+        return {
+            'stalls': self.stalls,
+            'cadence_ms': round(self.interval * 1000, 1) if self.interval else None,
+            'timeout_ms': round(self.timeout * 1000, 1),
+            'last_detect_ms': round(times[-1] * 1000, 1) if times else None,
+            'mean_detect_ms': round(sum(times) / len(times) * 1000, 1) if times else None
+        }
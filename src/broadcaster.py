@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOM_PREFIX = 'metrics:'
+_MISSING = object()
+
+# Size of the JSON Socket.IO encoded for the current broadcast ticker's emit
+_encoded: contextvars.ContextVar = contextvars.ContextVar('broadcast_encoded', default=None)
+
+
+async def _settled(result):
+    """AsyncServer.enter_room/leave_room are plain methods in python-socketio 5.7.x, coroutines later"""
+    if inspect.isawaitable(result):
+        await result
+
+
+class ByteCountingJSON:
+    """``json`` for socketio.AsyncServer that lets broadcast tickers measure what Socket.IO encodes.
+
+    Depending on the python-socketio release a room emit is encoded once
+    per client (5.7.x) or once for the room; every encoding is the same
+    text, so the ticker keeps the size of one instead of dumping the
+    payload a second time. Only tickers running ``Broadcaster._run``
+    measure; every other caller just gets json.dumps.
+    """
+
+    @staticmethod
+    def dumps(*args, **kwargs) -> str:
+        encoded = json.dumps(*args, **kwargs)
+        size = _encoded.get()
+        if size is not None:
+            size[0] = len(encoded)
+        return encoded
+
+    loads = staticmethod(json.loads)
+
+
+class Profile:
+    """One broadcast rate tier, backed by a Socket.IO room"""
+
+    def __init__(self, name: str, rate_hz: float):
+        self.name = name
+        self.room = ROOM_PREFIX + name
+        self.binary_room = self.room + ':bin'
+        self.period = 1.0 / rate_hz
+        self.sent: Dict[str, Any] = {}    # field values the room last received
+        self.last_keyframe = 0.0
+        self.messages_out = 0
+        self.binary_out = 0
+        self.binary_bytes = 0
+        self.json_bytes = 0       # one copy of each JSON message, not per client (needs ByteCountingJSON)
+        self.task: Optional[asyncio.Task] = None
+
+
+class Broadcaster:
+    """Coalescing, rate-limited fan-out of metric samples over Socket.IO.
+
+    ``publish`` only stores the latest sample. Each profile (e.g. 4 Hz wall
+    display, 20 Hz coach tablet) runs its own ticker and sends the fields
+    that changed since that room's previous message, built once and
+    emitted once per room rather than per client. A full snapshot goes out
+    every ``keyframe_interval`` seconds and to each client when it joins,
+    so deltas always have a base to apply to.
+
+    Clients that join with ``binary=True`` sit in a second room per
+    profile and get ``packer(raw)`` instead: fixed-layout frames that are
+    always complete, packed at most once per published sample.
+    """
+
+    def __init__(self, sio, event: str = 'system_update', profiles: Optional[Dict[str, float]] = None,
+                 default_profile: str = 'display', keyframe_interval: float = 5.0,
+                 packer: Optional[Callable[[Dict[str, Any]], bytes]] = None,
+                 tracer: Optional[Callable[[], Optional[Dict[str, Any]]]] = None):
+        self.sio = sio
+        self.event = event
+        profiles = profiles or {'wall': 4.0, 'display': 10.0, 'coach': 20.0}
+        self.profiles = {name: Profile(name, float(rate)) for name, rate in profiles.items()}
+        if default_profile not in self.profiles:
+            raise ValueError(f"Unknown default broadcast profile '{default_profile}'")
+        self.default_profile = default_profile
+        self.keyframe_interval = keyframe_interval
+        self.packer = packer
+        self.tracer = tracer  # called per JSON emit; a returned trace rides along for the browser to ack
+        self.latest: Dict[str, Any] = {}
+        self._raw: Dict[str, Any] = {}
+        self._version = 0
+        self._packed: Optional[bytes] = None
+        self._packed_version = -1
+        self._members: Dict[str, Tuple[str, bool]] = {}  # sid -> (profile name, binary)
+        self.frames_in = 0
+
+    @classmethod
+    def from_config(cls, sio, config: Optional[dict], packer=None, tracer=None) -> 'Broadcaster':
+        """Build from the ``broadcast`` section of configs/server.yaml"""
+        config = config or {}
+        return cls(sio,
+                   profiles=config.get('profiles'),
+                   default_profile=config.get('default_profile', 'display'),
+                   keyframe_interval=float(config.get('keyframe_interval', 5.0)),
+                   packer=packer if config.get('binary', True) else None,
+                   tracer=tracer)
+
+    def publish(self, sample: Dict[str, Any], raw: Optional[Dict[str, Any]] = None):
+        """Store the newest sample; tickers pick it up at their own rate.
+
+        ``sample`` is what JSON clients see; ``raw`` (default ``sample``) is
+        what the packer encodes for binary clients.
+        """
+        self.latest = sample
+        self._raw = sample if raw is None else raw
+        self._version += 1
+        self.frames_in += 1
+
+    def _packed_latest(self) -> bytes:
+        if self._packed_version != self._version:
+            self._packed = self.packer(self._raw)
+            self._packed_version = self._version
+        return self._packed
+
+    def _room(self, name: str, binary: bool) -> str:
+        profile = self.profiles[name]
+        return profile.binary_room if binary else profile.room
+
+    async def join(self, sid: str, profile: Optional[str] = None, binary: bool = False):
+        """Move a client into a profile room and send it a full snapshot.
+
+        A JSON client's snapshot is the room's delta baseline, not the
+        newest sample: the room's next delta is computed against that
+        baseline, so it brings the new client up to date as well.
+        """
+        name = profile if profile in self.profiles else self.default_profile
+        binary = bool(binary) and self.packer is not None
+        previous = self._members.get(sid)
+        if previous and previous != (name, binary):
+            await _settled(self.sio.leave_room(sid, self._room(*previous)))
+        room_active = (name, binary) in self._members.values()
+        self._members[sid] = (name, binary)
+        await _settled(self.sio.enter_room(sid, self._room(name, binary)))
+        if self.latest:
+            if binary:
+                await self.sio.emit(self.event, self._packed_latest(), room=sid)
+            else:
+                room = self.profiles[name]
+                if not room_active or not room.sent:
+                    # Nobody else is on this baseline: restart it from the newest sample
+                    room.sent = dict(self.latest)
+                await self.sio.emit(self.event, {**room.sent, 'keyframe': True}, room=sid)
+        return name
+
+    def leave(self, sid: str):
+        self._members.pop(sid, None)
+
+    @property
+    def clients(self) -> int:
+        return len(self._members)
+
+    def start(self):
+        for profile in self.profiles.values():
+            if profile.task is None or profile.task.done():
+                profile.task = asyncio.create_task(self._run(profile), name=f"broadcast-{profile.name}")
+
+    async def stop(self):
+        tasks = [p.task for p in self.profiles.values() if p.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for profile in self.profiles.values():
+            profile.task = None
+
+    def _payload(self, profile: Profile, now: float) -> Optional[Dict[str, Any]]:
+        """Changed fields since the room's last message, or a full keyframe"""
+        latest = self.latest
+        if now - profile.last_keyframe >= self.keyframe_interval:
+            profile.last_keyframe = now
+            profile.sent = dict(latest)
+            return {**latest, 'keyframe': True}
+
+        sent = profile.sent
+        changed = {k: v for k, v in latest.items() if sent.get(k, _MISSING) != v}
+        if not changed:
+            return None
+        sent.update(changed)
+        if 'type' in latest:
+            changed['type'] = latest['type']
+        return changed
+
+    async def _run(self, profile: Profile):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        seen_version = 0
+        encoded = [0]
+        _encoded.set(encoded)  # this task's context only
+        while True:
+            next_tick += profile.period
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now + profile.period
+            await asyncio.sleep(next_tick - now)
+
+            if self._version == seen_version or not self.latest:
+                continue
+            members = self._members.values()
+            json_clients = (profile.name, False) in members
+            binary_clients = (profile.name, True) in members
+            if not (json_clients or binary_clients):
+                continue
+            seen_version = self._version
+            try:
+                if json_clients:
+                    payload = self._payload(profile, time.monotonic())
+                    if payload is not None:
+                        trace = self.tracer() if self.tracer else None
+                        if trace is not None:
+                            payload['trace'] = trace
+                        encoded[0] = 0
+                        await self.sio.emit(self.event, payload, room=profile.room)
+                        profile.messages_out += 1
+                        profile.json_bytes += encoded[0]
+                if binary_clients:
+                    frame = self._packed_latest()
+                    await self.sio.emit(self.event, frame, room=profile.binary_room)
+                    profile.binary_out += 1
+                    profile.binary_bytes += len(frame)
+            except Exception as e:
+                logger.error(f"Broadcast for profile {profile.name} failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        clients: Dict[str, int] = {}
+        binary_clients: Dict[str, int] = {}
+        for name, binary in self._members.values():
+            counts = binary_clients if binary else clients
+            counts[name] = counts.get(name, 0) + 1
+        return {
+            'frames_in': self.frames_in,
+            'messages_out': sum(p.messages_out + p.binary_out for p in self.profiles.values()),
+            'profiles': {
+                name: {
+                    'rate_hz': round(1.0 / p.period, 2),
+                    'clients': clients.get(name, 0),
+                    'binary_clients': binary_clients.get(name, 0),
+                    'messages_out': p.messages_out,
+                    'binary_out': p.binary_out,
+                    'binary_bytes': p.binary_bytes,
+                    'json_bytes': p.json_bytes
+                }
+                for name, p in self.profiles.items()
+            }
+        }
@@ -37,3 +37,12 @@ def load_treadmill_config():
         }
     except KeyError as e:
         raise ValueError(f"Missing required key in treadmill config: {e}")
+
+def load_server_config():
+    """Loads server pipeline settings from server.yaml (empty if absent)"""
+    config_path = Path(__file__).parent.parent.parent / "configs" / "server.yaml"
+    if not config_path.exists():
+        return {}
+
+    with open(config_path) as f:
+        return yaml.safe_load(f) or {}
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+from bisect import bisect_right
+from math import atan2, cos, degrees, radians, sin, sqrt
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from course_lod import CoursePyramid
+from grade_profile import GradeProfiles
+from utils.course_cache import CourseBuildCache, CourseBuildError
+from utils.course_store import CompiledCourse, CourseFormatError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COURSE_DIR = Path(__file__).parent.parent / 'static' / 'data' / 'courses'
+EARTH_RADIUS_M = 6371008.8
+
+
+class CourseError(ValueError):
+    """Course file missing or in an unknown format"""
+    pass
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = radians(lat1), radians(lat2)
+    dp, dl = p2 - p1, radians(lon2 - lon1)
+    a = sin(dp / 2) ** 2 + cos(p1) * cos(p2) * sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * atan2(sqrt(a), sqrt(1 - a))
+
+
+def bearing_deg(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Initial compass bearing from point 1 to point 2"""
+    p1, p2 = radians(lat1), radians(lat2)
+    dl = radians(lon2 - lon1)
+    x = sin(dl) * cos(p2)
+    y = cos(p1) * sin(p2) - sin(p1) * cos(p2) * cos(dl)
+    return (degrees(atan2(x, y)) + 360.0) % 360.0
+
+
+class CourseIndex:
+    """Distance-indexed lookups over one course.
+
+    Built once from converter output: the GeoJSON written by
+    gpx_to_geojson.py (LineString plus ``grade_profile`` and
+    ``ghost_runs``), the treadmill profile written by gpx_parser.py
+    (``profile`` rows with km/lat/lon/ele/grade) or its memory-mapped
+    .course file, whose columns are used in place. All lookups bisect
+    parallel arrays, so they cost O(log n) whatever the course length.
+    """
+
+    def __init__(self, name: str, km: Sequence[float], lat: Sequence[float], lon: Sequence[float],
+                 ele: Optional[Sequence[float]] = None,
+                 grade_km: Optional[Sequence[float]] = None, grade: Optional[Sequence[float]] = None,
+                 grade_ele: Optional[Sequence[float]] = None,
+                 ghost: Optional[List[Dict[str, Any]]] = None,
+                 ghost_time: Optional[Sequence[float]] = None):
+        if len(km) < 2 or not (len(km) == len(lat) == len(lon)):
+            raise CourseError(f"Course {name} needs at least two points")
+        self.name = name
+        self.km = km
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.total_km = float(km[-1])
+        self.pyramid: Optional[CoursePyramid] = None  # set by CourseLibrary
+        self.grades: Optional[GradeProfiles] = None   # smoothed grades, set by CourseLibrary
+
+        # Grade is a step function starting at each grade_km
+        self.grade_km = grade_km if grade_km is not None else []
+        self.grade = grade if grade is not None else []
+        self.grade_ele = grade_ele if grade_ele is not None else []
+
+        # Ghost: segment end distances and cumulative times for both directions
+        self.ghost_end_m: List[float] = []
+        self.ghost_start_m: List[float] = []
+        self.ghost_pace: List[Optional[float]] = []
+        self.ghost_end_s: List[float] = []
+        elapsed = 0.0
+        for seg in ghost or []:
+            start, end, pace = seg['start_m'], seg['end_m'], seg.get('pace_min_km')
+            if end <= start:
+                continue
+            elapsed += (end - start) / 1000 * (pace or 0.0) * 60
+            self.ghost_start_m.append(start)
+            self.ghost_end_m.append(end)
+            self.ghost_pace.append(pace)
+            self.ghost_end_s.append(elapsed)
+        if ghost_time is not None:
+            self._ghost_from_times(np.asarray(km, dtype=float) * 1000, np.asarray(ghost_time, dtype=float))
+
+    def _ghost_from_times(self, metres: np.ndarray, times: np.ndarray):
+        """Ghost segments from the recorded timestamp of every point"""
+        recorded = ~np.isnan(times)
+        metres, times = metres[recorded], times[recorded]
+        if len(times) < 2:
+            return
+        dt, dm = np.diff(times), np.diff(metres)
+        moved = dm > 0
+        self.ghost_start_m = metres[:-1][moved].tolist()
+        self.ghost_end_m = metres[1:][moved].tolist()
+        self.ghost_pace = np.round(dt[moved] / 60 / (dm[moved] / 1000), 1).tolist()
+        self.ghost_end_s = np.cumsum(dt)[moved].tolist()
+
+    @classmethod
+    def from_data(cls, name: str, data: Dict[str, Any]) -> 'CourseIndex':
+        if 'profile' in data:
+            return cls._from_profile(name, data['profile'])
+        if data.get('type') == 'FeatureCollection' and data.get('features'):
+            return cls._from_geojson(name, data['features'][0])
+        if data.get('type') == 'Feature':
+            return cls._from_geojson(name, data)
+        raise CourseError(f"Unrecognised course format in {name}")
+
+    @classmethod
+    def from_compiled(cls, course: CompiledCourse) -> 'CourseIndex':
+        """Index over a memory-mapped .course without copying its columns"""
+        return cls(course.path.name, course.km, course.lat, course.lon,
+                   ele=course.ele if course.has('ele') else None,
+                   grade_km=course.km, grade=course.grade,
+                   ghost_time=course.time if course.has('time') else None)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> 'CourseIndex':
+        path = Path(path)
+        if path.suffix == '.course':
+            try:
+                return cls.from_compiled(CompiledCourse(path))
+            except FileNotFoundError:
+                raise CourseError(f"Course {path.name} not found")
+            except CourseFormatError as e:
+                raise CourseError(str(e))
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise CourseError(f"Course {path.name} not found")
+        except ValueError as e:
+            raise CourseError(f"Course {path.name} is not valid JSON: {str(e)}")
+        return cls.from_data(path.name, data)
+
+    @classmethod
+    def _from_profile(cls, name: str, rows: List[Dict[str, Any]]) -> 'CourseIndex':
+        km = [row['km'] for row in rows]
+        return cls(name, km,
+                   [row['lat'] for row in rows],
+                   [row['lon'] for row in rows],
+                   ele=[row['ele'] for row in rows],
+                   grade_km=km,
+                   grade=[row['grade'] for row in rows])
+
+    @classmethod
+    def _from_geojson(cls, name: str, feature: Dict[str, Any]) -> 'CourseIndex':
+        coords = feature['geometry']['coordinates']
+        props = feature.get('properties') or {}
+        lon = [c[0] for c in coords]
+        lat = [c[1] for c in coords]
+        ele = [c[2] for c in coords] if coords and len(coords[0]) > 2 else None
+
+        km = [0.0]
+        total = 0.0
+        for i in range(1, len(coords)):
+            total += haversine_m(lat[i - 1], lon[i - 1], lat[i], lon[i])
+            km.append(total / 1000)
+        # Match the converter's distance so grade_profile and ghost distances line up
+        stated = props.get('distance_km')
+        if stated and total > 0:
+            scale = stated / km[-1]
+            km = [k * scale for k in km]
+
+        profile = props.get('grade_profile') or []
+        ghost = (props.get('ghost_runs') or {}).get('default', {}).get('segments')
+        return cls(name, km, lat, lon, ele=ele,
+                   grade_km=[p['start_km'] for p in profile],
+                   grade=[p['grade'] for p in profile],
+                   grade_ele=[p['ele'] for p in profile],
+                   ghost=ghost)
+
+    def _locate(self, km: float) -> Tuple[int, float]:
+        """Segment index and fraction along it for a distance"""
+        km = min(max(km, 0.0), self.total_km)
+        i = min(bisect_right(self.km, km) - 1, len(self.km) - 2)
+        span = self.km[i + 1] - self.km[i]
+        return i, (km - self.km[i]) / span if span > 0 else 0.0
+
+    def grade_at(self, km: float) -> float:
+        if self.grades:
+            return round(self.grades.grade_at(km), 2)
+        if not len(self.grade):
+            return 0.0
+        i = max(bisect_right(self.grade_km, km) - 1, 0)
+        return round(float(self.grade[i]), 2)
+
+    def at(self, km: float) -> Dict[str, Any]:
+        """Position, elevation, grade and heading ``km`` into the course"""
+        i, f = self._locate(km)
+        lat0, lat1, lon0, lon1 = self.lat[i], self.lat[i + 1], self.lon[i], self.lon[i + 1]
+        position = {
+            'km': min(max(km, 0.0), self.total_km),
+            'lat': float(lat0 + (lat1 - lat0) * f),
+            'lon': float(lon0 + (lon1 - lon0) * f),
+            'grade': self.grade_at(km),
+            'heading': round(bearing_deg(lat0, lon0, lat1, lon1), 1)
+        }
+        if self.ele is not None:
+            position['ele'] = float(self.ele[i] + (self.ele[i + 1] - self.ele[i]) * f)
+        elif len(self.grade_ele):
+            position['ele'] = float(self.grade_ele[max(bisect_right(self.grade_km, km) - 1, 0)])
+        return position
+
+    def ghost_pace_at(self, distance_m: float) -> Optional[float]:
+        """Ghost pace (min/km) for the segment containing ``distance_m``"""
+        i = bisect_right(self.ghost_end_m, distance_m)
+        if i >= len(self.ghost_end_m) or distance_m < self.ghost_start_m[i]:
+            return None
+        return self.ghost_pace[i]
+
+    def ghost_distance_at(self, seconds: float) -> Optional[float]:
+        """Metres the ghost has covered after ``seconds``"""
+        if not self.ghost_end_s:
+            return None
+        i = bisect_right(self.ghost_end_s, seconds)
+        if i >= len(self.ghost_end_s):
+            return self.ghost_end_m[-1]
+        start_s = self.ghost_end_s[i - 1] if i else 0.0
+        span = self.ghost_end_s[i] - start_s
+        f = (seconds - start_s) / span if span > 0 else 0.0
+        return self.ghost_start_m[i] + (self.ghost_end_m[i] - self.ghost_start_m[i]) * max(f, 0.0)
+
+    def query(self, km: Optional[float] = None, ghost_s: Optional[float] = None) -> Dict[str, Any]:
+        """Combined lookup used by the HTTP and Socket.IO endpoints"""
+        result: Dict[str, Any] = {'course': self.name, 'total_km': self.total_km,
+                                  'has_ghost': bool(self.ghost_end_s)}
+        if km is not None:
+            result['position'] = self.at(km)
+            result['ghost_pace'] = self.ghost_pace_at(km * 1000)
+        if ghost_s is not None:
+            ghost_m = self.ghost_distance_at(ghost_s)
+            result['ghost'] = self.at(ghost_m / 1000) if ghost_m is not None else None
+        return result
+
+
+class CourseLibrary:
+    """Lazily built CourseIndex (with LOD pyramid and smoothed grades) per course file, rebuilt when the file changes.
+
+    With a CourseBuildCache, a request for ``name.json``, ``name.course``
+    or ``name.geojson`` next to a ``name.gpx`` is served from the GPX via
+    the cache, so editing or adding a GPX needs no manual conversion step.
+    """
+
+    def __init__(self, root: Union[str, Path] = DEFAULT_COURSE_DIR,
+                 builds: Optional[CourseBuildCache] = None,
+                 grade_smoothing: Optional[dict] = None):
+        self.root = Path(root).resolve()
+        self.builds = builds
+        self.grade_smoothing = grade_smoothing
+        self._indexes: Dict[str, Tuple[Path, int, CourseIndex]] = {}
+
+    @classmethod
+    def from_config(cls, root: Union[str, Path], config: Optional[dict]) -> 'CourseLibrary':
+        """Build from the ``courses`` section of configs/server.yaml"""
+        config = config or {}
+        builds = CourseBuildCache.from_config(config) if config.get('build_cache', True) else None
+        return cls(root, builds, config.get('grade_smoothing'))
+
+    def _path(self, name: str) -> Path:
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            raise CourseError(f"Course {name} not found")
+        return path
+
+    def _source(self, path: Path) -> Optional[Path]:
+        """GPX that ``path`` is compiled from, if the build cache makes it"""
+        if self.builds is None or not self.builds.handles(path.suffix):
+            return None
+        source = path.with_suffix('.gpx')
+        return source if source.is_file() else None
+
+    def _artifact(self, source: Path, suffix: str) -> Path:
+        try:
+            return self.builds.artifact(source, suffix)
+        except CourseBuildError as e:
+            raise CourseError(str(e))
+
+    @staticmethod
+    def _mtime(path: Path) -> int:
+        try:
+            return path.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise CourseError(f"Course {path.name} not found")
+
+    def _build(self, path: Path) -> CourseIndex:
+        index = CourseIndex.from_file(path)
+        index.pyramid = CoursePyramid(index)
+        # Smooth the route's own elevations if it has them, else the grade profile rows
+        if index.ele is not None:
+            index.grades = GradeProfiles.from_config(index.km, index.ele, self.grade_smoothing)
+        else:
+            index.grades = GradeProfiles.from_config(index.grade_km, index.grade_ele, self.grade_smoothing)
+        return index
+
+    def _cached(self, name: str, path: Path, mtime: int) -> Optional[CourseIndex]:
+        cached = self._indexes.get(name)
+        if cached is not None and cached[0] == path and cached[1] == mtime:
+            return cached[2]
+        return None
+
+    def _store(self, name: str, path: Path, mtime: int, index: CourseIndex) -> CourseIndex:
+        levels = ', '.join(str(level['route_points']) for level in index.pyramid.stats()['levels'])
+        logger.info(f"Indexed course {name}: {index.total_km:.2f} km, route points per level {levels}")
+        self._indexes[name] = (path, mtime, index)
+        return index
+
+    def get(self, name: str) -> CourseIndex:
+        path = self._path(name)
+        source = self._source(path)
+        if source is not None:
+            path = self.builds.lookup(source, path.suffix) or self._artifact(source, path.suffix)
+        mtime = self._mtime(path)
+        return self._cached(name, path, mtime) or self._store(name, path, mtime, self._build(path))
+
+    async def get_async(self, name: str) -> CourseIndex:
+        """``get`` that converts and parses new or changed courses in a worker thread"""
+        loop = asyncio.get_running_loop()
+        path = self._path(name)
+        source = self._source(path)
+        if source is not None:
+            path = (self.builds.lookup(source, path.suffix) or
+                    await loop.run_in_executor(None, self._artifact, source, path.suffix))
+        mtime = self._mtime(path)
+        index = self._cached(name, path, mtime)
+        if index is None:
+            index = self._store(name, path, mtime, await loop.run_in_executor(None, self._build, path))
+        return index
@@ -0,0 +1,186 @@
+from math import cos, inf, radians
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Route tolerances (metres) of the pyramid levels, finest first; level 0 keeps every fix
+LEVEL_TOLERANCES_M = (0.0, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+# Elevation profile tolerance (metres of height) per metre of route tolerance
+PROFILE_RATIO = 1 / 20
+# Web-mercator metres per pixel at zoom 0 on the equator
+METRES_PER_PIXEL_Z0 = 156543.03
+MAX_ZOOM = 22   # web map zoom range is 0..MAX_ZOOM
+DEFAULT_MAX_POINTS = 1000
+
+
+def dp_importance(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Douglas-Peucker tolerance at which each point stops being kept.
+
+    One top-down pass records every split point's distance, capped by its
+    parent's, so ``importance > t`` selects exactly the points that
+    Douglas-Peucker with tolerance ``t`` keeps. Every level of the pyramid
+    is then a threshold instead of another simplification run.
+    """
+    n = len(x)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = inf
+    stack = [(0, n - 1, inf)]
+    while stack:
+        a, b, cap = stack.pop()
+        if b - a < 2:
+            continue
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[a + 1:b] - x[a], y[a + 1:b] - y[a]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            distances = np.abs(dx * py - dy * px) / length
+        else:
+            distances = np.hypot(px, py)
+        k = int(np.argmax(distances))
+        i = a + 1 + k
+        value = min(float(distances[k]), cap)
+        importance[i] = value
+        stack.append((a, i, value))
+        stack.append((i, b, value))
+    return importance
+
+
+class CoursePyramid:
+    """Route and elevation profile simplified at every level of LEVEL_TOLERANCES_M.
+
+    Built once from a CourseIndex. ``window`` returns one distance slice of
+    one level, with the endpoints interpolated exactly, so a display only
+    receives the points its zoom and viewport can show. Each level keeps
+    its own km array, so a window is two ``searchsorted`` calls per level.
+    """
+
+    def __init__(self, index, tolerances: Sequence[float] = LEVEL_TOLERANCES_M):
+        self.index = index
+        self.tolerances = tuple(tolerances)
+        lat = np.asarray(index.lat)
+        lon = np.asarray(index.lon)
+        self.mean_lat = float(lat.mean())
+
+        # Local equirectangular metres are plenty for a city-sized course
+        x = np.radians(lon - lon[0]) * cos(radians(self.mean_lat)) * 6371008.8
+        y = np.radians(lat - lat[0]) * 6371008.8
+        route_importance = dp_importance(x, y)
+        route_km = np.asarray(index.km, dtype=float)
+        self.route_levels = [self._level(route_importance, t) for t in self.tolerances]
+        self.route_level_km = [route_km[level] for level in self.route_levels]
+
+        # Profile: the route's own elevations if it has them, else the grade profile rows
+        if index.ele is not None:
+            profile_km, profile_ele = index.km, index.ele
+        else:
+            profile_km, profile_ele = index.grade_km, index.grade_ele
+        # Plain floats: the columns may be float32 views of a memory-mapped .course
+        self.profile_km = np.asarray(profile_km, dtype=float).tolist()
+        self.profile_ele = np.asarray(profile_ele, dtype=float).tolist()
+        if len(self.profile_km) >= 2:
+            profile_importance = dp_importance(np.asarray(self.profile_km) * 1000,
+                                               np.asarray(self.profile_ele, dtype=float))
+            self.profile_levels = [self._level(profile_importance, t * PROFILE_RATIO)
+                                   for t in self.tolerances]
+        else:
+            self.profile_levels = [np.arange(len(self.profile_km))] * len(self.tolerances)
+        profile_km = np.asarray(self.profile_km)
+        self.profile_level_km = [profile_km[level] for level in self.profile_levels]
+
+    @staticmethod
+    def _level(importance: np.ndarray, tolerance: float) -> np.ndarray:
+        if tolerance <= 0:
+            return np.arange(len(importance))
+        return np.flatnonzero(importance > tolerance)
+
+    def level_for_zoom(self, zoom: float) -> int:
+        """Coarsest level whose tolerance stays under half a map pixel"""
+        zoom = min(max(zoom, 0.0), MAX_ZOOM)
+        half_pixel = METRES_PER_PIXEL_Z0 * cos(radians(self.mean_lat)) / 2 ** zoom / 2
+        level = 0
+        for i, tolerance in enumerate(self.tolerances):
+            if tolerance <= half_pixel:
+                level = i
+        return level
+
+    @staticmethod
+    def _bounds(level_km: np.ndarray, from_km: float, to_km: float) -> Tuple[int, int]:
+        """Range of a level's points that fall strictly inside the window"""
+        return (int(np.searchsorted(level_km, from_km, side='right')),
+                int(np.searchsorted(level_km, to_km, side='left')))
+
+    def _slice(self, level_km: np.ndarray, indices: np.ndarray, from_km: float, to_km: float) -> List[int]:
+        """Indices of a level that fall strictly inside the window"""
+        start, end = self._bounds(level_km, from_km, to_km)
+        return indices[start:end].tolist()
+
+    def _fit(self, level_kms: List[np.ndarray], from_km: float, to_km: float,
+             max_points: int, finest: int = 0) -> int:
+        """Finest level from ``finest`` on that fits ``max_points`` in the window"""
+        for level in range(finest, len(level_kms)):
+            start, end = self._bounds(level_kms[level], from_km, to_km)
+            if max(end - start, 0) + 2 <= max_points:
+                return level
+        return len(level_kms) - 1
+
+    def level_for_points(self, from_km: float, to_km: float, max_points: int) -> int:
+        """Finest level that fits ``max_points`` route points in the window"""
+        return self._fit(self.route_level_km, from_km, to_km, max_points)
+
+    def window(self, from_km: Optional[float] = None, to_km: Optional[float] = None,
+               zoom: Optional[float] = None,
+               max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        index = self.index
+        from_km = 0.0 if from_km is None else min(max(from_km, 0.0), index.total_km)
+        to_km = index.total_km if to_km is None else min(max(to_km, from_km), index.total_km)
+        if zoom is not None:
+            level = self.level_for_zoom(zoom)
+        else:
+            level = self.level_for_points(from_km, to_km, max_points)
+
+        start, end = index.at(from_km), index.at(to_km)
+        km_out = [from_km]
+        coordinates = [[round(start['lon'], 6), round(start['lat'], 6)]]
+        for i in self._slice(self.route_level_km[level], self.route_levels[level], from_km, to_km):
+            km_out.append(round(float(index.km[i]), 4))
+            coordinates.append([float(index.lon[i]), float(index.lat[i])])
+        km_out.append(to_km)
+        coordinates.append([round(end['lon'], 6), round(end['lat'], 6)])
+
+        profile = []
+        if self.profile_km:
+            # Noisy elevations can need a coarser level than the route to fit the chart
+            profile_level = self._fit(self.profile_level_km, from_km, to_km, max_points, finest=level)
+            inside = self._slice(self.profile_level_km[profile_level], self.profile_levels[profile_level],
+                                 from_km, to_km)
+            points = [(from_km, start.get('ele'))]
+            points += [(self.profile_km[i], self.profile_ele[i]) for i in inside]
+            points.append((to_km, end.get('ele')))
+            profile = [
+                {'km': round(k, 4),
+                 'ele': round(e, 1) if e is not None else None,
+                 'grade': index.grade_at(k)}
+                for k, e in points
+            ]
+
+        return {
+            'course': index.name,
+            'total_km': index.total_km,
+            'from_km': from_km,
+            'to_km': to_km,
+            'level': level,
+            'tolerance_m': self.tolerances[level],
+            'km': km_out,
+            'coordinates': coordinates,
+            'profile': profile
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'levels': [
+                {'tolerance_m': t, 'route_points': len(r), 'profile_points': len(p)}
+                for t, r, p in zip(self.tolerances, self.route_levels, self.profile_levels)
+            ]
+        }
@@ -0,0 +1,188 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+StateCallback = Callable[[str, bool, Optional[str]], Optional[Awaitable[None]]]
+
+
+def reconnect_options(reconnect: Optional[dict], address: str) -> Dict[str, Any]:
+    """``DeviceSupervisor.add()`` keywords from a device's ``reconnect`` YAML section"""
+    reconnect = reconnect or {}
+    return {
+        'min_backoff': float(reconnect.get('min_backoff', 1.0)),
+        'max_backoff': float(reconnect.get('max_backoff', 10.0)),
+        'address': address if reconnect.get('advertisement', False) else None
+    }
+
+
+class DeviceState:
+    """Connection bookkeeping for one supervised device"""
+
+    def __init__(self, name: str, device: Any, min_backoff: float, max_backoff: float,
+                 address: Optional[str] = None):
+        self.name = name
+        self.device = device
+        self.address = address
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.backoff = 0.0
+        self.attempts = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.advert_wakeups = 0
+        self.last_reason: Optional[str] = None  # why the link last went down
+        self.wake = asyncio.Event()
+        self.down_since: Optional[float] = None  # time.monotonic() when the link was lost
+        self.reconnect_times: List[float] = []
+        self.reconnect_seconds = 0.0  # total time spent down before reconnects, for /metrics
+        self.task: Optional[asyncio.Task] = None
+
+    def stats(self) -> Dict[str, Any]:
+        times = self.reconnect_times
+        return {
+            'connected': self.connected,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'advert_wakeups': self.advert_wakeups,
+            'last_down_reason': self.last_reason,
+            'backoff_s': round(self.backoff, 2),
+            'down_for_s': round(time.monotonic() - self.down_since, 2) if self.down_since else 0.0,
+            'last_reconnect_s': round(times[-1], 3) if times else None,
+            'mean_reconnect_s': round(sum(times) / len(times), 3) if times else None,
+            'max_reconnect_s': round(max(times), 3) if times else None
+        }
+
+
+class DeviceSupervisor:
+    """Runs one independent reconnect loop per BLE device.
+
+    Each device keeps its own exponential backoff, so a missing HRM never
+    delays the treadmill (or vice versa). Devices need an async ``connect()``
+    performing a single attempt and an ``is_connected`` property.
+
+    With an ``AdvertisementWatcher``, devices added with an ``address`` are
+    only dialled once they advertise again, instead of blocking in a full
+    connect timeout while powered off. ``max_backoff`` bounds the wait in
+    case advertisements are missed.
+
+    Devices exposing a ``link_lost`` attribute get a hook to call with a
+    reason (e.g. from a stall watchdog) so the loop reacts immediately
+    instead of at the next poll.
+    """
+
+    def __init__(self, on_state_change: Optional[StateCallback] = None,
+                 poll_interval: float = 0.25, history: int = 50, watcher=None):
+        self.on_state_change = on_state_change
+        self.poll_interval = poll_interval
+        self.history = history
+        self.watcher = watcher
+        self.devices: Dict[str, DeviceState] = {}
+
+    def add(self, name: str, device: Any, min_backoff: float = 1.0, max_backoff: float = 10.0,
+            address: Optional[str] = None):
+        self.devices[name] = DeviceState(name, device, min_backoff, max_backoff, address)
+        if hasattr(device, 'link_lost'):
+            device.link_lost = lambda reason, name=name: self.link_lost(name, reason)
+        if address and self.watcher:
+            self.watcher.watch(address)
+
+    def link_lost(self, name: str, reason: str):
+        """Wake a device's loop right away after its link went down"""
+        state = self.devices[name]
+        if state.connected and state.last_reason is None:
+            # First report wins: a stall is followed by our own disconnect
+            state.last_reason = reason
+        state.wake.set()
+
+    def _watching(self, state: DeviceState) -> bool:
+        return bool(state.address and self.watcher and self.watcher.running)
+
+    def is_connected(self, name: str) -> bool:
+        state = self.devices.get(name)
+        return bool(state and state.connected)
+
+    async def start(self):
+        if self.watcher:
+            await self.watcher.start()
+        now = time.monotonic()
+        for state in self.devices.values():
+            if state.task is None or state.task.done():
+                state.down_since = now
+                state.task = asyncio.create_task(self._supervise(state), name=f"supervise-{state.name}")
+
+    async def stop(self):
+        tasks = [s.task for s in self.devices.values() if s.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for state in self.devices.values():
+            state.task = None
+        if self.watcher:
+            await self.watcher.stop()
+
+    async def _supervise(self, state: DeviceState):
+        while True:
+            if state.device.is_connected:
+                state.wake.clear()
+                try:
+                    await asyncio.wait_for(state.wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if state.connected:
+                # Link dropped since the last poll
+                state.last_reason = state.last_reason or 'lost'
+                logger.warning(f"{state.name} link {state.last_reason}")
+                state.connected = False
+                state.down_since = time.monotonic()
+                await self._notify(state)
+
+            watching = self._watching(state)
+            if watching and await self.watcher.wait_for(state.address, state.max_backoff):
+                state.advert_wakeups += 1
+
+            state.attempts += 1
+            try:
+                await state.device.connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state.failures += 1
+                state.backoff = min(max(state.backoff * 2, state.min_backoff), state.max_backoff)
+                # When watching, the next advertisement paces the retry instead
+                delay = state.min_backoff if watching else state.backoff
+                logger.info(f"{state.name} connect failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            elapsed = time.monotonic() - state.down_since
+            state.reconnect_times.append(elapsed)
+            del state.reconnect_times[:-self.history]
+            state.reconnects += 1
+            state.reconnect_seconds += elapsed
+            state.backoff = 0.0
+            state.down_since = None
+            state.connected = True
+            state.last_reason = None
+            logger.info(f"{state.name} connected after {elapsed:.2f}s")
+            await self._notify(state)
+
+    async def _notify(self, state: DeviceState):
+        if not self.on_state_change:
+            return
+        try:
+            result = self.on_state_change(state.name, state.connected, state.last_reason)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"State change callback error: {str(e)}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: state.stats() for name, state in self.devices.items()}
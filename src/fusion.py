@@ -0,0 +1,165 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+SampleCallback = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class SourceBuffer:
+    """Last two samples of one source on the monotonic timeline"""
+    __slots__ = ('t0', 'v0', 't1', 'v1', 'count')
+
+    def __init__(self):
+        self.t0 = self.t1 = None
+        self.v0 = self.v1 = None
+        self.count = 0
+
+    def push(self, t: float, values: Dict[str, Any]):
+        self.t0, self.v0 = self.t1, self.v1
+        self.t1, self.v1 = t, values
+        self.count += 1
+
+    def value(self, field: str, t: float, interpolate: bool):
+        """Field value at time ``t``: interpolated inside the last interval, held outside it"""
+        v1 = self.v1
+        if field not in v1:
+            return None
+        if not interpolate or self.v0 is None or t >= self.t1 or field not in self.v0:
+            return v1[field]
+        a, b = self.v0[field], v1[field]
+        if t <= self.t0 or self.t1 == self.t0 or not isinstance(a, (int, float)):
+            return a
+        value = a + (b - a) * (t - self.t0) / (self.t1 - self.t0)
+        return round(value) if isinstance(a, int) and isinstance(b, int) else value
+
+
+class StreamFusion:
+    """Merges device streams into one fixed-rate sample stream.
+
+    Sources ``push`` whenever they have data; a ticker emits one fused
+    sample per output period. Each sample is evaluated ``delay`` seconds in
+    the past so numeric fields can be interpolated between the bracketing
+    samples of each source (last-known values are held otherwise). When
+    several sources provide the same field, the first fresh source in
+    ``priority`` wins. ``ages`` reports how old each source's newest
+    sample is.
+    """
+
+    def __init__(self, on_sample: SampleCallback, rate_hz: float = 10.0,
+                 interpolate: bool = True, delay: Optional[float] = None,
+                 max_age: float = 5.0, priority: Iterable[str] = ()):
+        self.on_sample = on_sample
+        self.period = 1.0 / rate_hz
+        self.interpolate = interpolate
+        self.delay = self.period if delay is None else delay
+        self.max_age = max_age
+        self.priority = list(priority)
+        self.sources: Dict[str, SourceBuffer] = {}
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self.samples_in = 0
+        self.samples_out = 0
+
+    @classmethod
+    def from_config(cls, on_sample: SampleCallback, config: Optional[dict]) -> 'StreamFusion':
+        """Build from the ``fusion`` section of configs/server.yaml"""
+        config = config or {}
+        return cls(on_sample,
+                   rate_hz=float(config.get('rate_hz', 10.0)),
+                   interpolate=bool(config.get('interpolate', True)),
+                   delay=config.get('delay'),
+                   max_age=float(config.get('max_age', 5.0)),
+                   priority=config.get('priority', ('hrm', 'treadmill')))
+
+    def push(self, source: str, values: Dict[str, Any], t: Optional[float] = None):
+        """Add a sample; ``t`` is its time.monotonic() receive time"""
+        buffer = self.sources.get(source)
+        if buffer is None:
+            buffer = self.sources[source] = SourceBuffer()
+            if source not in self.priority:
+                self.priority.append(source)
+        buffer.push(time.monotonic() if t is None else t, values)
+        self.samples_in += 1
+        self._dirty = True
+
+    def sample(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Fused sample for the current output tick"""
+        now = time.monotonic() if now is None else now
+        t = now - self.delay
+        fused: Dict[str, Any] = {}
+        stale: Dict[str, Any] = {}
+        ages = {}
+        for source in self.priority:
+            buffer = self.sources.get(source)
+            if buffer is None or buffer.v1 is None:
+                continue
+            age = now - buffer.t1
+            ages[source] = round(age, 3)
+            target = fused if age <= self.max_age else stale
+            for field in buffer.v1:
+                if field not in target:
+                    target[field] = buffer.value(field, t, self.interpolate)
+        for field, value in stale.items():
+            fused.setdefault(field, value)
+
+        fused['ages'] = ages
+        fused['timestamp'] = time.time() - (now - t)  # epoch seconds of the evaluated instant
+        return fused
+
+    def _pending(self, now: float) -> bool:
+        """New data since the last tick, or still interpolating towards it"""
+        if self._dirty:
+            return True
+        t = now - self.delay
+        return self.interpolate and any(
+            b.t1 is not None and t < b.t1 for b in self.sources.values()
+        )
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='fusion')
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            # Absolute schedule: a slow consumer skips ticks instead of drifting
+            next_tick += self.period
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now + self.period
+            await asyncio.sleep(next_tick - now)
+
+            now = time.monotonic()
+            if not self.sources or not self._pending(now):
+                continue
+            self._dirty = False
+            try:
+                result = self.on_sample(self.sample(now))
+                if inspect.isawaitable(result):
+                    await result
+                self.samples_out += 1
+            except Exception as e:
+                logger.error(f"Fusion consumer error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'samples_in': self.samples_in,
+            'samples_out': self.samples_out,
+            'rate_hz': round(1.0 / self.period, 2),
+            'sources': {name: b.count for name, b in self.sources.items()}
+        }
@@ -0,0 +1,169 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Grid steps (metres) profiles are precomputed at, finest first
+RESOLUTIONS_M = (10.0, 25.0, 50.0, 100.0)
+DEFAULT_STEP_M = 25.0
+FILTERS = ('savgol', 'median', 'moving_average', 'none')
+DEFAULT_FILTER = 'savgol'
+DEFAULT_WINDOW_M = 150.0   # filter span along the course
+DEFAULT_ORDER = 2          # Savitzky-Golay polynomial order
+
+
+def resample(km: np.ndarray, ele: np.ndarray, step_m: float) -> np.ndarray:
+    """Elevation interpolated at every ``step_m`` from the start (the last step may overrun the end)"""
+    metres = km * 1000
+    samples = int(np.ceil(metres[-1] / step_m)) + 1
+    return np.interp(np.arange(samples) * step_m, metres, ele)
+
+
+def _padded(values: np.ndarray, window: int) -> np.ndarray:
+    # Repeat the end values so the ends are filtered like the middle instead of sagging
+    return np.pad(values, window // 2, mode='edge')
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    return np.convolve(_padded(values, window), np.full(window, 1.0 / window), mode='valid')
+
+
+def median(values: np.ndarray, window: int) -> np.ndarray:
+    return np.median(np.lib.stride_tricks.sliding_window_view(_padded(values, window), window), axis=1)
+
+
+def savgol_coefficients(window: int, order: int) -> np.ndarray:
+    """Savitzky-Golay smoothing weights: the least-squares polynomial's value at the window centre"""
+    offsets = np.arange(window) - window // 2
+    return np.linalg.pinv(np.vander(offsets, order + 1, increasing=True))[0]
+
+
+def savgol(values: np.ndarray, window: int, order: int = DEFAULT_ORDER) -> np.ndarray:
+    # Symmetric weights, so convolution and correlation agree
+    return np.convolve(_padded(values, window), savgol_coefficients(window, order), mode='valid')
+
+
+def smooth(values: np.ndarray, method: str, window: int, order: int = DEFAULT_ORDER) -> np.ndarray:
+    """``values`` filtered over ``window`` samples (made odd, and no longer than ``values``)"""
+    window = min(window, len(values))
+    window -= 1 - window % 2
+    minimum = order + 2 if method == 'savgol' else 3
+    if method == 'none' or window < minimum:
+        return values
+    if method == 'savgol':
+        return savgol(values, window, order)
+    if method == 'median':
+        return median(values, window)
+    return moving_average(values, window)
+
+
+class GradeProfile:
+    """Smoothed elevation and grade on one uniform distance grid.
+
+    ``grade[i]`` is the grade from ``i * step_m`` to the next grid point.
+    """
+
+    def __init__(self, step_m: float, ele: np.ndarray):
+        self.step_m = step_m
+        self.ele = ele
+        self.grade = np.diff(ele) / step_m * 100 if len(ele) > 1 else np.zeros(1)
+
+    def grade_at(self, km: float) -> float:
+        i = min(max(int(km * 1000 // self.step_m), 0), len(self.grade) - 1)
+        return float(self.grade[i])
+
+    def window(self, from_km: float, to_km: float) -> Dict[str, Any]:
+        start = max(int(from_km * 1000 // self.step_m), 0)
+        end = min(int(np.ceil(to_km * 1000 / self.step_m)), len(self.grade) - 1)
+        return {
+            'step_m': self.step_m,
+            'start_km': round(start * self.step_m / 1000, 4),
+            'ele': np.round(self.ele[start:end + 1], 1).tolist(),
+            'grade': np.round(self.grade[start:end + 1], 1).tolist()
+        }
+
+
+class GradeProfiles:
+    """A course's elevation resampled onto uniform grids and smoothed, at every resolution.
+
+    Built once per course (CourseLibrary) so the incline controller and the
+    chart read the same grades. The filter window is in metres, so each
+    resolution smooths the same stretch of road.
+    """
+
+    def __init__(self, km: Sequence[float], ele: Sequence[float],
+                 resolutions: Sequence[float] = RESOLUTIONS_M, default_step_m: float = DEFAULT_STEP_M,
+                 method: str = DEFAULT_FILTER, window_m: float = DEFAULT_WINDOW_M,
+                 order: int = DEFAULT_ORDER):
+        if method not in FILTERS:
+            raise ValueError(f"Unknown grade filter {method}, expected one of {', '.join(FILTERS)}")
+        self.method = method
+        self.window_m = window_m
+        self.order = order
+        self.total_km = 0.0
+        self.default_step_m: Optional[float] = None
+        self.profiles: Dict[float, GradeProfile] = {}
+
+        km = np.asarray(km, dtype=float)
+        ele = np.asarray(ele, dtype=float)
+        known = ~np.isnan(ele)
+        km, ele = km[known], ele[known]
+        if len(km) < 2 or km[-1] <= 0:
+            return
+        self.total_km = float(km[-1])
+        for step_m in sorted(float(s) for s in resolutions):
+            window = int(round(window_m / step_m)) + 1
+            self.profiles[step_m] = GradeProfile(step_m, smooth(resample(km, ele, step_m), method,
+                                                                window, order))
+        self.default_step_m = self.nearest(default_step_m) if self.profiles else None
+
+    @classmethod
+    def from_config(cls, km: Sequence[float], ele: Sequence[float],
+                    config: Optional[dict]) -> 'GradeProfiles':
+        """Build from the ``courses.grade_smoothing`` section of configs/server.yaml"""
+        config = config or {}
+        return cls(km, ele,
+                   resolutions=config.get('resolutions_m') or RESOLUTIONS_M,
+                   default_step_m=float(config.get('default_step_m', DEFAULT_STEP_M)),
+                   method=config.get('filter', DEFAULT_FILTER),
+                   window_m=float(config.get('window_m', DEFAULT_WINDOW_M)),
+                   order=int(config.get('order', DEFAULT_ORDER)))
+
+    def __bool__(self) -> bool:
+        return bool(self.profiles)
+
+    @property
+    def resolutions(self) -> List[float]:
+        return list(self.profiles)
+
+    def nearest(self, step_m: Optional[float]) -> float:
+        """Precomputed step closest to ``step_m`` (the default step for None)"""
+        if step_m is None:
+            return self.default_step_m
+        return min(self.profiles, key=lambda s: abs(s - step_m))
+
+    def grade_at(self, km: float, step_m: Optional[float] = None) -> float:
+        return self.profiles[self.nearest(step_m)].grade_at(km)
+
+    def window(self, from_km: Optional[float] = None, to_km: Optional[float] = None,
+               step_m: Optional[float] = None) -> Dict[str, Any]:
+        """Grid slice covering ``from_km``..``to_km`` at the resolution nearest ``step_m``"""
+        from_km = 0.0 if from_km is None else min(max(from_km, 0.0), self.total_km)
+        to_km = self.total_km if to_km is None else min(max(to_km, from_km), self.total_km)
+        return {
+            'filter': self.method,
+            'window_m': self.window_m,
+            'resolutions_m': self.resolutions,
+            **self.profiles[self.nearest(step_m)].window(from_km, to_km)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'filter': self.method,
+            'window_m': self.window_m,
+            'default_step_m': self.default_step_m,
+            'levels': [
+                {'step_m': step, 'points': len(p.ele),
+                 'max_grade': round(float(np.abs(p.grade).max()), 1)}
+                for step, p in self.profiles.items()
+            ]
+        }
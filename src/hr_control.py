@@ -0,0 +1,241 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SpeedInclineCommand = Callable[[float, float], Optional[Awaitable[None]]]
+
+# Heart rate zones as fractions of max heart rate
+ZONES = {1: (0.50, 0.60), 2: (0.60, 0.70), 3: (0.70, 0.80), 4: (0.80, 0.90), 5: (0.90, 1.00)}
+
+
+def hr_zone(bpm: int, max_hr: int) -> int:
+    """Zone 1-5 of ``bpm`` (0 below zone 1)"""
+    fraction = bpm / max_hr
+    for zone, (low, _) in sorted(ZONES.items(), reverse=True):
+        if fraction >= low:
+            return zone
+    return 0
+
+
+class HRZoneController:
+    """Holds the runner's heart rate in a zone by steering belt speed and incline.
+
+    A PI loop on the error between the zone's middle and the latest heart
+    rate gives an effort in km/h. Speed takes it up to ``speed_ceiling``,
+    the rest goes to incline at ``incline_per_kmh``. Both are rate limited
+    per second and clamped to the treadmill's max_speed/max_incline.
+
+    The controller lets go as soon as the belt is below ``min_speed`` (the
+    runner stopped it) or no treadmill reading is newer than
+    ``max_belt_age`` seconds (stale or disconnected), so it never restarts
+    a belt it has lost sight of.
+
+    Steps run on a fixed ``loop.call_at`` grid every ``period`` seconds,
+    whatever the notification timing. Decision latency is the time from a
+    step's scheduled instant to its decision (and command) being made. The
+    age of the heart rate it acted on is recorded too.
+    """
+
+    def __init__(self, command: SpeedInclineCommand, max_speed: float = 25.0, max_incline: float = 15.0,
+                 max_hr: int = 185, period: float = 2.0, kp: float = 0.03, ki: float = 0.002,
+                 min_speed: float = 3.0, speed_ceiling: Optional[float] = None,
+                 incline_per_kmh: float = 2.0, speed_rate: float = 0.1, incline_rate: float = 0.5,
+                 max_hr_age: float = 5.0, max_belt_age: float = 3.0):
+        self.command = command
+        self.max_speed = max_speed
+        self.max_incline = max_incline
+        self.max_hr = max_hr
+        self.period = period
+        self.kp = kp
+        self.ki = ki
+        self.min_speed = min_speed
+        self.speed_ceiling = min(speed_ceiling or max_speed, max_speed)
+        self.incline_per_kmh = incline_per_kmh
+        self.speed_rate = speed_rate        # km/h per second
+        self.incline_rate = incline_rate    # % per second
+        self.max_hr_age = max_hr_age
+        self.max_belt_age = max_belt_age
+
+        self.zone: Optional[int] = None
+        self.heart_rate: Optional[int] = None
+        self.hr_time: Optional[float] = None  # time.monotonic() of the latest reading
+        self.speed = 0.0                      # latest belt state
+        self.incline = 0.0
+        self.belt_time: Optional[float] = None  # time.monotonic() of the treadmill reading behind speed
+        self.target_speed: Optional[float] = None    # last commanded
+        self.target_incline: Optional[float] = None
+        self._speed = self._incline = 0.0            # rate-limited setpoints
+        self.integral = 0.0
+        self._base = 0.0                      # effort (km/h) at engage
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._next_step = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        self.steps = 0
+        self.held = 0                         # steps skipped for a stale heart rate
+        self.commands = 0
+        self.latencies: Deque[float] = deque(maxlen=600)
+        self.hr_ages: Deque[float] = deque(maxlen=600)
+
+    @classmethod
+    def from_config(cls, command: SpeedInclineCommand, config: Optional[dict],
+                    device: dict) -> 'HRZoneController':
+        """Build from the ``hr_control`` section of configs/server.yaml; clamps from the treadmill config"""
+        config = config or {}
+        ceiling = config.get('speed_ceiling')
+        return cls(command,
+                   max_speed=device['max_speed'],
+                   max_incline=device['max_incline'],
+                   max_hr=int(config.get('max_hr', 185)),
+                   period=float(config.get('period', 2.0)),
+                   kp=float(config.get('kp', 0.03)),
+                   ki=float(config.get('ki', 0.002)),
+                   min_speed=float(config.get('min_speed', 3.0)),
+                   speed_ceiling=float(ceiling) if ceiling is not None else None,
+                   incline_per_kmh=float(config.get('incline_per_kmh', 2.0)),
+                   speed_rate=float(config.get('speed_rate', 0.1)),
+                   incline_rate=float(config.get('incline_rate', 0.5)),
+                   max_hr_age=float(config.get('max_hr_age', 5.0)),
+                   max_belt_age=float(config.get('max_belt_age', 3.0)))
+
+    @property
+    def engaged(self) -> bool:
+        return self.zone is not None
+
+    def target_hr(self) -> float:
+        low, high = ZONES[self.zone]
+        return (low + high) / 2 * self.max_hr
+
+    def push_heart_rate(self, bpm: int, t: Optional[float] = None):
+        self.heart_rate = bpm
+        self.hr_time = time.monotonic() if t is None else t
+
+    def observe(self, sample: Dict[str, Any]):
+        """Belt speed and incline from a fused sample"""
+        if 'speed' in sample:
+            # Fusion holds the last-known speed; date it by the treadmill's own age
+            self.belt_time = time.monotonic() - sample.get('ages', {}).get('treadmill', 0.0)
+        self.speed = float(sample.get('speed', self.speed))
+        self.incline = float(sample.get('incline', self.incline))
+
+    def belt_problem(self, now: Optional[float] = None) -> Optional[str]:
+        """Why the belt can't be steered right now, or None"""
+        now = time.monotonic() if now is None else now
+        if self.belt_time is None or now - self.belt_time > self.max_belt_age:
+            return 'no recent treadmill data'
+        if self.speed < self.min_speed:
+            return f"belt below {self.min_speed} km/h"
+        return None
+
+    def _effort(self, speed: float, incline: float) -> float:
+        return speed + max(incline, 0.0) / self.incline_per_kmh
+
+    def _split(self, effort: float) -> Tuple[float, float]:
+        """Effort (km/h) as speed up to the ceiling, the rest as incline"""
+        speed = min(max(effort, self.min_speed), self.speed_ceiling)
+        incline = (effort - speed) * self.incline_per_kmh
+        return speed, min(max(incline, 0.0), self.max_incline)
+
+    def engage(self, zone: int):
+        """Start holding ``zone``, from the belt's current speed and incline"""
+        if zone not in ZONES:
+            raise ValueError(f"Unknown heart rate zone {zone}, expected 1-5")
+        problem = self.belt_problem()
+        if problem:
+            # Never start a stopped belt
+            raise ValueError(f"Can't engage heart rate control: {problem}")
+        self.zone = zone
+        self.integral = 0.0
+        self._base = self._effort(self.speed, self.incline)
+        self.target_speed, self.target_incline = self.speed, self.incline
+        self._speed, self._incline = self.speed, self.incline
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            self._next_step = loop.time() + self.period
+            self._handle = loop.call_at(self._next_step, self._step)
+        low, high = ZONES[zone]
+        logger.info(f"Heart rate control: zone {zone} ({low * self.max_hr:.0f}-{high * self.max_hr:.0f} bpm)")
+
+    def disengage(self, reason: str = 'manual'):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self.zone is not None:
+            logger.info(f"Heart rate control off ({reason})")
+        self.zone = None
+
+    def _step(self):
+        problem = self.belt_problem()
+        if problem:
+            self._handle = None
+            self.disengage(problem)
+            return
+        loop = asyncio.get_running_loop()
+        scheduled = self._next_step
+        # Fixed grid: a late step doesn't push the following ones back
+        self._next_step += self.period
+        if self._next_step < loop.time():
+            self._next_step = loop.time() + self.period
+        self._handle = loop.call_at(self._next_step, self._step)
+        self.steps += 1
+
+        now = time.monotonic()
+        if self.heart_rate is None or now - self.hr_time > self.max_hr_age:
+            self.held += 1
+            return
+        self.hr_ages.append(now - self.hr_time)
+
+        error = self.target_hr() - self.heart_rate
+        integral = self.integral + self.ki * error * self.period
+        effort = self._base + self.kp * error + integral
+        speed, incline = self._split(effort)
+        # Anti-windup: don't integrate further into a clamp
+        overshoot = effort - self._effort(speed, incline)
+        if abs(overshoot) < 1e-9 or (overshoot > 0) != (error > 0):
+            self.integral = integral
+
+        # Rate limits, applied to the unrounded setpoints so small steps still add up
+        step_speed, step_incline = self.speed_rate * self.period, self.incline_rate * self.period
+        self._speed = min(max(speed, self._speed - step_speed), self._speed + step_speed)
+        self._incline = min(max(incline, self._incline - step_incline), self._incline + step_incline)
+        speed, incline = round(self._speed, 1), round(self._incline, 1)
+        if speed != self.target_speed or incline != self.target_incline:
+            self.target_speed, self.target_incline = speed, incline
+            self.commands += 1
+            try:
+                result = self.command(speed, incline)
+                if inspect.isawaitable(result):
+                    self._task = asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"Heart rate control command failed: {str(e)}")
+        self.latencies.append(loop.time() - scheduled)
+
+    @staticmethod
+    def _percentiles(values: Deque[float]) -> Optional[Dict[str, float]]:
+        if not values:
+            return None
+        p50, p95, p99 = (round(float(v), 3) for v in np.percentile(values, (50, 95, 99)) * 1000)
+        return {'p50': p50, 'p95': p95, 'p99': p99, 'max': round(max(values) * 1000, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'engaged': self.engaged,
+            'zone': self.zone,
+            'target_hr': round(self.target_hr()) if self.zone else None,
+            'heart_rate': self.heart_rate,
+            'hr_zone': hr_zone(self.heart_rate, self.max_hr) if self.heart_rate else None,
+            'target_speed': self.target_speed,
+            'target_incline': self.target_incline,
+            'steps': self.steps,
+            'held': self.held,
+            'commands': self.commands,
+            'decision_latency_ms': self._percentiles(self.latencies),
+            'hr_age_ms': self._percentiles(self.hr_ages)
+        }
@@ -1,96 +1,184 @@
-import asyncio
-import logging
-from bleak import BleakClient
-from pathlib import Path
-import yaml
-from typing import Optional, Callable
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-class HRMManager:
-    def __init__(self, config_path: str = "configs/garmin_hrm.yaml"):
-        self.config_path = Path(__file__).parent.parent / config_path
-        self.config = self._load_config()
-        self.client: Optional[BleakClient] = None
-        self._callback: Optional[Callable[[int], None]] = None
-        self._is_connected = False
-        logging.basicConfig(level=logging.DEBUG)  # Enable debug logging
-
-    def _load_config(self):
-        """Load config with validation"""
-        with open(self.config_path) as f:
-            config = yaml.safe_load(f)
-        
-        try:
-            return {
-                'mac_address': config['devices']['hrm_pro']['address'].lower(),
-                'service_uuid': config['devices']['hrm_pro']['service_uuids'][0],
-                'heart_rate_uuid': config['devices']['hrm_pro']['characteristics']['heart_rate']['uuid'],
-                'scan_timeout': config['devices']['hrm_pro']['connection_params']['scan_timeout']
-            }
-        except KeyError as e:
-            raise ValueError(f"Missing required config key: {e}")
-
-    @retry(stop=stop_after_attempt(3),
-           wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def connect_with_retry(self):
-        """Enhanced connection with debug logging"""
-        try:
-            logging.debug(f"Attempting HRM connection to {self.config['mac_address']}")
-            logging.debug(f"Using service UUID: {self.config['service_uuid']}")
-            logging.debug(f"Timeout: {self.config['scan_timeout']}s")
-
-            self.client = BleakClient(
-                self.config['mac_address'],
-                timeout=self.config['scan_timeout'],
-                services=[self.config['service_uuid']]
-            )
-            
-            if await self.client.connect():
-                logging.debug("BLE connection established")
-                await self.client.start_notify(
-                    self.config['heart_rate_uuid'],
-                    self._handle_data
-                )
-                self._is_connected = True
-                logging.info(f"HRM connected successfully to {self.config['mac_address']}")
-            else:
-                raise ConnectionError("BleakClient.connect() returned False")
-                
-        except Exception as e:
-            self._is_connected = False
-            logging.error(f"HRM connection failed: {str(e)}")
-            raise
-
-    def _handle_data(self, sender, data: bytearray):
-        """Process HRM data with validation"""
-        if not self._callback:
-            return
-            
-        try:
-            flags = data[0]
-            if flags & 0x01:  # 16-bit HR
-                bpm = int.from_bytes(data[1:3], 'little')
-            else:  # 8-bit HR
-                bpm = data[1]
-            
-            if 40 <= bpm <= 240:  # Valid HR range
-                self._callback(bpm)
-            else:
-                logging.warning(f"Invalid HR reading: {bpm} BPM")
-                
-        except Exception as e:
-            logging.error(f"HRM data error: {str(e)}")
-
-    async def disconnect(self):
-        """Guaranteed clean disconnect"""
-        if self.client and self.is_connected:
-            await self.client.disconnect()
-        self._is_connected = False
-
-    @property
-    def hr_callback(self):
-        return self._callback
-        
-    @hr_callback.setter
-    def hr_callback(self, func: Callable[[int], None]):
+import asyncio
+import logging
+import time
+from bleak import BleakClient
+from pathlib import Path
+import yaml
+from typing import Optional, Callable, Awaitable, Tuple
+from tenacity import retry, stop_after_attempt, wait_exponential
+from ble.ingest import IngestQueue
+from ble.session_log import SessionRecorder
+from ble.gatt_cache import GattCache, FirstFrameTimer
+from ble.watchdog import StallWatchdog
+
+class HRMManager:
+    def __init__(self, config_path: str = "configs/garmin_hrm.yaml"):
+        self.config_path = Path(__file__).parent.parent / config_path
+        self.config = self._load_config()
+        self.client: Optional[BleakClient] = None
+        self.client_factory: Callable[..., BleakClient] = BleakClient  # swapped for replay
+        self.recorder: Optional[SessionRecorder] = None
+        self.gatt_cache: Optional[GattCache] = GattCache.shared()
+        self.first_frame = FirstFrameTimer('HRM')
+        self.watchdog = StallWatchdog.from_config('HRM', self._on_stall, self.config['watchdog'])
+        self.link_lost: Optional[Callable[[str], None]] = None  # set by DeviceSupervisor
+        self._callback: Optional[Callable[[int, float], Optional[Awaitable[None]]]] = None
+        self._is_connected = False
+        self.frames_received = 0  # notifications, including out-of-range readings
+        self.decode_errors = 0
+        self.ingest = IngestQueue.from_config(self._deliver, self.config['ingest'], name='hrm')
+        logging.basicConfig(level=logging.DEBUG)  # Enable debug logging
+
+    def _load_config(self):
+        """Load config with validation"""
+        with open(self.config_path) as f:
+            config = yaml.safe_load(f)
+        
+        try:
+            return {
+                'mac_address': config['devices']['hrm_pro']['address'].lower(),
+                'service_uuid': config['devices']['hrm_pro']['service_uuids'][0],
+                'heart_rate_uuid': config['devices']['hrm_pro']['characteristics']['heart_rate']['uuid'],
+                'scan_timeout': config['devices']['hrm_pro']['connection_params']['scan_timeout'],
+                'ingest': config['devices']['hrm_pro'].get('ingest', {}),
+                'reconnect': config['devices']['hrm_pro'].get('reconnect', {}),
+                'watchdog': config['devices']['hrm_pro'].get('watchdog', {})
+            }
+        except KeyError as e:
+            raise ValueError(f"Missing required config key: {e}")
+
+    @property
+    def is_connected(self) -> bool:
+        """True while the HRM link is up and notifying"""
+        return self._is_connected
+
+    async def connect(self):
+        """Single connection attempt with debug logging"""
+        address = self.config['mac_address']
+        hr_uuid = self.config['heart_rate_uuid']
+        handle = self.gatt_cache.get(address, hr_uuid) if self.gatt_cache else None
+        try:
+            logging.debug(f"Attempting HRM connection to {address}")
+            logging.debug(f"Using service UUID: {self.config['service_uuid']}")
+            logging.debug(f"Timeout: {self.config['scan_timeout']}s")
+            logging.debug(f"Cached GATT handle: {handle}")
+
+            self.first_frame.start(cached=handle is not None)
+            self.client = self.client_factory(
+                address,
+                timeout=self.config['scan_timeout'],
+                services=[self.config['service_uuid']],
+                disconnected_callback=self._on_disconnect
+            )
+            
+            connected = (await self.client.connect(dangerous_use_bleak_cache=True)
+                         if handle is not None else await self.client.connect())
+            if connected:
+                logging.debug("BLE connection established")
+                self.ingest.start()
+                try:
+                    await self.client.start_notify(handle if handle is not None else hr_uuid, self._handle_data)
+                except Exception:
+                    if handle is not None:
+                        self.gatt_cache.invalidate(address)
+                    raise
+                if handle is None and self.gatt_cache:
+                    self.gatt_cache.remember(self.client, address, hr_uuid)
+                self._is_connected = True
+                self.watchdog.arm()
+                logging.info(f"HRM connected successfully to {address}")
+            else:
+                raise ConnectionError("BleakClient.connect() returned False")
+                
+        except Exception as e:
+            self._is_connected = False
+            self.first_frame.cancel()
+            logging.error(f"HRM connection failed: {str(e)}")
+            raise
+
+    @retry(stop=stop_after_attempt(3),
+           wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def connect_with_retry(self):
+        """Enhanced connection with debug logging"""
+        await self.connect()
+
+    def _on_disconnect(self, client):
+        """Bleak callback when the link drops"""
+        if client is not self.client:
+            # Late callback from a client replaced by a reconnect (e.g. the one
+            # _on_stall disconnected); the current link is unaffected
+            return
+        if self._is_connected:
+            logging.warning(f"HRM {self.config['mac_address']} disconnected")
+        self._is_connected = False
+        self.watchdog.disarm()
+        if self.link_lost:
+            self.link_lost('disconnected')
+
+    async def _on_stall(self):
+        """Watchdog callback: link is up but notifications stopped"""
+        self._is_connected = False
+        if self.link_lost:
+            self.link_lost('stalled')
+        if self.client:
+            try:
+                await asyncio.wait_for(self.client.disconnect(), timeout=2.0)
+            except Exception as e:
+                logging.error(f"HRM disconnect after stall failed: {str(e)}")
+
+    def _parse_bpm(self, data: bytearray) -> Optional[int]:
+        """Extract BPM from a Heart Rate Measurement, None if out of range"""
+        flags = data[0]
+        if flags & 0x01:  # 16-bit HR
+            bpm = int.from_bytes(data[1:3], 'little')
+        else:  # 8-bit HR
+            bpm = data[1]
+
+        if 40 <= bpm <= 240:  # Valid HR range
+            return bpm
+        self.decode_errors += 1
+        logging.warning(f"Invalid HR reading: {bpm} BPM")
+        return None
+
+    def _handle_data(self, sender, data: bytearray):
+        """Process HRM data with validation"""
+        received = time.monotonic()
+        self.frames_received += 1
+        if self.recorder:
+            self.recorder.record(self.config['heart_rate_uuid'], data)
+        self.watchdog.feed()
+        if self.first_frame.pending:
+            self.first_frame.first_frame()
+        if not self._callback:
+            return
+            
+        try:
+            bpm = self._parse_bpm(data)
+            if bpm is not None:
+                self.ingest.put_nowait((bpm, received))
+        except asyncio.QueueFull:
+            pass  # 'block' policy: rejected and counted by the queue
+        except Exception as e:
+            self.decode_errors += 1
+            logging.error(f"HRM data error: {str(e)}")
+
+    def _deliver(self, reading: Tuple[int, float]):
+        """Ingest consumer: (bpm, time.monotonic() at receipt); callbacks may be plain functions or coroutines"""
+        if self._callback:
+            return self._callback(*reading)
+
+    async def disconnect(self):
+        """Guaranteed clean disconnect"""
+        self.watchdog.disarm()
+        if self.client and self.is_connected:
+            await self.client.disconnect()
+        self._is_connected = False
+
+    @property
+    def hr_callback(self):
+        return self._callback
+        
+    @hr_callback.setter
+    def hr_callback(self, func: Callable[[int, float], Optional[Awaitable[None]]]):
+        """Called with (bpm, time.monotonic() the notification arrived)"""
         self._callback = func
\ No newline at end of file
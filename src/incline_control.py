@@ -0,0 +1,158 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+InclineCommand = Callable[[float], Optional[Awaitable[None]]]
+
+
+class InclineController:
+    """Sets the belt incline to the course grade at the runner's fused distance.
+
+    The belt changes incline at ``slew_rate`` %/s after ``latency`` seconds
+    of command delay, so each update looks down the smoothed grade profile
+    (course_index.CourseIndex.grades) for the farthest point the runner will
+    reach before the belt could get to that point's grade, and commands that
+    grade now. Targets are clamped to ``max_incline``; a new command is only
+    sent when the target moves by ``deadband`` or more.
+
+    Tracking error is the distance between the point a commanded grade
+    starts on the course and where the runner was when the belt reported
+    reaching it: positive when late, negative when early.
+    """
+
+    def __init__(self, command: InclineCommand, max_incline: float = 15.0, slew_rate: float = 0.5,
+                 latency: float = 0.5, deadband: float = 0.5, horizon_m: float = 200.0,
+                 step_m: Optional[float] = None):
+        self.command = command
+        self.max_incline = max_incline
+        self.slew_rate = slew_rate
+        self.latency = latency
+        self.deadband = deadband
+        self.horizon_m = horizon_m
+        self.step_m = step_m
+
+        self.index = None
+        self.start_km = 0.0
+        self.start_distance: Optional[float] = None
+        self.km: Optional[float] = None
+        self.target: Optional[float] = None       # last commanded incline
+        self.target_km: Optional[float] = None    # where on the course that grade starts
+        self._settled = True
+        self._task: Optional[asyncio.Task] = None
+
+        self.commands = 0
+        self.suppressed = 0
+        self.errors_m: List[float] = []  # most recent 100
+
+    @classmethod
+    def from_config(cls, command: InclineCommand, config: Optional[dict],
+                    device: dict) -> 'InclineController':
+        """Build from the ``incline_control`` section of configs/server.yaml and the treadmill's config"""
+        config = config or {}
+        step_m = config.get('step_m')
+        return cls(command,
+                   max_incline=device['max_incline'],
+                   slew_rate=device['incline_slew_rate'],
+                   latency=device['incline_latency'],
+                   deadband=float(config.get('deadband', 0.5)),
+                   horizon_m=float(config.get('horizon_m', 200.0)),
+                   step_m=float(step_m) if step_m is not None else None)
+
+    @property
+    def engaged(self) -> bool:
+        return self.index is not None
+
+    def engage(self, index, km: float = 0.0):
+        """Follow ``index`` from course distance ``km``; the next sample's distance maps to it"""
+        if not index.grades:
+            raise ValueError(f"Course {index.name} has no elevation data")
+        self.index = index
+        self.start_km = km
+        self.start_distance = None
+        self.km = km
+        self.target = self.target_km = None
+        self._settled = True
+        logger.info(f"Auto incline on {index.name} from {km:.3f} km")
+
+    def disengage(self, reason: str = 'manual'):
+        if self.index is not None:
+            logger.info(f"Auto incline off ({reason})")
+        self.index = None
+
+    def lookahead(self, km: float, speed_kmh: float, incline: float) -> Tuple[float, float]:
+        """Target incline to command now, and the course km where it applies"""
+        grades = self.index.grades
+        profile = grades.profiles[grades.nearest(self.step_m)]
+        step = profile.step_m
+        first = min(int(km * 1000 // step), len(profile.grade) - 1)
+        last = min(first + int(self.horizon_m // step) + 1, len(profile.grade))
+        targets = np.clip(profile.grade[first:last], -self.max_incline, self.max_incline)
+
+        # Metres to the start of each grid segment (0 for the one under the runner),
+        # against the metres covered while the belt slews to that segment's grade
+        ahead = np.maximum(np.arange(first, last) * step - km * 1000, 0.0)
+        needed = (self.latency + np.abs(targets - incline) / self.slew_rate) * speed_kmh / 3.6
+        due = np.flatnonzero(ahead <= needed)
+        i = int(due[-1]) if len(due) else 0
+        target_km = (first + i) * step / 1000
+        if self.target_km is not None and target_km < self.target_km:
+            # Already heading for a grade further on; re-targeting nearer points as the belt
+            # moves (and the slew time shrinks) would make it hunt
+            return self.target, self.target_km
+        return round(float(targets[i]), 1), target_km
+
+    def update(self, sample: Dict[str, Any]):
+        """One fused sample: track progress, and command the belt if the target moved"""
+        if self.index is None or 'distance' not in sample:
+            return
+        distance = float(sample['distance'])
+        if self.start_distance is None:
+            self.start_distance = distance
+        self.km = km = self.start_km + (distance - self.start_distance) / 1000
+        incline = float(sample.get('incline', self.target or 0.0))
+
+        if self.target is not None and not self._settled and abs(incline - self.target) < self.deadband / 2:
+            self._settled = True
+            self.errors_m.append((km - self.target_km) * 1000)
+            del self.errors_m[:-100]
+
+        if km >= self.index.total_km:
+            target, target_km = 0.0, self.index.total_km
+        else:
+            target, target_km = self.lookahead(km, float(sample.get('speed', 0.0)), incline)
+
+        if self.target is not None and abs(target - self.target) < self.deadband:
+            self.suppressed += 1
+            return
+        self.target, self.target_km = target, target_km
+        self._settled = abs(incline - target) < self.deadband / 2
+        self.commands += 1
+        try:
+            result = self.command(target)
+            if inspect.isawaitable(result):
+                self._task = asyncio.ensure_future(result)
+        except Exception as e:
+            logger.error(f"Incline command failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        errors = np.abs(self.errors_m) if self.errors_m else None
+        return {
+            'engaged': self.engaged,
+            'course': self.index.name if self.index is not None else None,
+            'km': round(self.km, 3) if self.km is not None else None,
+            'target': self.target,
+            'target_km': round(self.target_km, 3) if self.target_km is not None else None,
+            'commands': self.commands,
+            'suppressed': self.suppressed,
+            'tracking_error_m': {
+                'last': round(self.errors_m[-1], 1),
+                'mean_abs': round(float(errors.mean()), 1),
+                'max_abs': round(float(errors.max()), 1),
+                'count': len(errors)
+            } if errors is not None else None
+        }
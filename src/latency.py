@@ -0,0 +1,174 @@
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+# Stages a treadmill frame passes through, each timed from the one before:
+#   decode   _handle_data receipt -> frame decoded
+#   queue    decoded -> taken off the ingest queue
+#   fusion   dequeued -> first fused sample that includes it
+#   emit     fused -> Socket.IO emit (includes the broadcast ticker's wait)
+#   deliver  emit -> browser receipt (network, clock-offset corrected)
+#   render   browser receipt -> next animation frame after the DOM update
+STAGES = ('decode', 'queue', 'fusion', 'emit', 'deliver', 'render')
+
+# Histogram buckets: 8 per doubling from 10 us, so percentiles are within ~9%
+MIN_LATENCY = 1e-5
+BUCKETS_PER_DOUBLING = 8
+BUCKETS = 192              # up to ~170 s
+
+
+class LatencyHistogram:
+    """Log-bucketed latency counts; ``record`` is O(1) and allocation-free"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        if seconds <= MIN_LATENCY:
+            i = 0
+        else:
+            i = min(int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_DOUBLING), BUCKETS - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket holding the ``q``-th percentile, in seconds"""
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, q / 100 * self.count))
+        return min(MIN_LATENCY * 2 ** ((i + 1) / BUCKETS_PER_DOUBLING), self.max)
+
+    def stats(self) -> Optional[Dict[str, float]]:
+        if not self.count:
+            return None
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+class LatencyTracker:
+    """Per-stage latency of treadmill frames, from BLE receipt to browser render.
+
+    Frames carry time.monotonic() stamps (``received``, ``decoded``,
+    ``dequeued``); ``frame``, ``fused`` and ``emitted`` are called at each
+    stage in turn. Every ``sample_every``-th JSON emit carries a
+    ``trace`` ({id, t}) that the browser acks with its own receive and
+    render times. The browser's clock offset is estimated NTP-style from
+    those acks, keeping the one with the shortest round trip out of the
+    last ``offset_window``.
+    """
+
+    def __init__(self, sample_every: int = 10, offset_window: int = 32, pending: int = 64):
+        self.sample_every = sample_every
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.end_to_end = LatencyHistogram()
+        self._frame: Optional[Tuple[float, float, float]] = None   # newest frame, not yet fused
+        self._published: Optional[Tuple[float, float]] = None      # (received, fused) of the sample on air
+        self._emits = 0
+        self._next_id = 0
+        self._pending: 'OrderedDict[int, Tuple[float, float]]' = OrderedDict()  # id -> (received, emitted)
+        self._max_pending = pending
+        self._offsets: Deque[Tuple[float, float]] = deque(maxlen=offset_window)  # (round trip, offset)
+        self.acks = 0
+        self.stale_acks = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'LatencyTracker':
+        """Build from the ``latency`` section of configs/server.yaml"""
+        config = config or {}
+        return cls(sample_every=int(config.get('sample_every', 10)),
+                   offset_window=int(config.get('offset_window', 32)))
+
+    def frame(self, data: Dict[str, Any]):
+        """A decoded frame reached the ingest consumer"""
+        received, decoded, dequeued = data.get('received'), data.get('decoded'), data.get('dequeued')
+        if received is None or decoded is None or dequeued is None:
+            return
+        self.histograms['decode'].record(decoded - received)
+        self.histograms['queue'].record(dequeued - decoded)
+        self._frame = (received, dequeued, time.monotonic())
+
+    def fused(self):
+        """A fused sample is about to be published; charges the newest frame once"""
+        if self._frame is None:
+            return
+        received, dequeued, _ = self._frame
+        now = time.monotonic()
+        self.histograms['fusion'].record(now - dequeued)
+        self._published = (received, now)
+        self._frame = None
+
+    def emitted(self) -> Optional[Dict[str, Any]]:
+        """A JSON metrics message is going out; returns a trace to attach to every Nth"""
+        if self._published is None:
+            return None
+        received, fused = self._published
+        now = time.monotonic()
+        self.histograms['emit'].record(now - fused)
+        self._emits += 1
+        if self._emits % self.sample_every:
+            return None
+        self._next_id += 1
+        self._pending[self._next_id] = (received, now)
+        while len(self._pending) > self._max_pending:
+            self._pending.popitem(last=False)
+        return {'id': self._next_id, 't': round(now, 6)}
+
+    def ack(self, data: Dict[str, Any]):
+        """Browser ack: {id, t, received, rendered}, the last two in browser milliseconds"""
+        now = time.monotonic()
+        try:
+            pending = self._pending.pop(int(data['id']), None)
+            client_received = float(data['received']) / 1000
+            client_rendered = float(data['rendered']) / 1000
+        except (KeyError, TypeError, ValueError):
+            self.stale_acks += 1
+            return
+        if pending is None:
+            self.stale_acks += 1
+            return
+        received, emitted = pending
+        # NTP: offset of the browser clock, and the round trip minus the browser's own time
+        offset = ((client_received - emitted) + (client_rendered - now)) / 2
+        round_trip = (now - emitted) - (client_rendered - client_received)
+        self._offsets.append((round_trip, offset))
+        offset = min(self._offsets)[1]
+
+        delivered = client_received - offset
+        self.histograms['deliver'].record(max(delivered - emitted, 0.0))
+        self.histograms['render'].record(max(client_rendered - client_received, 0.0))
+        self.end_to_end.record(max(client_rendered - offset - received, 0.0))
+        self.acks += 1
+
+    def reset(self):
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.end_to_end = LatencyHistogram()
+        self.acks = self.stale_acks = 0
+
+    def stats(self) -> Dict[str, Any]:
+        best = min(self._offsets) if self._offsets else None
+        return {
+            'stages': {stage: h.stats() for stage, h in self.histograms.items()},
+            'end_to_end': self.end_to_end.stats(),
+            'clock': {
+                'offset_ms': round(best[1] * 1000, 3),
+                'round_trip_ms': round(best[0] * 1000, 3)
+            } if best else None,
+            'sample_every': self.sample_every,
+            'acks': self.acks,
+            'stale_acks': self.stale_acks
+        }
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOPS = ('asyncio', 'uvloop')
+STACK_DEPTH = 20   # innermost frames kept from a blocked loop's stack
+
+
+def use_event_loop(name: Optional[str]) -> str:
+    """Install the event loop policy for ``name`` before the loop is created; returns the one in use.
+
+    ``uvloop`` is optional: without it the server stays on the default
+    asyncio loop and says so.
+    """
+    name = (name or 'asyncio').lower()
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop '{name}', expected one of {', '.join(EVENT_LOOPS)}")
+    if name == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop is not installed, using the default asyncio event loop")
+            return 'asyncio'
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info(f"Event loop: {name}")
+    return name
+
+
+class LoopLagMonitor:
+    """Event-loop lag: how late a callback scheduled every ``interval`` seconds runs.
+
+    Anything that blocks the loop (a slow handler, synchronous I/O, a GC
+    pause) delays every timer, so the lateness of this one is a direct
+    measure of how long the loop was unavailable.
+
+    A watcher thread checks the same deadline from outside the loop. Once
+    a wakeup is more than ``threshold`` seconds overdue it takes the loop
+    thread's stack (and the task that was running) while the loop is
+    still stuck, and the spike is logged with it when the loop recovers.
+    """
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1, capture_stacks: bool = True,
+                 history: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.capture_stacks = capture_stacks
+        self.lag = 0.0          # seconds, latest measurement
+        self.histogram = LatencyHistogram()
+        self.spikes: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._deadline: Optional[float] = None   # time.monotonic() the next wakeup is due
+        self._captured: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'LoopLagMonitor':
+        """Build from the ``loop_monitor`` section of configs/server.yaml"""
+        config = config or {}
+        return cls(interval=float(config.get('interval', 0.25)),
+                   threshold=float(config.get('threshold', 0.1)),
+                   capture_stacks=bool(config.get('capture_stacks', True)))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='loop-monitor')
+        if self.capture_stacks and self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch,
+                                             args=(asyncio.get_running_loop(), threading.get_ident()),
+                                             name='loop-monitor', daemon=True)
+            self._watcher.start()
+        return self._task
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join(timeout=1.0)
+            self._watcher = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._deadline = None
+            self.lag = max(loop.time() - expected, 0.0)
+            self.histogram.record(self.lag)
+            if self.lag > self.threshold:
+                self._spike()
+
+    def _spike(self):
+        captured, self._captured = self._captured, None
+        spike = {'time': time.time(), 'lag_ms': round(self.lag * 1000, 3)}
+        if captured:
+            spike.update(captured)
+            logger.warning(f"Event loop blocked for {spike['lag_ms']:.0f} ms in task {captured['task']}:\n"
+                           + ''.join(captured['stack']))
+        else:
+            logger.warning(f"Event loop blocked for {spike['lag_ms']:.0f} ms")
+        self.spikes.append(spike)
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int):
+        """Watcher thread: snapshot the loop thread while a wakeup is overdue"""
+        poll = max(min(self.threshold / 2, self.interval), 0.005)
+        captured_for = None
+        while not self._stop.wait(poll):
+            deadline = self._deadline
+            if deadline is None or deadline == captured_for:
+                continue
+            if time.monotonic() - deadline > self.threshold:
+                captured_for = deadline
+                frame = sys._current_frames().get(loop_thread)
+                if frame is None:
+                    continue
+                task = asyncio.current_task(loop)
+                self._captured = {
+                    'task': task.get_name() if task is not None else None,
+                    'stack': traceback.format_stack(frame, limit=STACK_DEPTH)
+                }
+
+    def stats(self) -> Dict[str, Any]:
+        spikes: List[Dict[str, Any]] = [
+            {'time': s['time'], 'lag_ms': s['lag_ms'], 'task': s.get('task'),
+             'where': s['stack'][-1].strip() if s.get('stack') else None}
+            for s in self.spikes
+        ]
+        return {
+            'interval_s': self.interval,
+            'threshold_ms': round(self.threshold * 1000, 3),
+            'lag_ms': round(self.lag * 1000, 3),
+            'histogram': self.histogram.stats(),
+            'spikes': spikes
+        }
@@ -1,126 +1,320 @@
-import asyncio
-import logging
-from datetime import datetime
-from aiohttp import web
-import socketio
-from pathlib import Path
-from typing import Dict
-from treadmill_manager import WoodwayTreadmill
-
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Configuration
-static_path = Path(__file__).parent.parent / 'static'
-
-# Web Application Setup
-app = web.Application()
-sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
-
-# Serve static files
-app.router.add_static('/static', str(static_path))
-
-# Socket.IO client fallback
-async def serve_socketio_js(request):
-    return web.Response(
-        text='<script src="https://cdn.socket.io/4.5.4/socket.io.min.js"></script>',
-        content_type='text/html'
-    )
-app.router.add_get('/socket.io/socket.io.js', serve_socketio_js)
-
-sio.attach(app)
-
-# Device Management
-treadmill = WoodwayTreadmill()
-
-async def handle_treadmill_data(data: Dict) -> None:
-    try:
-        await sio.emit('system_update', {
-            'type': 'metrics',
-            'speed': float(data.get('speed', 0)),
-            'incline': float(data.get('incline', 0)),
-            'distance': float(data.get('distance', 0)),
-            'heart_rate': int(data.get('heart_rate', 0)),
-            'timestamp': datetime.now().isoformat()
-        })
-    except Exception as e:
-        logger.error(f"Data error: {str(e)}")
-
-async def manage_devices():
-    treadmill.callback = handle_treadmill_data
-    while True:
-        try:
-            if not treadmill.is_connected:
-                success = await treadmill.connect_with_retry()
-                if success:
-                    logger.info(f"Emitting connection status - Socket: True, Treadmill: {treadmill.is_connected}")
-                    await sio.emit(
-                        'system_update',
-                        {
-                            'type': 'connection',
-                            'socket_connected': True,
-                            'treadmill_connected': treadmill.is_connected
-                        },
-                        callback=lambda: logger.debug("Status update confirmed by frontend")
-                    )
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Device error: {str(e)}")
-            await sio.emit(
-                'system_update',
-                {
-                    'type': 'connection', 
-                    'socket_connected': True,
-                    'treadmill_connected': False
-                },
-                callback=lambda: logger.debug("Error status update confirmed")
-            )
-            await asyncio.sleep(5)  # Longer delay after errors
-# WebSocket Events
-@sio.event
-async def connect(sid, environ):
-    await sio.emit('system_update', {
-        'type': 'connection',
-        'socket_connected': True,
-        'treadmill_connected': treadmill.is_connected
-    }, room=sid)
-
-@sio.event
-async def disconnect(sid):
-    pass  # Handled by system_update events
-
-@sio.on('control_incline')
-async def handle_incline(sid, data):
-    if -10 <= data['value'] <= 10:  # Safety limit
-        logger.info(f"Incline change: {data['value']}%")
-        await sio.emit('system_update', {
-            'type': 'incline',
-            'value': data['value'],
-            'timestamp': datetime.now().isoformat()
-        })
-
-# Application Lifecycle
-@app.on_startup
-async def startup(app):
-    app['device_task'] = asyncio.create_task(manage_devices())
-
-@app.on_cleanup
-async def cleanup(app):
-    app['device_task'].cancel()
-    try:
-        await app['device_task']
-    except asyncio.CancelledError:
-        pass
-
-# Routes
-async def index(request):
-    return web.FileResponse(str(static_path / 'index.html'))
-
-app.router.add_get('/', index)
-
-if __name__ == '__main__':
+import asyncio
+import logging
+from datetime import datetime
+from aiohttp import web
+import socketio
+from pathlib import Path
+from urllib.parse import parse_qs
+from typing import Dict, Optional
+from treadmill_manager import WoodwayTreadmill
+from device_supervisor import DeviceSupervisor, reconnect_options
+from fusion import StreamFusion
+from broadcaster import Broadcaster, ByteCountingJSON
+from wire import pack_metrics
+from assets import AssetStore
+from course_index import CourseError, CourseLibrary
+from course_lod import DEFAULT_MAX_POINTS
+from incline_control import InclineController
+from latency import LatencyTracker
+from loop_monitor import LoopLagMonitor, use_event_loop
+from metrics import CONTENT_TYPE, MetricsExporter
+from config.config_loader import load_server_config
+from ble.advertisement import AdvertisementWatcher
+from ble.session_log import SessionRecorder, SessionReplay
+
+# Initialize logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuration
+static_path = Path(__file__).parent.parent / 'static'
+server_config = load_server_config()
+
+# Web Application Setup
+app = web.Application()
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*', json=ByteCountingJSON)
+
+# Serve static files from memory, pre-compressed, with ETags
+assets = AssetStore(static_path)
+app.router.add_get('/static/{path:.*}', assets.handle)
+courses = CourseLibrary.from_config(static_path / 'data' / 'courses', server_config.get('courses'))
+
+# Socket.IO client fallback
+async def serve_socketio_js(request):
+    return web.Response(
+        text='<script src="https://cdn.socket.io/4.5.4/socket.io.min.js"></script>',
+        content_type='text/html'
+    )
+app.router.add_get('/socket.io/socket.io.js', serve_socketio_js)
+
+sio.attach(app)
+
+# Device Management
+treadmill = WoodwayTreadmill()
+
+def handle_treadmill_data(data: Dict) -> None:
+    fusion.push('treadmill', {k: data[k] for k in METRIC_FIELDS if k in data}, data.get('received'))
+    latency.frame(data)
+
+def handle_fused_sample(sample: Dict) -> None:
+    incline_control.update(sample)
+    latency.fused()
+    broadcaster.publish({
+        'type': 'metrics',
+        'speed': float(sample.get('speed', 0)),
+        'incline': float(sample.get('incline', 0)),
+        'distance': float(sample.get('distance', 0)),
+        'heart_rate': int(sample.get('heart_rate', 0)),
+        'ages': sample['ages'],
+        'timestamp': datetime.fromtimestamp(sample['timestamp']).isoformat()
+    }, raw=sample)
+
+METRIC_FIELDS = ('speed', 'incline', 'distance', 'heart_rate')
+fusion = StreamFusion.from_config(handle_fused_sample, server_config.get('fusion'))
+latency = LatencyTracker.from_config(server_config.get('latency'))
+broadcaster = Broadcaster.from_config(sio, server_config.get('broadcast'), packer=pack_metrics,
+                                      tracer=latency.emitted)
+
+async def command_incline(value: float) -> None:
+    logger.info(f"Auto incline: {value}%")
+    await sio.emit('system_update', {
+        'type': 'incline',
+        'value': value,
+        'source': 'auto',
+        'timestamp': datetime.now().isoformat()
+    })
+
+incline_control = InclineController.from_config(command_incline, server_config.get('incline_control'),
+                                                treadmill.config)
+
+async def handle_connection_change(device: str, connected: bool, reason: Optional[str]) -> None:
+    """Push connection state to every client as soon as it changes"""
+    logger.info(f"Emitting connection status - Socket: True, Treadmill: {connected} ({reason or 'ok'})")
+    try:
+        await sio.emit(
+            'system_update',
+            {
+                'type': 'connection',
+                'socket_connected': True,
+                'treadmill_connected': connected,
+                'reason': reason
+            },
+            callback=lambda: logger.debug("Status update confirmed by frontend")
+        )
+    except Exception as e:
+        logger.error(f"Connection update error: {str(e)}")
+
+supervisor = DeviceSupervisor(on_state_change=handle_connection_change,
+                               watcher=AdvertisementWatcher())
+supervisor.add('treadmill', treadmill,
+               **reconnect_options(treadmill.config['reconnect'], treadmill.config['mac_address']))
+
+loop_monitor = LoopLagMonitor.from_config(server_config.get('loop_monitor'))
+metrics = MetricsExporter({'treadmill': treadmill}, supervisor, broadcaster,
+                          fusion=fusion, loop_monitor=loop_monitor)
+
+async def manage_devices():
+    treadmill.callback = handle_treadmill_data
+    fusion.start()
+    broadcaster.start()
+    await supervisor.start()
+
+# WebSocket Events
+@sio.event
+async def connect(sid, environ):
+    await sio.emit('system_update', {
+        'type': 'connection',
+        'socket_connected': True,
+        'treadmill_connected': treadmill.is_connected
+    }, room=sid)
+    # Displays pick a rate tier with ?profile=wall|display|coach and opt
+    # into packed frames (src/wire.py) with ?format=binary
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    await broadcaster.join(sid, query.get('profile', [None])[0],
+                           binary=query.get('format', [None])[0] == 'binary')
+
+@sio.event
+async def disconnect(sid):
+    broadcaster.leave(sid)
+
+@sio.on('subscribe_metrics')
+async def handle_subscribe(sid, data):
+    data = data or {}
+    binary = data.get('format') == 'binary'
+    profile = await broadcaster.join(sid, data.get('profile'), binary=binary)
+    logger.info(f"Client {sid} receives {'binary' if binary else 'JSON'} metrics at profile '{profile}'")
+
+@sio.on('latency_ack')
+async def handle_latency_ack(sid, data):
+    """Browser receive and render times for a traced metrics message"""
+    latency.ack(data or {})
+
+@sio.on('course_position')
+async def handle_course_position(sid, data):
+    """Acknowledged with the same payload as GET /courses/{name}/position"""
+    try:
+        index = await courses.get_async(data['course'])
+        km, ghost_s = data.get('km'), data.get('ghost_s')
+        return index.query(float(km) if km is not None else None,
+                           float(ghost_s) if ghost_s is not None else None)
+    except (CourseError, KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+
+@sio.on('auto_incline')
+async def handle_auto_incline(sid, data):
+    """Engage ({course, km}) or disengage ({enabled: false}) the server-side incline controller"""
+    data = data or {}
+    if not data.get('enabled', True):
+        incline_control.disengage()
+        return incline_control.stats()
+    try:
+        index = await courses.get_async(data['course'])
+        incline_control.engage(index, float(data.get('km') or 0.0))
+    except (CourseError, KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+    return incline_control.stats()
+
+@sio.on('control_incline')
+async def handle_incline(sid, data):
+    if -10 <= data['value'] <= 10:  # Safety limit
+        incline_control.disengage('manual incline')
+        logger.info(f"Incline change: {data['value']}%")
+        await sio.emit('system_update', {
+            'type': 'incline',
+            'value': data['value'],
+            'timestamp': datetime.now().isoformat()
+        })
+
+# Application Lifecycle
+@app.on_startup
+async def startup(app):
+    app['asset_prebuild'] = asyncio.create_task(assets.prebuild_async())
+    loop_monitor.start()
+    await manage_devices()
+
+@app.on_cleanup
+async def cleanup(app):
+    await supervisor.stop()
+    await treadmill.watchdog.stop()
+    await treadmill.ingest.stop()
+    await fusion.stop()
+    await broadcaster.stop()
+    await loop_monitor.stop()
+    if treadmill.recorder:
+        treadmill.recorder.close()
+
+# Routes
+def query_number(request, key: str) -> Optional[float]:
+    value = request.query.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{key} must be a number")
+
+async def load_course(request):
+    try:
+        return await courses.get_async(request.match_info['name'])
+    except CourseError as e:
+        raise web.HTTPNotFound(text=str(e))
+
+async def course_position(request):
+    """Exact course position for ?km= (and the ghost's for ?ghost_s=)"""
+    km, ghost_s = query_number(request, 'km'), query_number(request, 'ghost_s')
+    index = await load_course(request)
+    return web.json_response(index.query(km, ghost_s))
+
+async def course_window(request):
+    """Route and profile slice for ?from_km=&to_km=, detail picked by ?zoom= or ?max_points="""
+    from_km, to_km = query_number(request, 'from_km'), query_number(request, 'to_km')
+    zoom, max_points = query_number(request, 'zoom'), query_number(request, 'max_points')
+    index = await load_course(request)
+    window = index.pyramid.window(from_km, to_km, zoom=zoom,
+                                  max_points=int(max_points) if max_points else DEFAULT_MAX_POINTS)
+    return web.json_response(window)
+
+async def course_grades(request):
+    """Smoothed grade profile for ?from_km=&to_km= at the precomputed resolution nearest ?step_m="""
+    from_km, to_km = query_number(request, 'from_km'), query_number(request, 'to_km')
+    step_m = query_number(request, 'step_m')
+    index = await load_course(request)
+    if not index.grades:
+        raise web.HTTPNotFound(text=f"Course {index.name} has no elevation data")
+    return web.json_response({'course': index.name, 'total_km': index.total_km,
+                              **index.grades.window(from_km, to_km, step_m)})
+
+async def index(request):
+    return await assets.page(request, 'index.html')
+
+async def ingest_stats(request):
+    """Queue depth, drop and consumer-lag counters for the device pipelines"""
+    return web.json_response({
+        'treadmill': treadmill.ingest.stats(),
+        'fusion': fusion.stats(),
+        'broadcast': broadcaster.stats()
+    })
+
+async def device_stats(request):
+    """Per-device connection state and time-to-reconnect"""
+    stats = supervisor.stats()
+    stats['treadmill']['first_frame'] = treadmill.first_frame.stats()
+    stats['treadmill']['watchdog'] = treadmill.watchdog.stats()
+    return web.json_response(stats)
+
+async def incline_stats(request):
+    """Auto incline state, commands sent and tracking error"""
+    return web.json_response(incline_control.stats())
+
+async def latency_stats(request):
+    """Per-stage p50/p95/p99 latency from BLE receipt to browser render; ?reset=1 starts afresh"""
+    stats = latency.stats()
+    if request.query.get('reset'):
+        latency.reset()
+    return web.json_response(stats)
+
+async def loop_stats(request):
+    """Event loop lag histogram and the stacks captured during recent spikes"""
+    return web.json_response(loop_monitor.stats())
+
+async def metrics_page(request):
+    """Prometheus text exposition of the device, broadcast, event loop and process counters"""
+    return web.Response(text=metrics.render(), headers={'Content-Type': CONTENT_TYPE})
+
+async def asset_stats(request):
+    """Static asset cache size, hit rate and bytes served"""
+    return web.json_response(assets.stats())
+
+app.router.add_get('/', index)
+app.router.add_get('/courses/{name}/position', course_position)
+app.router.add_get('/courses/{name}/window', course_window)
+app.router.add_get('/courses/{name}/grades', course_grades)
+app.router.add_get('/stats/ingest', ingest_stats)
+app.router.add_get('/stats/devices', device_stats)
+app.router.add_get('/stats/assets', asset_stats)
+app.router.add_get('/stats/latency', latency_stats)
+app.router.add_get('/stats/incline', incline_stats)
+app.router.add_get('/stats/loop', loop_stats)
+app.router.add_get('/metrics', metrics_page)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Treadmill monitor server')
+    parser.add_argument('--record', help='Append raw BLE notifications to this session log')
+    parser.add_argument('--replay', help='Replay a recorded session log instead of using Bluetooth')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Replay speed multiplier (0 = as fast as possible)')
+    args = parser.parse_args()
+
+    if args.record:
+        treadmill.recorder = SessionRecorder(args.record)
+    if args.replay:
+        treadmill.client_factory = SessionReplay(args.replay, args.replay_speed).client_factory()
+        supervisor.watcher = None  # nothing to scan for
+        treadmill.gatt_cache = None  # replay subscribes by UUID
+
+    use_event_loop(server_config.get('event_loop'))
     web.run_app(app, host='0.0.0.0', port=8080)
\ No newline at end of file
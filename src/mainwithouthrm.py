@@ -1,148 +1,355 @@
-import asyncio
-import logging
-from datetime import datetime
-from aiohttp import web
-import socketio
-from pathlib import Path
-from typing import Dict, Awaitable
-
-# Initialize logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Define paths
-static_path = Path(__file__).parent.parent / 'static'
-logger.info(f"Static files path: {static_path}")
-
-# WebSocket setup
-sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
-app = web.Application()
-app.router.add_static('/static', str(static_path))
-sio.attach(app)
-
-# Import managers
-try:
-    from treadmill_manager import WoodwayTreadmill
-    from hrm_manager import HRMManager
-except ImportError as e:
-    logger.critical(f"Import error: {str(e)}")
-    raise
-
-# ======================
-# SOCKET.IO EVENT HANDLERS
-# ======================
-@sio.event
-async def connect(sid, environ):
-    logger.info(f"Client connected: {sid}")
-
-@sio.event
-async def disconnect(sid):
-    logger.info(f"Client disconnected: {sid}")
-
-@sio.event
-async def adjust_incline(sid, data):
-    logger.info(f"Incline adjustment requested: {data}")
-    await sio.emit('data_update', {
-        'type': 'incline',
-        'value': data['direction'],
-        'timestamp': datetime.now().isoformat()
-    })
-
-@sio.event
-async def start_course(sid, data):
-    logger.info(f"Course started: {data['course']}")
-    await sio.emit('course_loaded', {
-        'name': data['course'],
-        'timestamp': datetime.now().isoformat()
-    })
-
-# ======================
-# DATA HANDLERS
-# ======================
-async def handle_treadmill_data(data: Dict) -> None:
-    try:
-        await sio.emit('data_update', {
-            **data,
-            'timestamp': datetime.now().isoformat(),
-            'type': 'treadmill'
-        })
-    except Exception as e:
-        logger.error(f"Treadmill data error: {str(e)}")
-
-async def handle_hrm_data(bpm: int) -> None:
-    try:
-        await sio.emit('data_update', {
-            'type': 'heart-rate',
-            'value': bpm,
-            'timestamp': datetime.now().isoformat()
-        })
-    except Exception as e:
-        logger.error(f"HRM data error: {str(e)}")
-
-# ======================
-# COURSE FILE SERVING
-# ======================
-async def serve_course(request):
-    course_name = request.match_info['filename']
-    course_path = static_path / 'data' / 'courses' / course_name
-    if not course_path.exists():
-        raise web.HTTPNotFound(text=f"Course {course_name} not found")
-    return web.FileResponse(course_path)
-
-# ======================
-# DEVICE MANAGEMENT
-# ======================
-async def manage_devices():
-    treadmill = WoodwayTreadmill()
-    hrm = HRMManager()
-    
-    treadmill.callback = handle_treadmill_data
-    hrm.hr_callback = handle_hrm_data
-    
-    while True:
-        try:
-            if not treadmill.is_connected:
-                await treadmill.connect_with_retry()
-            if not hrm.is_connected:
-                await hrm.connect_with_retry()
-            
-            await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            logger.error(f"Device error: {str(e)}")
-            await asyncio.sleep(5)
-
-# ======================
-# APPLICATION LIFECYCLE
-# ======================
-@app.on_startup
-async def startup(app):
-    app['device_task'] = asyncio.create_task(manage_devices())
-
-@app.on_cleanup
-async def cleanup(app):
-    app['device_task'].cancel()
-    try:
-        await app['device_task']
-    except asyncio.CancelledError:
-        logger.info("Background tasks cancelled")
-
-# ======================
-# ROUTES
-# ======================
-async def index(request):
-    return web.FileResponse(str(static_path / 'index.html'))
-
-app.router.add_get('/', index)
-app.router.add_get('/courses/{filename}', serve_course)
-
-if __name__ == '__main__':
-    try:
-        web.run_app(app, host='0.0.0.0', port=8080)
-    except Exception as e:
-        logger.critical(f"Application failed: {str(e)}")
+import asyncio
+import logging
+from datetime import datetime
+from aiohttp import web
+import socketio
+from pathlib import Path
+from urllib.parse import parse_qs
+from typing import Dict, Awaitable, Optional
+
+# Initialize logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Define paths
+static_path = Path(__file__).parent.parent / 'static'
+logger.info(f"Static files path: {static_path}")
+
+# Import managers
+try:
+    from treadmill_manager import WoodwayTreadmill
+    from hrm_manager import HRMManager
+    from device_supervisor import DeviceSupervisor, reconnect_options
+    from ble.advertisement import AdvertisementWatcher
+    from ble.session_log import SessionRecorder, SessionReplay
+    from fusion import StreamFusion
+    from broadcaster import Broadcaster, ByteCountingJSON
+    from wire import pack_metrics
+    from assets import AssetStore
+    from course_index import CourseError, CourseLibrary
+    from course_lod import DEFAULT_MAX_POINTS
+    from hr_control import HRZoneController
+    from latency import LatencyTracker
+    from loop_monitor import LoopLagMonitor, use_event_loop
+    from metrics import CONTENT_TYPE, MetricsExporter
+    from config.config_loader import load_server_config
+except ImportError as e:
+    logger.critical(f"Import error: {str(e)}")
+    raise
+
+# WebSocket setup
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*', json=ByteCountingJSON)
+app = web.Application()
+sio.attach(app)
+
+server_config = load_server_config()
+
+# Static files and courses from memory, pre-compressed, with ETags
+assets = AssetStore(static_path)
+app.router.add_get('/static/{path:.*}', assets.handle)
+courses = CourseLibrary.from_config(static_path / 'data' / 'courses', server_config.get('courses'))
+
+# ======================
+# SOCKET.IO EVENT HANDLERS
+# ======================
+@sio.event
+async def connect(sid, environ):
+    logger.info(f"Client connected: {sid}")
+    await sio.emit('system_update', {
+        'type': 'connection',
+        'socket_connected': True,
+        'treadmill_connected': supervisor.is_connected('treadmill'),
+        'hrm_connected': supervisor.is_connected('hrm')
+    }, room=sid)
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    await broadcaster.join(sid, query.get('profile', [None])[0],
+                           binary=query.get('format', [None])[0] == 'binary')
+
+@sio.event
+async def disconnect(sid):
+    broadcaster.leave(sid)
+    logger.info(f"Client disconnected: {sid}")
+
+@sio.on('subscribe_metrics')
+async def handle_subscribe(sid, data):
+    data = data or {}
+    await broadcaster.join(sid, data.get('profile'), binary=data.get('format') == 'binary')
+
+@sio.event
+async def adjust_incline(sid, data):
+    logger.info(f"Incline adjustment requested: {data}")
+    await sio.emit('data_update', {
+        'type': 'incline',
+        'value': data['direction'],
+        'timestamp': datetime.now().isoformat()
+    })
+
+@sio.on('hr_control')
+async def handle_hr_control(sid, data):
+    """Hold a heart rate zone ({zone: 1-5}) or stop ({enabled: false}); acknowledged with the controller stats"""
+    data = data or {}
+    if not data.get('enabled', True):
+        hr_control.disengage()
+        return hr_control.stats()
+    try:
+        hr_control.engage(int(data['zone']))
+    except (KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+    return hr_control.stats()
+
+@sio.event
+async def start_course(sid, data):
+    logger.info(f"Course started: {data['course']}")
+    await sio.emit('course_loaded', {
+        'name': data['course'],
+        'timestamp': datetime.now().isoformat()
+    })
+
+@sio.on('latency_ack')
+async def handle_latency_ack(sid, data):
+    """Browser receive and render times for a traced metrics message"""
+    latency.ack(data or {})
+
+@sio.on('course_position')
+async def handle_course_position(sid, data):
+    """Acknowledged with the same payload as GET /courses/{name}/position"""
+    try:
+        index = await courses.get_async(data['course'])
+        km, ghost_s = data.get('km'), data.get('ghost_s')
+        return index.query(float(km) if km is not None else None,
+                           float(ghost_s) if ghost_s is not None else None)
+    except (CourseError, KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+
+# ======================
+# DATA HANDLERS
+# ======================
+def handle_treadmill_data(data: Dict) -> None:
+    fusion.push('treadmill', {k: data[k] for k in METRIC_FIELDS if k in data}, data.get('received'))
+    latency.frame(data)
+
+def handle_hrm_data(bpm: int, received: float) -> None:
+    fusion.push('hrm', {'heart_rate': bpm}, received)
+    hr_control.push_heart_rate(bpm, received)
+
+def handle_fused_sample(sample: Dict) -> None:
+    """One time-aligned treadmill + heart-rate sample per fusion tick"""
+    hr_control.observe(sample)
+    latency.fused()
+    broadcaster.publish({
+        **sample,
+        'type': 'metrics',
+        'timestamp': datetime.fromtimestamp(sample['timestamp']).isoformat()
+    }, raw=sample)
+
+METRIC_FIELDS = ('speed', 'incline', 'distance', 'heart_rate')
+fusion = StreamFusion.from_config(handle_fused_sample, server_config.get('fusion'))
+latency = LatencyTracker.from_config(server_config.get('latency'))
+broadcaster = Broadcaster.from_config(sio, server_config.get('broadcast'), packer=pack_metrics,
+                                      tracer=latency.emitted)
+
+# ======================
+# COURSE FILE SERVING
+# ======================
+async def serve_course(request):
+    course_name = request.match_info['filename']
+    try:
+        return await assets.respond(request, f'data/courses/{course_name}')
+    except web.HTTPNotFound:
+        raise web.HTTPNotFound(text=f"Course {course_name} not found")
+
+def query_number(request, key: str) -> Optional[float]:
+    value = request.query.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{key} must be a number")
+
+async def load_course(request):
+    try:
+        return await courses.get_async(request.match_info['name'])
+    except CourseError as e:
+        raise web.HTTPNotFound(text=str(e))
+
+async def course_position(request):
+    """Exact course position for ?km= (and the ghost's for ?ghost_s=)"""
+    km, ghost_s = query_number(request, 'km'), query_number(request, 'ghost_s')
+    index = await load_course(request)
+    return web.json_response(index.query(km, ghost_s))
+
+async def course_window(request):
+    """Route and profile slice for ?from_km=&to_km=, detail picked by ?zoom= or ?max_points="""
+    from_km, to_km = query_number(request, 'from_km'), query_number(request, 'to_km')
+    zoom, max_points = query_number(request, 'zoom'), query_number(request, 'max_points')
+    index = await load_course(request)
+    window = index.pyramid.window(from_km, to_km, zoom=zoom,
+                                  max_points=int(max_points) if max_points else DEFAULT_MAX_POINTS)
+    return web.json_response(window)
+
+# ======================
+# DEVICE MANAGEMENT
+# ======================
+async def handle_connection_change(device: str, connected: bool, reason: Optional[str]) -> None:
+    """Push connection state to every client as soon as it changes"""
+    if device == 'treadmill' and not connected:
+        hr_control.disengage(f"treadmill {reason or 'disconnected'}")
+    try:
+        await sio.emit('system_update', {
+            'type': 'connection',
+            'socket_connected': True,
+            'device': device,
+            'connected': connected,
+            'reason': reason,
+            'treadmill_connected': supervisor.is_connected('treadmill'),
+            'hrm_connected': supervisor.is_connected('hrm')
+        })
+    except Exception as e:
+        logger.error(f"Connection update error: {str(e)}")
+
+treadmill = WoodwayTreadmill()
+hrm = HRMManager()
+
+async def command_speed_incline(speed: float, incline: float) -> None:
+    """Heart rate control targets for the treadmill"""
+    await sio.emit('system_update', {
+        'type': 'hr_control',
+        'speed': speed,
+        'incline': incline,
+        'zone': hr_control.zone,
+        'heart_rate': hr_control.heart_rate,
+        'timestamp': datetime.now().isoformat()
+    })
+
+hr_control = HRZoneController.from_config(command_speed_incline, server_config.get('hr_control'),
+                                          treadmill.config)
+supervisor = DeviceSupervisor(on_state_change=handle_connection_change,
+                               watcher=AdvertisementWatcher())
+supervisor.add('treadmill', treadmill,
+               **reconnect_options(treadmill.config['reconnect'], treadmill.config['mac_address']))
+supervisor.add('hrm', hrm, **reconnect_options(hrm.config['reconnect'], hrm.config['mac_address']))
+
+loop_monitor = LoopLagMonitor.from_config(server_config.get('loop_monitor'))
+metrics = MetricsExporter({'treadmill': treadmill, 'hrm': hrm}, supervisor, broadcaster,
+                          fusion=fusion, loop_monitor=loop_monitor)
+
+async def manage_devices():
+    """Start one independent reconnect loop per device"""
+    treadmill.callback = handle_treadmill_data
+    hrm.hr_callback = handle_hrm_data
+    fusion.start()
+    broadcaster.start()
+    await supervisor.start()
+
+# ======================
+# APPLICATION LIFECYCLE
+# ======================
+@app.on_startup
+async def startup(app):
+    app['asset_prebuild'] = asyncio.create_task(assets.prebuild_async())
+    loop_monitor.start()
+    await manage_devices()
+
+@app.on_cleanup
+async def cleanup(app):
+    hr_control.disengage('shutdown')
+    await supervisor.stop()
+    await treadmill.watchdog.stop()
+    await hrm.watchdog.stop()
+    await treadmill.ingest.stop()
+    await hrm.ingest.stop()
+    await fusion.stop()
+    await broadcaster.stop()
+    await loop_monitor.stop()
+    if treadmill.recorder:
+        treadmill.recorder.close()
+    logger.info("Background tasks cancelled")
+
+# ======================
+# ROUTES
+# ======================
+async def course_grades(request):
+    """Smoothed grade profile for ?from_km=&to_km= at the precomputed resolution nearest ?step_m="""
+    from_km, to_km = query_number(request, 'from_km'), query_number(request, 'to_km')
+    step_m = query_number(request, 'step_m')
+    index = await load_course(request)
+    if not index.grades:
+        raise web.HTTPNotFound(text=f"Course {index.name} has no elevation data")
+    return web.json_response({'course': index.name, 'total_km': index.total_km,
+                              **index.grades.window(from_km, to_km, step_m)})
+
+async def index(request):
+    return await assets.page(request, 'index.html')
+
+async def device_stats(request):
+    """Per-device connection state and time-to-reconnect"""
+    stats = supervisor.stats()
+    stats['treadmill']['first_frame'] = treadmill.first_frame.stats()
+    stats['hrm']['first_frame'] = hrm.first_frame.stats()
+    stats['treadmill']['watchdog'] = treadmill.watchdog.stats()
+    stats['hrm']['watchdog'] = hrm.watchdog.stats()
+    return web.json_response(stats)
+
+async def hr_control_stats(request):
+    """Heart rate control state, step counts and decision latency"""
+    return web.json_response(hr_control.stats())
+
+async def latency_stats(request):
+    """Per-stage p50/p95/p99 latency from BLE receipt to browser render; ?reset=1 starts afresh"""
+    stats = latency.stats()
+    if request.query.get('reset'):
+        latency.reset()
+    return web.json_response(stats)
+
+async def loop_stats(request):
+    """Event loop lag histogram and the stacks captured during recent spikes"""
+    return web.json_response(loop_monitor.stats())
+
+async def metrics_page(request):
+    """Prometheus text exposition of the device, broadcast, event loop and process counters"""
+    return web.Response(text=metrics.render(), headers={'Content-Type': CONTENT_TYPE})
+
+async def asset_stats(request):
+    """Static asset cache size, hit rate and bytes served"""
+    return web.json_response(assets.stats())
+
+app.router.add_get('/', index)
+app.router.add_get('/courses/{filename}', serve_course)
+app.router.add_get('/courses/{name}/position', course_position)
+app.router.add_get('/courses/{name}/window', course_window)
+app.router.add_get('/courses/{name}/grades', course_grades)
+app.router.add_get('/stats/devices', device_stats)
+app.router.add_get('/stats/assets', asset_stats)
+app.router.add_get('/stats/latency', latency_stats)
+app.router.add_get('/stats/hr_control', hr_control_stats)
+app.router.add_get('/stats/loop', loop_stats)
+app.router.add_get('/metrics', metrics_page)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Treadmill and heart rate monitor server')
+    parser.add_argument('--record', help='Append raw BLE notifications from both devices to this session log')
+    parser.add_argument('--replay', help='Replay a recorded session log instead of using Bluetooth')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Replay speed multiplier (0 = as fast as possible)')
+    args = parser.parse_args()
+
+    if args.record:
+        # One log for both devices; frames are tagged by characteristic UUID
+        treadmill.recorder = hrm.recorder = SessionRecorder(args.record)
+    if args.replay:
+        replay = SessionReplay(args.replay, args.replay_speed)
+        treadmill.client_factory = hrm.client_factory = replay.client_factory()
+        supervisor.watcher = None  # nothing to scan for
+        treadmill.gatt_cache = hrm.gatt_cache = None  # replay subscribes by UUID
+
+    try:
+        use_event_loop(server_config.get('event_loop'))
+        web.run_app(app, host='0.0.0.0', port=8080)
+    except Exception as e:
+        logger.critical(f"Application failed: {str(e)}")
         raise
\ No newline at end of file
@@ -0,0 +1,149 @@
+import math
+import os
+import resource
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from latency import BUCKETS_PER_DOUBLING, MIN_LATENCY, LatencyHistogram
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+Labels = Dict[str, str]
+
+# Exported edges for latency histograms, in seconds
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (f'{k}="{str(v)}"'.replace('\\', '\\\\').replace('\n', '\\n') for k, v in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def resident_memory_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # Peak rather than current RSS, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsPage:
+    """One Prometheus text exposition, built at scrape time"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def add(self, name: str, kind: str, help: str, samples: Iterable[Tuple[Labels, float]]):
+        self.lines.append(f'# HELP {name} {help}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.lines.append(f'{name}{_labels(labels)} {float(value)!r}')
+
+    def histogram(self, name: str, help: str, histogram: LatencyHistogram,
+                  edges: Sequence[float] = LAG_BUCKETS):
+        """A latency.LatencyHistogram, re-bucketed to ``edges``; each edge counts the log buckets below it"""
+        self.lines.append(f'# HELP {name} {help}')
+        self.lines.append(f'# TYPE {name} histogram')
+        cumulative, i = 0, 0
+        for edge in edges:
+            last = int(math.log2(edge / MIN_LATENCY) * BUCKETS_PER_DOUBLING)
+            cumulative += sum(histogram.counts[i:last])
+            i = max(i, last)
+            self.lines.append(f'{name}_bucket{{le="{edge!r}"}} {cumulative}')
+        self.lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+        self.lines.append(f'{name}_sum {histogram.total!r}')
+        self.lines.append(f'{name}_count {histogram.count}')
+
+    def render(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+
+class MetricsExporter:
+    """Prometheus metrics for the server, read from the counters each component already keeps.
+
+    Nothing is recorded per frame here: devices, queues and the
+    broadcaster bump plain int attributes, and ``render`` reads them when
+    /metrics is scraped. Emit and byte rates are averaged since the
+    previous scrape.
+    """
+
+    def __init__(self, devices: Dict[str, Any], supervisor, broadcaster, fusion=None, loop_monitor=None):
+        self.devices = devices
+        self.supervisor = supervisor
+        self.broadcaster = broadcaster
+        self.fusion = fusion
+        self.loop_monitor = loop_monitor
+        self._last_scrape: Optional[Tuple[float, Dict[str, Tuple[int, int]]]] = None
+
+    def _broadcast_totals(self) -> Dict[str, Tuple[int, int]]:
+        return {name: (p.messages_out + p.binary_out, p.json_bytes + p.binary_bytes)
+                for name, p in self.broadcaster.profiles.items()}
+
+    def render(self) -> str:
+        page = MetricsPage()
+        devices = self.devices.items()
+
+        page.add('cardio_frames_received_total', 'counter', 'BLE notifications received',
+                 (({'device': n}, d.frames_received) for n, d in devices))
+        page.add('cardio_frames_dropped_total', 'counter', 'Frames discarded by the ingest queue',
+                 (labels for n, d in devices for labels in (
+                     ({'device': n, 'reason': 'dropped'}, d.ingest.dropped),
+                     ({'device': n, 'reason': 'coalesced'}, d.ingest.coalesced),
+                     ({'device': n, 'reason': 'rejected'}, d.ingest.rejected))))
+        page.add('cardio_decode_errors_total', 'counter', 'Notifications that could not be decoded',
+                 (({'device': n}, d.decode_errors) for n, d in devices))
+        page.add('cardio_ingest_queue_depth', 'gauge', 'Frames waiting in the ingest queue',
+                 (({'device': n}, d.ingest.depth) for n, d in devices))
+
+        states = self.supervisor.devices.items()
+        page.add('cardio_device_connected', 'gauge', '1 while the device link is up',
+                 (({'device': n}, int(s.connected)) for n, s in states))
+        page.add('cardio_reconnects_total', 'counter', 'Completed reconnects',
+                 (({'device': n}, s.reconnects) for n, s in states))
+        page.add('cardio_reconnect_failures_total', 'counter', 'Failed connection attempts',
+                 (({'device': n}, s.failures) for n, s in states))
+        page.add('cardio_reconnect_duration_seconds_total', 'counter', 'Time spent down before each reconnect',
+                 (({'device': n}, s.reconnect_seconds) for n, s in states))
+
+        now = time.monotonic()
+        totals = self._broadcast_totals()
+        previous = self._last_scrape
+        self._last_scrape = (now, totals)
+        page.add('cardio_socketio_clients', 'gauge', 'Connected Socket.IO clients',
+                 [({}, self.broadcaster.clients)])
+        page.add('cardio_emits_total', 'counter', 'Metrics messages emitted per broadcast room',
+                 (({'profile': n}, t[0]) for n, t in totals.items()))
+        page.add('cardio_emit_bytes_total', 'counter',
+                 'Size of metrics messages emitted per broadcast room, one copy per emit',
+                 (({'profile': n}, t[1]) for n, t in totals.items()))
+        if previous is not None and now > previous[0]:
+            elapsed = now - previous[0]
+            page.add('cardio_emits_per_second', 'gauge', 'Emit rate since the previous scrape',
+                     (({'profile': n}, (t[0] - previous[1].get(n, (0, 0))[0]) / elapsed)
+                      for n, t in totals.items()))
+            page.add('cardio_emit_bytes_per_second', 'gauge',
+                     'Emitted message bytes per second (one copy per emit) since the previous scrape',
+                     (({'profile': n}, (t[1] - previous[1].get(n, (0, 0))[1]) / elapsed)
+                      for n, t in totals.items()))
+        if self.fusion is not None:
+            page.add('cardio_fused_samples_total', 'counter', 'Fused samples published',
+                     [({}, self.fusion.samples_out)])
+
+        if self.loop_monitor is not None:
+            histogram = self.loop_monitor.histogram
+            page.add('cardio_event_loop_lag_last_seconds', 'gauge', 'Latest event loop lag',
+                     [({}, self.loop_monitor.lag)])
+            page.add('cardio_event_loop_lag_max_seconds', 'gauge', 'Worst event loop lag since start',
+                     [({}, histogram.max)])
+            page.histogram('cardio_event_loop_lag_seconds', 'Event loop lag', histogram)
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        page.add('process_cpu_seconds_total', 'counter', 'User and system CPU time',
+                 [({}, usage.ru_utime + usage.ru_stime)])
+        page.add('process_resident_memory_bytes', 'gauge', 'Resident set size',
+                 [({}, resident_memory_bytes())])
+        return page.render()
@@ -1,152 +1,249 @@
-import asyncio
-import logging
-import struct
-from datetime import datetime
-from bleak import BleakClient
-from pathlib import Path
-import yaml
-from typing import Optional, Dict, Callable, Awaitable
-from tenacity import retry, stop_after_attempt, wait_exponential
-
-class WoodwayTreadmill:
-    def __init__(self, config_path: str = "configs/woodway_treadmill.yaml"):
-        self.config_path = Path(__file__).parent.parent / config_path
-        self._is_connected = False
-        self.config = self._load_config()
-        self.client: Optional[BleakClient] = None
-        self.callback: Optional[Callable[[Dict], Awaitable[None]]] = None
-        self.last_update: Optional[datetime] = None
-        self.accumulated_distance = 0.0  # meters
-        self.last_raw_distance = 0
-        self.sample_count = 0
-        
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger(__name__)
-
-    @property
-    def is_connected(self) -> bool:
-        """Public property to check treadmill connection status.
-        Returns:
-            bool: True if treadmill is connected and communicating
-        """
-        return self._is_connected
-    
-    def _load_config(self) -> dict:
-        """Load and validate device configuration"""
-        with open(self.config_path) as f:
-            config = yaml.safe_load(f)
-        
-        return {
-            'mac_address': config['devices']['treadmill']['address'],
-            'data_uuid': config['devices']['treadmill']['data_uuid'],
-            'byte_positions': {
-                'speed': (6, 7),
-                'distance': (8, 9),
-                'incline': (16, 17),
-                'heart_rate': 13
-            },
-            'scale_factors': {
-                'speed': 100.0,     # km/h = raw/100
-                'distance': 1.0,   # meters = raw/10
-                'incline': 10.0     # % = raw/10
-            },
-            'max_speed': 25.0,     # km/h safety limit
-            'max_incline': 15.0     # % safety limit
-        }
-
-    @retry(stop=stop_after_attempt(3), 
-           wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def connect_with_retry(self):
-        """Connect with retry and start notifications"""
-        try:
-            self.client = BleakClient(self.config['mac_address'])
-            await self.client.connect(timeout=15.0)
-            await self.client.start_notify(
-                self.config['data_uuid'],
-                self._handle_data
-            )
-            self._is_connected = True
-            self.logger.info(f"Connected to {self.config['mac_address']}")
-        except Exception as e:
-            self._is_connected = False
-            self.logger.error(f"Connection failed: {str(e)}")
-            raise
-
-    def _handle_data(self, sender, data: bytearray):
-        """Process incoming BLE data with hybrid distance calculation"""
-        if not self.callback or len(data) < 18:
-            return
-
-        try:
-            now = datetime.now()
-            raw_distance = struct.unpack('<H', data[8:10])[0]
-            speed_kmh = self._parse_value(data, 'speed')
-            
-            # Distance calculation logic
-            if self._validate_distance(raw_distance):
-                self.accumulated_distance = raw_distance / self.config['scale_factors']['distance']
-                self.last_raw_distance = raw_distance
-            elif self.last_update:
-                # Fallback to speed-based calculation
-                time_elapsed = (now - self.last_update).total_seconds()
-                self.accumulated_distance += (speed_kmh / 3.6) * time_elapsed  # km/h → m/s → meters
-            
-            self.last_update = now
-            self.sample_count += 1
-
-            # Log diagnostics every 100 samples
-            if self.sample_count % 100 == 0:
-                self.logger.info(
-                    f"Distance: Raw={raw_distance} "
-                    f"Calc={self.accumulated_distance:.1f}m "
-                    f"Speed={speed_kmh:.1f}km/h"
-                )
-
-            result = {
-                'speed': speed_kmh,
-                'incline': self._parse_value(data, 'incline'),
-                'distance': self.accumulated_distance,
-                'heart_rate': data[self.config['byte_positions']['heart_rate']],
-                'timestamp': now.isoformat()
-            }
-            asyncio.create_task(self.callback(result))
-
-        except Exception as e:
-            self.logger.error(f"Data error: {str(e)}\nRaw data: {data.hex()}")
-
-    def _validate_distance(self, raw_distance: int) -> bool:
-        """Validate treadmill distance reading"""
-        # Only accept increasing values within reasonable bounds
-        min_valid = self.last_raw_distance
-        max_valid = min_valid + 1000  # Allow max 1000 raw units jump
-        
-        return (raw_distance > min_valid and 
-                raw_distance < max_valid and
-                raw_distance < 65535)  # Max UINT16 value
-
-    def _parse_value(self, data: bytearray, key: str) -> float:
-        """Parse and validate scaled values"""
-        start, end = self.config['byte_positions'][key]
-        raw = struct.unpack('<H', data[start:end+1])[0]
-        value = raw / self.config['scale_factors'][key]
-        
-        # Safety checks
-        if key == 'speed' and value > self.config['max_speed']:
-            self.logger.warning(f"Clamping speed {value} to max {self.config['max_speed']}")
-            return self.config['max_speed']
-        if key == 'incline' and abs(value) > self.config['max_incline']:
-            self.logger.warning(f"Clamping incline {value} to max {self.config['max_incline']}")
-            return self.config['max_incline'] * (1 if value > 0 else -1)
-            
-        return value
-
-    async def disconnect(self):
-        """Cleanly disconnect from treadmill"""
-        if self.client and self.is_connected:
-            try:
-                await self.client.stop_notify(self.config['data_uuid'])
-                await self.client.disconnect()
-                self.logger.info("Disconnected from treadmill")
-            except Exception as e:
-                self.logger.error(f"Disconnect error: {str(e)}")
+import asyncio
+import logging
+import time
+from bleak import BleakClient
+from pathlib import Path
+import yaml
+from typing import Optional, Dict, Callable, Awaitable
+from tenacity import retry, stop_after_attempt, wait_exponential
+from ble.frame_decoder import FrameDecoder
+from ble.ingest import IngestQueue
+from ble.session_log import SessionRecorder
+from ble.gatt_cache import GattCache, FirstFrameTimer
+from ble.watchdog import StallWatchdog
+
+class WoodwayTreadmill:
+    def __init__(self, config_path: str = "configs/woodway_treadmill.yaml"):
+        self.config_path = Path(__file__).parent.parent / config_path
+        self._is_connected = False
+        self.config = self._load_config()
+        self.client: Optional[BleakClient] = None
+        self.client_factory: Callable[..., BleakClient] = BleakClient  # swapped for replay
+        self.recorder: Optional[SessionRecorder] = None
+        self.gatt_cache: Optional[GattCache] = GattCache.shared()
+        self.first_frame = FirstFrameTimer('Treadmill')
+        self.watchdog = StallWatchdog.from_config('Treadmill', self._on_stall, self.config['watchdog'])
+        self.link_lost: Optional[Callable[[str], None]] = None  # set by DeviceSupervisor
+        self.callback: Optional[Callable[[Dict], Awaitable[None]]] = None
+        self.last_update: Optional[float] = None  # time.monotonic() of last frame
+        self.accumulated_distance = 0.0  # meters
+        self.last_raw_distance = 0
+        self.sample_count = 0
+        self.frames_received = 0  # notifications, including short and undecodable ones
+        self.decode_errors = 0
+
+        # Frame layout is compiled once; the hot path only touches these
+        self.decoder = FrameDecoder.from_layout(self.config['frame_layout'])
+        self._distance_index = self.decoder.index('distance')
+        self._distance_scale = self.decoder.scales[self._distance_index] or 1.0
+        self._max_raw_distance = self.decoder.max_value('distance')  # all ones: counter unset
+        self._max_speed = self.config['max_speed']
+        self._max_incline = self.config['max_incline']
+
+        # Frames are delivered to the callback by a single consumer task
+        self.ingest = IngestQueue.from_config(self._deliver, self.config['ingest'], name='treadmill')
+        
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def is_connected(self) -> bool:
+        """Public property to check treadmill connection status.
+        Returns:
+            bool: True if treadmill is connected and communicating
+        """
+        return self._is_connected
+    
+    def _load_config(self) -> dict:
+        """Load and validate device configuration"""
+        with open(self.config_path) as f:
+            config = yaml.safe_load(f)
+
+        device = config['devices']['treadmill']
+        model = device.get('model', 'woodway_4front')
+        layout = config.get('frame_layouts', {}).get(model)
+        if layout is None:
+            raise ValueError(f"No frame layout configured for treadmill model '{model}'")
+
+        return {
+            'mac_address': device['address'],
+            'data_uuid': device['data_uuid'],
+            'model': model,
+            'frame_layout': layout,
+            'byte_positions': layout['byte_positions'],
+            'scale_factors': layout.get('scale_factors', {}),
+            'max_speed': float(device.get('max_speed', 25.0)),      # km/h safety limit
+            'max_incline': float(device.get('max_incline', 15.0)),  # % safety limit
+            'incline_slew_rate': float(device.get('incline_slew_rate', 0.5)),  # %/s belt incline change
+            'incline_latency': float(device.get('incline_latency', 0.5)),      # s before the belt starts moving
+            'ingest': device.get('ingest', {}),
+            'reconnect': device.get('reconnect', {}),
+            'watchdog': device.get('watchdog', {})
+        }
+
+    async def connect(self):
+        """Single connection attempt that starts notifications"""
+        address = self.config['mac_address']
+        data_uuid = self.config['data_uuid']
+        handle = self.gatt_cache.get(address, data_uuid) if self.gatt_cache else None
+        try:
+            self.first_frame.start(cached=handle is not None)
+            self.client = self.client_factory(
+                address,
+                disconnected_callback=self._on_disconnect
+            )
+            if handle is not None:
+                # Reconnect in this process: reuse Bleak's services from the last connection
+                await self.client.connect(timeout=15.0, dangerous_use_bleak_cache=True)
+            else:
+                await self.client.connect(timeout=15.0)
+            self.ingest.start()
+            try:
+                await self.client.start_notify(handle if handle is not None else data_uuid, self._handle_data)
+            except Exception:
+                if handle is not None:
+                    self.gatt_cache.invalidate(address)
+                raise
+            if handle is None and self.gatt_cache:
+                self.gatt_cache.remember(self.client, address, data_uuid)
+            self._is_connected = True
+            self.watchdog.arm()
+            self.logger.info(f"Connected to {address}")
+        except Exception as e:
+            self._is_connected = False
+            self.first_frame.cancel()
+            self.logger.error(f"Connection failed: {str(e)}")
+            raise
+
+    @retry(stop=stop_after_attempt(3), 
+           wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def connect_with_retry(self):
+        """Connect with retry and start notifications"""
+        await self.connect()
+
+    def _on_disconnect(self, client):
+        """Bleak callback when the link drops"""
+        if client is not self.client:
+            # Late callback from a client replaced by a reconnect (e.g. the one
+            # _on_stall disconnected); the current link is unaffected
+            return
+        if self._is_connected:
+            self.logger.warning(f"Treadmill {self.config['mac_address']} disconnected")
+        self._is_connected = False
+        self.watchdog.disarm()
+        if self.link_lost:
+            self.link_lost('disconnected')
+
+    async def _on_stall(self):
+        """Watchdog callback: link is up but notifications stopped"""
+        self._is_connected = False
+        if self.link_lost:
+            self.link_lost('stalled')
+        if self.client:
+            try:
+                await asyncio.wait_for(self.client.disconnect(), timeout=2.0)
+            except Exception as e:
+                self.logger.error(f"Disconnect after stall failed: {str(e)}")
+
+    def _handle_data(self, sender, data: bytearray):
+        """Process incoming BLE data with hybrid distance calculation"""
+        received = time.monotonic()
+        self.frames_received += 1
+        if self.recorder:
+            self.recorder.record(self.config['data_uuid'], data)
+        self.watchdog.feed()
+        if self.first_frame.pending:
+            self.first_frame.first_frame()
+        if not self.callback:
+            return
+        if len(data) < self.decoder.min_length:
+            self.decode_errors += 1
+            return
+
+        try:
+            self.ingest.put_nowait(self._decode_frame(data, received))
+        except asyncio.QueueFull:
+            pass  # 'block' policy: rejected and counted by the queue
+        except Exception as e:
+            self.decode_errors += 1
+            self.logger.error(f"Data error: {str(e)}\nRaw data: {data.hex()}")
+
+    def _deliver(self, result: Dict):
+        """Ingest consumer: hand one frame to the registered callback"""
+        result['dequeued'] = time.monotonic()
+        if self.callback:
+            return self.callback(result)
+
+    def _decode_frame(self, data: bytearray, received: Optional[float] = None) -> Dict:
+        """Decode one notification into a metrics dict.
+
+        A single ``unpack_from`` call reads every field in place; no slices,
+        per-field config lookups or datetime objects are created per frame.
+        ``received`` is the time.monotonic() the notification arrived.
+        """
+        now = time.monotonic() if received is None else received
+        raw = self.decoder.unpack(data)
+        result = self.decoder.scale(raw)
+        raw_distance = raw[self._distance_index]
+        speed_kmh = self._clamp('speed', result['speed'])
+
+        # Distance calculation logic
+        if self._validate_distance(raw_distance):
+            self.accumulated_distance = raw_distance / self._distance_scale
+            self.last_raw_distance = raw_distance
+        elif self.last_update:
+            # Fallback to speed-based calculation
+            time_elapsed = now - self.last_update
+            self.accumulated_distance += (speed_kmh / 3.6) * time_elapsed  # km/h → m/s → meters
+
+        self.last_update = now
+        self.sample_count += 1
+
+        # Log diagnostics every 100 samples
+        if self.sample_count % 100 == 0:
+            self.logger.info(
+                f"Distance: Raw={raw_distance} "
+                f"Calc={self.accumulated_distance:.1f}m "
+                f"Speed={speed_kmh:.1f}km/h"
+            )
+
+        result['speed'] = speed_kmh
+        result['incline'] = self._clamp('incline', result['incline'])
+        result['distance'] = self.accumulated_distance
+        result['timestamp'] = time.time()  # epoch seconds
+        result['received'] = now           # time.monotonic() at receipt
+        result['decoded'] = time.monotonic()  # latency stage stamps (see latency.py)
+        return result
+
+    def _validate_distance(self, raw_distance: int) -> bool:
+        """Validate treadmill distance reading"""
+        # Only accept increasing values within reasonable bounds
+        min_valid = self.last_raw_distance
+        max_valid = min_valid + 1000  # Allow max 1000 raw units jump
+        
+        return (raw_distance > min_valid and 
+                raw_distance < max_valid and
+                raw_distance < self._max_raw_distance)  # Max value of the layout's counter width
+
+    def _clamp(self, key: str, value: float) -> float:
+        """Apply safety limits to decoded values"""
+        if key == 'speed' and value > self._max_speed:
+            self.logger.warning(f"Clamping speed {value} to max {self._max_speed}")
+            return self._max_speed
+        if key == 'incline' and abs(value) > self._max_incline:
+            self.logger.warning(f"Clamping incline {value} to max {self._max_incline}")
+            return self._max_incline * (1 if value > 0 else -1)
+
+        return value
+
+    async def disconnect(self):
+        """Cleanly disconnect from treadmill"""
+        self.watchdog.disarm()
+        if self.client and self.is_connected:
+            try:
+                await self.client.stop_notify(self.config['data_uuid'])
+                await self.client.disconnect()
+                self.logger.info("Disconnected from treadmill")
+            except Exception as e:
+                self.logger.error(f"Disconnect error: {str(e)}")
         self._is_connected = False
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""Parallel batch compilation of a directory of GPX files.
+
+Each GPX is compiled in a process pool (one worker per CPU by default).
+Progress is reported as each file finishes. A file whose outputs are all
+newer than the GPX is skipped, and a failure is recorded without
+stopping the batch. ``--report`` writes a JSON summary.
+
+    python -m utils.course_batch <gpx_dir> <output_dir> [--workers N] [--force]
+                                 [--format course|analysis] [--report report.json]    (from src/)
+"""
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from utils.course_compiler import (MIN_SEGMENT_LENGTH, SEGMENT_LENGTH, GeoJSONSink, Sink,
+                                   compile_course, default_sinks)
+
+# format -> outputs written for each GPX
+FORMATS = ('course', 'analysis')
+
+
+def output_sinks(output_dir: Path, stem: str, output_format: str) -> List[Sink]:
+    if output_format == 'analysis':
+        # gpx_json_converter.py's GeoJSON with per-step segments
+        return [GeoJSONSink(output_dir / f'{stem}.json', analysis=True)]
+    return default_sinks(output_dir, stem)
+
+
+def is_current(source: Path, outputs: List[Path]) -> bool:
+    """Every output exists and is at least as new as ``source``"""
+    source_mtime = source.stat().st_mtime_ns
+    try:
+        return all(path.stat().st_mtime_ns >= source_mtime for path in outputs)
+    except FileNotFoundError:
+        return False
+
+
+def compile_one(source: str, output_dir: str, output_format: str = 'course',
+                min_segment_length: float = MIN_SEGMENT_LENGTH,
+                segment_length: float = SEGMENT_LENGTH) -> Dict[str, Any]:
+    """Compile one GPX; runs in a pool worker, so failures come back as results"""
+    start = perf_counter()
+    sinks = output_sinks(Path(output_dir), Path(source).stem, output_format)
+    result: Dict[str, Any] = {'source': source, 'outputs': [str(sink.path) for sink in sinks]}
+    try:
+        track = compile_course(source, sinks, min_segment_length=min_segment_length,
+                               segment_length=segment_length)
+        result.update({
+            'status': 'built',
+            'points': len(track),
+            'distance_km': round(float(track.distance_m[-1]) / 1000, 3),
+            'timings': {stage: round(seconds, 4) for stage, seconds in track.timings.stages.items()}
+        })
+    except Exception as e:
+        result.update({'status': 'failed', 'error': f"{type(e).__name__}: {str(e)}"})
+    result['seconds'] = round(perf_counter() - start, 4)
+    return result
+
+
+def print_progress(done: int, total: int, result: Dict[str, Any]):
+    name = Path(result['source']).name
+    if result['status'] == 'failed':
+        detail = result['error']
+    elif result['status'] == 'skipped':
+        detail = 'up to date'
+    else:
+        detail = f"{result['points']} points, {result['distance_km']} km in {result['seconds']:.2f} s"
+    print(f"[{done}/{total}] {result['status']:7s} {name}: {detail}", flush=True)
+
+
+def compile_directory(input_dir: Union[str, Path], output_dir: Union[str, Path],
+                      workers: Optional[int] = None, force: bool = False,
+                      output_format: str = 'course',
+                      min_segment_length: float = MIN_SEGMENT_LENGTH,
+                      segment_length: float = SEGMENT_LENGTH,
+                      progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = print_progress
+                      ) -> Dict[str, Any]:
+    """Compile every ``*.gpx`` in ``input_dir`` across a process pool.
+
+    Returns the summary report: per-file results (in input order), counts
+    and wall time.
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format {output_format}, expected one of {', '.join(FORMATS)}")
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    sources = sorted(input_dir.glob('*.gpx'))
+    start = perf_counter()
+
+    results: Dict[Path, Dict[str, Any]] = {}
+    pending = []
+    for source in sources:
+        outputs = [sink.path for sink in output_sinks(output_dir, source.stem, output_format)]
+        if not force and is_current(source, outputs):
+            results[source] = {'source': str(source), 'outputs': [str(p) for p in outputs],
+                               'status': 'skipped', 'seconds': 0.0}
+        else:
+            pending.append(source)
+
+    done = 0
+    for result in results.values():
+        done += 1
+        if progress:
+            progress(done, len(sources), result)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = {pool.submit(compile_one, str(source), str(output_dir), output_format,
+                                   min_segment_length, segment_length): source
+                       for source in pending}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                done += 1
+                if progress:
+                    progress(done, len(sources), result)
+
+    ordered = [results[source] for source in sources]
+    counts = {status: sum(r['status'] == status for r in ordered) for status in ('built', 'skipped', 'failed')}
+    return {
+        'input_dir': str(input_dir),
+        'output_dir': str(output_dir),
+        'format': output_format,
+        'workers': workers,
+        'files': len(ordered),
+        **counts,
+        'cpu_seconds': round(sum(r['seconds'] for r in ordered), 3),
+        'wall_seconds': round(perf_counter() - start, 3),
+        'results': ordered
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile every GPX in a directory in parallel',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('input_dir', help='Directory of .gpx files')
+    parser.add_argument('output_dir', help='Directory for the compiled outputs')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Rebuild outputs that are newer than their GPX')
+    parser.add_argument('--format', dest='output_format', choices=FORMATS, default='course',
+                        help='course: .json/.geojson/.course; analysis: gpx_json_converter GeoJSON')
+    parser.add_argument('--min_segment', type=float, default=MIN_SEGMENT_LENGTH,
+                        help='Minimum metres between treadmill profile points')
+    parser.add_argument('--segment_length', type=float, default=SEGMENT_LENGTH,
+                        help='Metres per grade_profile step')
+    parser.add_argument('--report', help='Write the JSON summary report here')
+    args = parser.parse_args()
+
+    report = compile_directory(args.input_dir, args.output_dir, workers=args.workers, force=args.force,
+                               output_format=args.output_format, min_segment_length=args.min_segment,
+                               segment_length=args.segment_length)
+    print(f"{report['files']} files: {report['built']} built, {report['skipped']} skipped, "
+          f"{report['failed']} failed in {report['wall_seconds']:.1f} s "
+          f"({report['cpu_seconds']:.1f} s of work on {report['workers']} workers)")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+    sys.exit(1 if report['failed'] else 0)
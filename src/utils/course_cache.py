@@ -0,0 +1,248 @@
+"""Content-addressed build cache for course files compiled from GPX.
+
+Every artifact lives in ``<cache_dir>/<key>/``. The key hashes the GPX
+bytes and name, plus the converter's name, ``__version__`` and
+parameters, so changing any of them yields a fresh build. A GPX whose
+(mtime, size) hasn't changed isn't re-hashed; a touched but identical
+one is re-hashed and not rebuilt. When a source changes, the artifacts
+of its previous key are deleted, and ``collect`` removes the rest
+(deleted sources, interrupted builds).
+
+    python -m utils.course_cache <gpx_dir> [--out DIR] [--gc]    (from src/)
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from utils import course_compiler
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / '.cache' / 'courses'
+MANIFEST = 'manifest.json'
+
+
+class CourseBuildError(ValueError):
+    """A converter failed on a GPX source"""
+    pass
+
+
+class Converter:
+    """One GPX converter: the files it produces and what invalidates them"""
+    __slots__ = ('name', 'version', 'params', 'suffixes', 'run')
+
+    def __init__(self, name: str, version: str, params: Dict[str, Any], suffixes: tuple,
+                 run: Callable[[Path, Path, Dict[str, Any]], None]):
+        self.name = name
+        self.version = version
+        self.params = params
+        self.suffixes = suffixes
+        self.run = run  # run(source, output_dir, params)
+
+    def key(self, source: Path, digest: str) -> str:
+        identity = json.dumps({'source': source.name, 'sha256': digest, 'converter': self.name,
+                               'version': self.version, 'params': self.params}, sort_keys=True)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+
+def _compile(source: Path, output_dir: Path, params: Dict[str, Any]):
+    course_compiler.compile_course(source, course_compiler.default_sinks(output_dir, source.stem), **params)
+
+
+def default_converters(min_segment_length: float = course_compiler.MIN_SEGMENT_LENGTH,
+                       segment_length: float = course_compiler.SEGMENT_LENGTH) -> List[Converter]:
+    """The course compiler: treadmill profile (.json), .course and GeoJSON in one pass"""
+    return [
+        Converter('compiler', course_compiler.__version__,
+                  {'min_segment_length': min_segment_length, 'segment_length': segment_length},
+                  ('.json', '.course', '.geojson'), _compile),
+    ]
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CourseBuildCache:
+    """Builds course artifacts from GPX sources once per content hash.
+
+    ``lookup`` is a stat-only check for a current artifact and is cheap
+    enough to call on every request. ``artifact`` hashes and converts as
+    needed. It is safe to call from worker threads.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+                 converters: Optional[List[Converter]] = None):
+        self.cache_dir = Path(cache_dir)
+        self.converters = converters if converters is not None else default_converters()
+        self._by_suffix = {suffix: c for c in self.converters for suffix in c.suffixes}
+        self._lock = threading.Lock()
+        self._manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self.built = 0
+        self.skipped = 0
+        self.hashed = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'CourseBuildCache':
+        """Build from the ``courses`` section of configs/server.yaml"""
+        config = config or {}
+        converters = default_converters(
+            min_segment_length=float(config.get('min_segment_length', course_compiler.MIN_SEGMENT_LENGTH)),
+            segment_length=float(config.get('segment_length', course_compiler.SEGMENT_LENGTH)))
+        return cls(config.get('cache_dir') or DEFAULT_CACHE_DIR, converters)
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_dir / MANIFEST) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / (MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.cache_dir / MANIFEST)
+
+    def handles(self, suffix: str) -> bool:
+        return suffix in self._by_suffix
+
+    def lookup(self, source: Path, suffix: str) -> Optional[Path]:
+        """Current artifact for ``source``, or None if it needs ``artifact``"""
+        entry = self._manifest.get(str(source))
+        if entry is None:
+            return None
+        try:
+            stat = source.stat()
+        except FileNotFoundError:
+            return None
+        converter = self._by_suffix[suffix]
+        key = entry['keys'].get(converter.name)
+        if (entry['stat'] != [stat.st_mtime_ns, stat.st_size] or
+                key != converter.key(source, entry['sha256'])):
+            return None
+        path = self.cache_dir / key / (source.stem + suffix)
+        return path if path.is_file() else None
+
+    def artifact(self, source: Path, suffix: str) -> Path:
+        """Artifact for ``source``, hashing and converting it if it changed"""
+        with self._lock:
+            directory = self._build(source, self._by_suffix[suffix])
+        return directory / (source.stem + suffix)
+
+    def _entry(self, source: Path) -> Tuple[Dict[str, Any], bool]:
+        """Manifest entry for ``source`` and whether it changed; hashes only when its stat did"""
+        stat = source.stat()
+        stat_key = [stat.st_mtime_ns, stat.st_size]
+        entry = self._manifest.get(str(source))
+        if entry is not None and entry['stat'] == stat_key:
+            return entry, False
+        digest = _sha256(source)
+        self.hashed += 1
+        entry = {'sha256': digest, 'stat': stat_key, 'keys': entry['keys'] if entry else {}}
+        self._manifest[str(source)] = entry
+        return entry, True
+
+    def _build(self, source: Path, converter: Converter) -> Path:
+        source = source.resolve()
+        entry, changed = self._entry(source)
+        key = converter.key(source, entry['sha256'])
+        directory = self.cache_dir / key
+        if directory.is_dir():
+            self.skipped += 1
+        else:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = Path(tempfile.mkdtemp(prefix='.build-', dir=self.cache_dir))
+            try:
+                converter.run(source, tmp, converter.params)
+                for produced in tmp.iterdir():
+                    if produced.suffix not in converter.suffixes:
+                        produced.unlink()
+                os.replace(tmp, directory)
+            except Exception as e:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise CourseBuildError(f"{converter.name} build of {source.name} failed: {str(e)}")
+            self.built += 1
+
+        previous = entry['keys'].get(converter.name)
+        if previous != key:
+            entry['keys'][converter.name] = key
+            if previous:
+                shutil.rmtree(self.cache_dir / previous, ignore_errors=True)
+            changed = True
+        if changed:
+            self._save_manifest()
+        return directory
+
+    def build_all(self, source_dir: Union[str, Path]) -> Dict[str, Any]:
+        """Bring every ``*.gpx`` under ``source_dir`` up to date"""
+        built, skipped = self.built, self.skipped
+        failed = []
+        for source in sorted(Path(source_dir).glob('*.gpx')):
+            for converter in self.converters:
+                try:
+                    with self._lock:
+                        self._build(source, converter)
+                except CourseBuildError as e:
+                    failed.append(str(e))
+        return {'built': self.built - built, 'skipped': self.skipped - skipped, 'failed': failed}
+
+    def collect(self) -> int:
+        """Delete artifacts no current source refers to; returns directories removed"""
+        with self._lock:
+            for source in [s for s in self._manifest if not Path(s).is_file()]:
+                del self._manifest[source]
+            live = {key for entry in self._manifest.values() for key in entry['keys'].values()}
+            removed = 0
+            if self.cache_dir.is_dir():
+                for directory in self.cache_dir.iterdir():
+                    if directory.is_dir() and directory.name not in live:
+                        shutil.rmtree(directory, ignore_errors=True)
+                        removed += 1
+            self._save_manifest()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sources': len(self._manifest),
+            'built': self.built,
+            'skipped': self.skipped,
+            'hashed': self.hashed
+        }
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Build course files from every GPX in a directory')
+    parser.add_argument('gpx_dir', help='Directory of .gpx sources')
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR))
+    parser.add_argument('--out', help='Also copy current artifacts here (e.g. static/data/courses)')
+    parser.add_argument('--gc', action='store_true', help='Delete stale artifacts afterwards')
+    args = parser.parse_args()
+
+    cache = CourseBuildCache(args.cache_dir)
+    summary = cache.build_all(args.gpx_dir)
+    print(f"Built {summary['built']}, up to date {summary['skipped']}, failed {len(summary['failed'])}")
+    for message in summary['failed']:
+        print(f"  {message}", file=sys.stderr)
+    if args.out:
+        out = Path(args.out)
+        for source in sorted(Path(args.gpx_dir).glob('*.gpx')):
+            for suffix in cache._by_suffix:
+                artifact = cache.lookup(source.resolve(), suffix)
+                target = out / (source.stem + suffix)
+                if artifact is not None and (not target.exists() or
+                                             target.read_bytes() != artifact.read_bytes()):
+                    shutil.copyfile(artifact, target)
+                    print(f"Updated {target}")
+    if args.gc:
+        print(f"Removed {cache.collect()} stale artifact directories")
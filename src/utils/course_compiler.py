@@ -0,0 +1,482 @@
+"""Single-pass GPX course compiler with pluggable output sinks.
+
+The GPX is streamed once into flat columns (``Track``). Every derived
+metric is a lazily computed property, computed at most once and only
+when some sink asks for it. Sinks write one output each:
+
+    TreadmillProfileSink   name.json      profile rows for the treadmill (gpx_parser.py)
+    GeoJSONSink            name.geojson   route with grade_profile and ghost_runs
+    CourseStoreSink        name.course    memory-mapped columns (course_store.py)
+
+All distances are Vincenty on WGS84. ``Track.timings`` records how long
+each stage took.
+
+    python -m utils.course_compiler <input.gpx> <output_dir> [-v]    (from src/)
+"""
+import json
+import logging
+import math
+import os
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from functools import cached_property
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from utils.course_store import write_course
+from utils.gpx_stream import GPXReader
+
+__version__ = "2.0.0"  # bump when any output changes; keys the course build cache
+
+logger = logging.getLogger(__name__)
+
+# WGS84, as used by geopy's geodesic distance
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+MIN_SEGMENT_LENGTH = 5.0  # metres between treadmill profile points
+SEGMENT_LENGTH = 100      # metres per grade_profile step
+MOVING_KMH = 1.0          # slower than this is a stop, not a pace
+MAX_HR = 185
+# Expected heart rate at reference paces (min/km), for effort_ratio
+EXPECTED_HR = {5.0: 145, 6.0: 135, 7.0: 125}
+
+# Successors of each point measured in one batch by select_points()
+SELECT_WINDOW = 16
+SELECT_BATCH = 4096
+
+ROUTE_STYLE = {"color": "#4285F4", "weight": 4, "opacity": 0.8}
+
+
+def vincenty_km(lat1, lon1, lat2, lon2, max_iterations=100):
+    """Vectorized Vincenty inverse distance on the WGS84 ellipsoid.
+
+    Arguments are degrees (arrays broadcast together). Agrees with
+    geopy's geodesic distance to well under a millimetre at track point
+    spacing.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    f = WGS84_F
+    L = lon2 - lon1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sinU1, cosU1, sinU2, cosU2 = np.sin(U1), np.cos(U1), np.sin(U2), np.cos(U2)
+
+    lam = L
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            # Coincident points: sin_sigma == 0, distance 0
+            sin_alpha = np.where(sin_sigma > 0, cosU1 * cosU2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines: cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha > 0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha, 0.0)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            if np.all(np.abs(lam - previous) < 1e-12):
+                break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+        B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    return WGS84_B * A * (sigma - delta_sigma) / 1000
+
+
+def select_points(lat: np.ndarray, lon: np.ndarray, min_km: float, window: int = SELECT_WINDOW) -> np.ndarray:
+    """Indices kept by the sequential filter: each point must differ from,
+    and be at least ``min_km`` from, the previous kept point.
+
+    Distances from every point to its next ``window`` points are computed
+    in batches, so the scan itself only jumps from kept point to kept point.
+    """
+    n = len(lat)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+
+    def first_far(k, targets):
+        same = (lat[targets] == lat[k]) & (lon[targets] == lon[k])
+        far = ~same & (vincenty_km(lat[k], lon[k], lat[targets], lon[targets]) >= min_km)
+        return targets[far.argmax()] if far.any() else None
+
+    # Batches of rows keep the temporaries small on multi-hour tracks
+    next_kept = []
+    for start in range(0, n, SELECT_BATCH):
+        rows = np.arange(start, min(start + SELECT_BATCH, n))
+        successors = rows[:, None] + np.arange(1, window + 1)
+        valid = successors < n
+        successors = np.minimum(successors, n - 1)
+        same = (lat[successors] == lat[rows, None]) & (lon[successors] == lon[rows, None])
+        far = valid & ~same & (vincenty_km(lat[rows, None], lon[rows, None],
+                                           lat[successors], lon[successors]) >= min_km)
+        next_kept += np.where(far.any(axis=1),
+                              successors[np.arange(len(rows)), far.argmax(axis=1)], -1).tolist()
+
+    kept = [0]
+    k = 0
+    while True:
+        j = next_kept[k]
+        if j < 0:
+            # Stationary for longer than the window: measure further ahead from k
+            j = None
+            for start in range(k + window + 1, n, SELECT_BATCH):
+                j = first_far(k, np.arange(start, min(start + SELECT_BATCH, n)))
+                if j is not None:
+                    break
+            if j is None:
+                break
+        kept.append(j)
+        k = j
+    return np.asarray(kept, dtype=int)
+
+
+class StageTimings:
+    """Wall time per named compiler stage, accumulated across calls.
+
+    Stages nest (a sink's write triggers the metrics it reads); each stage
+    is charged only its own time, so the stages add up to the total.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._inner: List[float] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        self._inner.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - self._inner.pop()
+            if self._inner:
+                self._inner[-1] += elapsed
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    def __str__(self) -> str:
+        parts = [f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stages.items()]
+        return ', '.join(parts + [f"total {self.total * 1000:.1f} ms"])
+
+
+class Track:
+    """One GPX track as columns, with every derived metric computed once on first use.
+
+    Points without elevation are dropped on reading; ``time`` is NaN and
+    ``hr`` 0 where the GPX has none.
+    """
+
+    def __init__(self, name: str, lat: np.ndarray, lon: np.ndarray, ele: np.ndarray,
+                 time: np.ndarray, hr: np.ndarray, points_read: int,
+                 min_segment_length: float = MIN_SEGMENT_LENGTH,
+                 segment_length: float = SEGMENT_LENGTH,
+                 timings: Optional[StageTimings] = None):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.time = time
+        self.hr = hr
+        self.points_read = points_read
+        self.min_segment_length = min_segment_length
+        self.segment_length = segment_length
+        self.timings = timings or StageTimings()
+
+    @classmethod
+    def read(cls, gpx_path: Union[str, Path], **params) -> 'Track':
+        """Stream ``gpx_path`` into columns (8 bytes a value, no per-point objects)"""
+        timings = StageTimings()
+        with timings.stage('parse'):
+            reader = GPXReader(gpx_path)
+            lat, lon, ele, time, hr = array('d'), array('d'), array('d'), array('d'), array('B')
+            for point in reader:
+                if point.ele is None:
+                    continue
+                lat.append(point.lat)
+                lon.append(point.lon)
+                ele.append(point.ele)
+                time.append(math.nan if point.time is None else point.time)
+                hr.append(min(point.hr or 0, 255))
+        if not lat:
+            raise ValueError("No valid points found in GPX file")
+        name = (reader.track_names[-1] if reader.track_names else None) or os.path.basename(gpx_path)
+        return cls(name, np.frombuffer(lat), np.frombuffer(lon), np.frombuffer(ele),
+                   np.frombuffer(time), np.frombuffer(hr, dtype=np.uint8), reader.points,
+                   timings=timings, **params)
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @property
+    def has_time(self) -> bool:
+        return not bool(np.isnan(self.time).all())
+
+    # --- every point ---------------------------------------------------
+
+    @cached_property
+    def step_m(self) -> np.ndarray:
+        """Distance from each point to the next"""
+        with self.timings.stage('distance'):
+            return vincenty_km(self.lat[:-1], self.lon[:-1], self.lat[1:], self.lon[1:]) * 1000
+
+    @cached_property
+    def distance_m(self) -> np.ndarray:
+        """Cumulative distance at each point"""
+        step = self.step_m
+        with self.timings.stage('distance'):
+            return np.concatenate(([0.0], np.cumsum(step)))
+
+    @cached_property
+    def pace(self) -> np.ndarray:
+        """Pace (min/km) of each step, NaN when stopped, untimed or zero-length"""
+        step = self.step_m
+        with self.timings.stage('pace'):
+            dt = np.diff(self.time)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pace = (dt / 60) / (step / 1000)
+                moving = (step > 0) & (dt > 0) & ((step / 1000) / dt * 3600 >= MOVING_KMH)
+            return np.where(moving, pace, np.nan)
+
+    @cached_property
+    def grade_profile(self) -> List[Dict[str, float]]:
+        """Grade over consecutive ``segment_length`` stretches, the last one partial"""
+        distance = self.distance_m
+        with self.timings.stage('grade_profile'):
+            profile = []
+            start, n = 0, len(distance)
+            while start < n - 1:
+                end = int(np.searchsorted(distance, distance[start] + self.segment_length))
+                if end >= n:
+                    end = n - 1
+                    if distance[end] - distance[start] <= 0:
+                        break
+                span = distance[end] - distance[start]
+                profile.append({
+                    "start_km": round(float(distance[start]) / 1000, 3),
+                    "grade": round(float(self.ele[end] - self.ele[start]) / span * 100, 1),
+                    "ele": round(float(self.ele[end]), 1)
+                })
+                start = end
+            return profile
+
+    @cached_property
+    def ghost_segments(self) -> List[Dict[str, Any]]:
+        """Recorded pace per step, as the ghost runner replays it"""
+        distance, step = self.distance_m, self.step_m
+        with self.timings.stage('ghost'):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                pace = np.where(step > 0, (np.diff(self.time) / 60) / (step / 1000), 0.0)
+            pace = np.nan_to_num(pace, nan=0.0)  # steps with a missing timestamp
+            return [
+                {"start_m": round(s, 2), "end_m": round(e, 2), "pace_min_km": round(p, 1), "elevation": round(z, 1)}
+                for s, e, p, z in zip(distance[:-1].tolist(), distance[1:].tolist(),
+                                      pace.tolist(), self.ele[1:].tolist())
+            ]
+
+    @cached_property
+    def analysis_segments(self) -> List[Dict[str, Any]]:
+        """Per-step pace, grade, heart rate zone and effort (gpx_json_converter.py)"""
+        distance, step, pace = self.distance_m, self.step_m, self.pace
+        with self.timings.stage('analysis'):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                grade = np.where(step > 0, np.diff(self.ele) / step * 100, 0.0)
+            references = np.array(sorted(EXPECTED_HR))
+            expected = np.array([EXPECTED_HR[r] for r in references], dtype=float)
+            nearest = np.abs(np.nan_to_num(pace)[:, None] - references).argmin(axis=1)
+            hr = self.hr[1:].astype(int)
+            effort = hr / expected[nearest]
+            segments = []
+            for s, e, p, g, z, h, eff in zip(distance[:-1].tolist(), distance[1:].tolist(), pace.tolist(),
+                                             grade.tolist(), self.ele[1:].tolist(), hr.tolist(), effort.tolist()):
+                moving = not math.isnan(p)
+                segments.append({
+                    "start_m": round(s, 2),
+                    "end_m": round(e, 2),
+                    "pace_min_km": round(p, 1) if moving else None,
+                    "grade": round(g, 1),
+                    "elevation": round(z, 1),
+                    "hr": h or None,
+                    "hr_zone": min(h * 100 // MAX_HR, 5) if h else None,
+                    "moving": moving,
+                    "effort_ratio": round(eff, 2) if moving and h else None
+                })
+            return segments
+
+    # --- treadmill profile (filtered points) ----------------------------
+
+    @cached_property
+    def kept(self) -> np.ndarray:
+        """Points left after dropping duplicates and micro-movements"""
+        with self.timings.stage('filter'):
+            return select_points(self.lat, self.lon, self.min_segment_length / 1000)
+
+    @cached_property
+    def treadmill(self) -> Dict[str, Any]:
+        """Treadmill profile document: metadata plus km/lat/lon/ele/grade rows"""
+        kept = self.kept
+        with self.timings.stage('treadmill'):
+            lat, lon, ele = self.lat[kept], self.lon[kept], self.ele[kept]
+            dist_km = vincenty_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+            km = np.concatenate(([0.0], np.cumsum(dist_km)))
+            grade_pct = np.concatenate(([0.0], np.diff(ele) / (dist_km * 1000) * 100))
+            # Python's round() so values match the per-point implementation exactly
+            profile = [
+                {"km": round(k, 3), "lat": round(la, 6), "lon": round(lo, 6), "ele": round(e, 1), "grade": round(g, 1)}
+                for k, la, lo, e, g in zip(km.tolist(), lat.tolist(), lon.tolist(), ele.tolist(), grade_pct.tolist())
+            ]
+            # Elevation gain over the rounded elevations, as written to the profile
+            ele_steps = np.diff([p["ele"] for p in profile])
+            elevation_gain = float(ele_steps[ele_steps > 0].sum())
+            return {
+                "metadata": {
+                    "name": self.name,
+                    "total_distance_km": round(float(km[-1]), 3),
+                    "elevation_gain": round(elevation_gain, 1),
+                    "max_grade": round(max(abs(p["grade"]) for p in profile), 1),
+                    "points_processed": len(profile),
+                    "points_skipped": self.points_read - len(profile)
+                },
+                "profile": profile
+            }
+
+
+class Sink(ABC):
+    """Writes one output file from a compiled Track"""
+    name = 'sink'
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    @abstractmethod
+    def write(self, track: Track):
+        """Write ``track`` to ``self.path``"""
+
+    def _write_json(self, document: Dict[str, Any], indent: Optional[int] = 2):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(document, f, indent=indent)
+
+
+class TreadmillProfileSink(Sink):
+    """Treadmill profile JSON, the format gpx_parser.py has always written"""
+    name = 'treadmill'
+
+    def write(self, track: Track):
+        self._write_json(track.treadmill)
+
+
+class GeoJSONSink(Sink):
+    """Route LineString (every point, with elevation) plus grade_profile and, for
+    timed tracks, ghost_runs. ``analysis`` adds per-step ``segments``."""
+    name = 'geojson'
+
+    def __init__(self, path: Union[str, Path], analysis: bool = False):
+        super().__init__(path)
+        self.analysis = analysis
+
+    def write(self, track: Track):
+        metadata = track.treadmill["metadata"]
+        properties = {
+            "name": track.name,
+            "distance_km": round(float(track.distance_m[-1]) / 1000, 3),
+            "elevation_gain": metadata["elevation_gain"],
+            "max_grade": metadata["max_grade"],
+            "style": ROUTE_STYLE,
+            "grade_profile": track.grade_profile
+        }
+        if track.has_time:
+            properties["ghost_runs"] = {"default": {"segments": track.ghost_segments, "color": "#FF0000"}}
+        if self.analysis:
+            properties["segments"] = track.analysis_segments
+        coordinates = [[round(lo, 6), round(la, 6), round(e, 1)]
+                       for lo, la, e in zip(track.lon.tolist(), track.lat.tolist(), track.ele.tolist())]
+        self._write_json({
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "properties": properties
+            }]
+        })
+
+
+class CourseStoreSink(Sink):
+    """Memory-mapped .course columns of the treadmill profile"""
+    name = 'course'
+
+    def write(self, track: Track):
+        document = track.treadmill
+        profile = document["profile"]
+        kept = track.kept
+        write_course(self.path, document["metadata"]["name"], {
+            "km": [p["km"] for p in profile],
+            "lat": [p["lat"] for p in profile],
+            "lon": [p["lon"] for p in profile],
+            "ele": [p["ele"] for p in profile],
+            "grade": [p["grade"] for p in profile],
+            "time": track.time[kept],
+            "hr": track.hr[kept]
+        }, metadata={"elevation_gain": document["metadata"]["elevation_gain"],
+                     "max_grade": document["metadata"]["max_grade"]})
+
+
+def compile_course(gpx_path: Union[str, Path], sinks: Iterable[Sink] = (),
+                   min_segment_length: float = MIN_SEGMENT_LENGTH,
+                   segment_length: float = SEGMENT_LENGTH) -> Track:
+    """Read ``gpx_path`` once and write every sink from the same Track"""
+    track = Track.read(gpx_path, min_segment_length=min_segment_length, segment_length=segment_length)
+    for sink in sinks:
+        with track.timings.stage(f'write {sink.name}'):
+            sink.write(track)
+    logger.debug(f"Compiled {Path(gpx_path).name}: {track.timings}")
+    return track
+
+
+def default_sinks(output_dir: Union[str, Path], stem: str) -> List[Sink]:
+    """The three course outputs the server reads, as ``output_dir/stem.*``"""
+    output_dir = Path(output_dir)
+    return [TreadmillProfileSink(output_dir / f'{stem}.json'),
+            GeoJSONSink(output_dir / f'{stem}.geojson'),
+            CourseStoreSink(output_dir / f'{stem}.course')]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile a GPX into treadmill JSON, GeoJSON and .course files',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('input_gpx', help='Input GPX file path')
+    parser.add_argument('output_dir', help='Directory for <name>.json/.geojson/.course')
+    parser.add_argument('--min_segment', type=float, default=MIN_SEGMENT_LENGTH,
+                        help='Minimum metres between treadmill profile points')
+    parser.add_argument('--segment_length', type=float, default=SEGMENT_LENGTH,
+                        help='Metres per grade_profile step')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print per-stage timings')
+    args = parser.parse_args()
+
+    try:
+        sinks = default_sinks(args.output_dir, Path(args.input_gpx).stem)
+        track = compile_course(args.input_gpx, sinks, args.min_segment, args.segment_length)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    for sink in sinks:
+        print(f"Saved {sink.path}")
+    if args.verbose:
+        print(f"{track.name}: {len(track)} points, {track.treadmill['metadata']['total_distance_km']} km")
+        print(f"Stages: {track.timings}")
@@ -0,0 +1,154 @@
+"""Compiled binary course format (.course), memory-mapped with numpy.
+
+Layout: a fixed header, a JSON metadata block naming each column's dtype
+and byte offset, then one contiguous little-endian array per column
+(64-byte aligned). Readers map the file instead of parsing it, so opening
+a course costs the same for 14 km as for 42 km. Every process that opens
+the same file shares one copy of its pages in the OS page cache.
+
+    python -m utils.course_store <file.course>    (from src/) prints a summary
+"""
+import json
+import math
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+
+MAGIC = b'COURSE\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHII')  # magic, version, column count, points, metadata length
+ALIGN = 64
+
+# Column name -> dtype. time is epoch seconds (NaN when the GPX has none),
+# hr is bpm with 0 meaning no reading.
+COLUMNS = (
+    ('km', '<f8'),
+    ('lat', '<f8'),
+    ('lon', '<f8'),
+    ('ele', '<f4'),
+    ('grade', '<f4'),
+    ('time', '<f8'),
+    ('hr', '<u1'),
+)
+
+
+class CourseFormatError(ValueError):
+    """File is not a compiled course this reader understands"""
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_course(path: Union[str, Path], name: str, columns: Dict[str, Sequence],
+                 metadata: Optional[Dict[str, Any]] = None) -> Path:
+    """Write columns (missing ones filled as 'no data') to ``path`` atomically"""
+    path = Path(path)
+    count = len(columns['km'])
+    arrays = []
+    for column, dtype in COLUMNS:
+        values = columns.get(column)
+        if values is None:
+            fill = math.nan if np.dtype(dtype).kind == 'f' else 0
+            array = np.full(count, fill, dtype=dtype)
+        else:
+            array = np.asarray(values, dtype=dtype)
+        if len(array) != count:
+            raise ValueError(f"Column {column} has {len(array)} values, expected {count}")
+        arrays.append((column, dtype, array))
+
+    km = arrays[0][2]
+    meta: Dict[str, Any] = dict(metadata or {})
+    meta.update({'name': name, 'points': count, 'total_km': float(km[-1]) if count else 0.0})
+    # Offsets depend on the metadata length, which depends on the offsets;
+    # reserve room for them, then fill them in
+    meta['columns'] = [{'name': c, 'dtype': d, 'offset': 0} for c, d, _ in arrays]
+    blob = json.dumps(meta).encode('utf-8') + b' ' * 16 * len(arrays)
+    offset = _aligned(HEADER.size + len(blob))
+    for entry, (_, _, array) in zip(meta['columns'], arrays):
+        entry['offset'] = offset
+        offset = _aligned(offset + array.nbytes)
+    encoded = json.dumps(meta).encode('utf-8')
+    blob = encoded + b' ' * (len(blob) - len(encoded))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(arrays), count, len(blob)))
+        f.write(blob)
+        for entry, (_, _, array) in zip(meta['columns'], arrays):
+            f.write(b'\x00' * (entry['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+class CompiledCourse:
+    """Read-only, memory-mapped view of a .course file.
+
+    Columns are numpy arrays backed by the mapping (``course.km``,
+    ``course['ele']``); nothing is read until it is touched.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._map = np.memmap(self.path, dtype=np.uint8, mode='r')
+        if len(self._map) < HEADER.size:
+            raise CourseFormatError(f"{self.path.name} is too short for a course header")
+        magic, version, _, count, meta_len = HEADER.unpack(self._map[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise CourseFormatError(f"{self.path.name} is not a compiled course")
+        if version != VERSION:
+            raise CourseFormatError(f"{self.path.name} has unsupported version {version}")
+        self.metadata: Dict[str, Any] = json.loads(
+            self._map[HEADER.size:HEADER.size + meta_len].tobytes())
+        self.name: str = self.metadata['name']
+        self.points = count
+        self.columns: Dict[str, np.ndarray] = {}
+        for entry in self.metadata['columns']:
+            dtype = np.dtype(entry['dtype'])
+            start = entry['offset']
+            # Plain ndarray views (still backed by the mapping): memmap's own
+            # __getitem__ is several times slower for scalar lookups
+            column = self._map[start:start + count * dtype.itemsize].view(dtype=dtype, type=np.ndarray)
+            self.columns[entry['name']] = column
+
+    def __getattr__(self, column: str) -> np.ndarray:
+        try:
+            return self.__dict__['columns'][column]
+        except KeyError:
+            raise AttributeError(column)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __len__(self) -> int:
+        return self.points
+
+    @property
+    def total_km(self) -> float:
+        return float(self.metadata['total_km'])
+
+    def has(self, column: str) -> bool:
+        """Whether the column holds any data (not all NaN / zero)"""
+        values = self.columns.get(column)
+        if values is None or not len(values):
+            return False
+        if values.dtype.kind == 'f':
+            return not bool(np.isnan(values).all())
+        return bool(values.any())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.course_store <file.course>", file=sys.stderr)
+        sys.exit(1)
+    course = CompiledCourse(sys.argv[1])
+    print(f"{course.name}: {len(course)} points, {course.total_km:.3f} km")
+    for column, values in course.columns.items():
+        print(f"  {column:6s} {values.dtype.str:4s} {'data' if course.has(column) else 'empty'}")
@@ -0,0 +1,128 @@
+"""Streaming GPX track reader with bounded memory.
+
+gpxpy builds an object per point, plus every extension element, before
+the caller sees any of them. ``GPXReader`` uses ``iterparse`` instead.
+It yields one small ``TrackPoint`` tuple per ``<trkpt>`` as soon as the
+point closes, and drops each element once it has been read. Memory
+stays flat however long the recording is.
+
+    python -m utils.gpx_stream <file.gpx>    (from src/) prints a summary
+"""
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Iterator, List, NamedTuple, Optional, Union
+
+
+class TrackPoint(NamedTuple):
+    lat: float
+    lon: float
+    ele: Optional[float]
+    time: Optional[float]         # epoch seconds
+    hr: Optional[int]             # TrackPointExtension fields, None when absent
+    cad: Optional[int]
+    temp: Optional[float]
+    segment: int                  # running <trkseg> number across all tracks
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_time(text: str) -> float:
+    """GPX (ISO 8601) timestamp to epoch seconds"""
+    text = text.strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    return datetime.fromisoformat(text).timestamp()
+
+
+def _number(text: Optional[str], kind=float):
+    if text is None or not text.strip():
+        return None
+    return kind(float(text))
+
+
+class GPXReader:
+    """Iterate the track points of a GPX file or file object.
+
+    ``track_names`` fills in as tracks are reached. The names are only
+    complete once iteration has finished.
+    """
+
+    def __init__(self, source: Union[str, Path, IO[bytes]]):
+        self.source = source
+        self.track_names: List[Optional[str]] = []
+        self.points = 0
+
+    def __iter__(self) -> Iterator[TrackPoint]:
+        segment = -1
+        in_track = in_point = False
+        parent = None  # element currently holding <trkpt> children
+        lat = lon = 0.0
+        ele = time = hr = cad = temp = None
+
+        for event, elem in ET.iterparse(self.source, events=('start', 'end')):
+            tag = _local(elem.tag)
+            if event == 'start':
+                if tag == 'trkpt':
+                    in_point = True
+                    lat, lon = float(elem.get('lat')), float(elem.get('lon'))
+                    ele = time = hr = cad = temp = None
+                elif tag == 'trkseg':
+                    segment += 1
+                    parent = elem
+                elif tag == 'trk':
+                    in_track = True
+                    self.track_names.append(None)
+                continue
+
+            if in_point:
+                if tag == 'trkpt':
+                    in_point = False
+                    self.points += 1
+                    yield TrackPoint(lat, lon, ele, time, hr, cad, temp, segment)
+                    # Drop the finished point so the tree never grows
+                    elem.clear()
+                    if parent is not None:
+                        parent.remove(elem)
+                elif tag == 'ele':
+                    ele = _number(elem.text)
+                elif tag == 'time' and elem.text:
+                    time = parse_time(elem.text)
+                elif tag == 'hr':
+                    hr = _number(elem.text, int)
+                elif tag == 'cad':
+                    cad = _number(elem.text, int)
+                elif tag == 'atemp':
+                    temp = _number(elem.text)
+            elif tag == 'name' and in_track and parent is None:
+                self.track_names[-1] = (elem.text or '').strip() or None
+            elif tag == 'trkseg':
+                parent = None
+            elif tag == 'trk':
+                in_track = False
+                elem.clear()
+
+
+def iter_points(source: Union[str, Path, IO[bytes]]) -> Iterator[TrackPoint]:
+    """Track points of ``source`` as they are parsed"""
+    return iter(GPXReader(source))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.gpx_stream <file.gpx>", file=sys.stderr)
+        sys.exit(1)
+    reader = GPXReader(sys.argv[1])
+    first = last = None
+    with_hr = 0
+    for point in reader:
+        first = first or point
+        last = point
+        with_hr += point.hr is not None
+    print(f"{', '.join(n or '(unnamed)' for n in reader.track_names)}: {reader.points} points, "
+          f"{with_hr} with heart rate")
+    if first is not None:
+        print(f"  first {first}\n  last  {last}")
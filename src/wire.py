@@ -0,0 +1,90 @@
+import struct
+from typing import Any, Dict
+
+# Binary ``system_update`` metrics frame, little-endian, 23 bytes:
+#   u8  version
+#   u8  present   bit flags, see FIELD_* below
+#   u64 timestamp epoch milliseconds
+#   u16 speed     km/h x 100
+#   i16 incline   % x 100
+#   u32 distance  metres x 100
+#   u8  heart_rate bpm
+#   u16 treadmill sample age, ms (saturates at 65535)
+#   u16 hrm sample age, ms
+# static/js/app.js decodeMetricsFrame() must match this layout.
+VERSION = 1
+METRICS_FRAME = struct.Struct('<BBQHhIBHH')
+
+FIELD_SPEED = 0x01
+FIELD_INCLINE = 0x02
+FIELD_DISTANCE = 0x04
+FIELD_HEART_RATE = 0x08
+FIELD_TREADMILL_AGE = 0x10
+FIELD_HRM_AGE = 0x20
+
+_U16 = 0xFFFF
+_U32 = 0xFFFFFFFF
+
+
+def _scaled(value, scale: float, low: int, high: int) -> int:
+    return min(max(int(round(value * scale)), low), high)
+
+
+def pack_metrics(sample: Dict[str, Any]) -> bytes:
+    """Fused sample (epoch-seconds ``timestamp``) to a binary metrics frame"""
+    present = 0
+    speed = incline = distance = heart_rate = treadmill_age = hrm_age = 0
+
+    value = sample.get('speed')
+    if value is not None:
+        present |= FIELD_SPEED
+        speed = _scaled(value, 100, 0, _U16)
+    value = sample.get('incline')
+    if value is not None:
+        present |= FIELD_INCLINE
+        incline = _scaled(value, 100, -0x8000, 0x7FFF)
+    value = sample.get('distance')
+    if value is not None:
+        present |= FIELD_DISTANCE
+        distance = _scaled(value, 100, 0, _U32)
+    value = sample.get('heart_rate')
+    if value is not None:
+        present |= FIELD_HEART_RATE
+        heart_rate = _scaled(value, 1, 0, 0xFF)
+
+    ages = sample.get('ages') or {}
+    value = ages.get('treadmill')
+    if value is not None:
+        present |= FIELD_TREADMILL_AGE
+        treadmill_age = _scaled(value, 1000, 0, _U16)
+    value = ages.get('hrm')
+    if value is not None:
+        present |= FIELD_HRM_AGE
+        hrm_age = _scaled(value, 1000, 0, _U16)
+
+    return METRICS_FRAME.pack(VERSION, present, int(sample['timestamp'] * 1000),
+                              speed, incline, distance, heart_rate, treadmill_age, hrm_age)
+
+
+def unpack_metrics(frame: bytes) -> Dict[str, Any]:
+    """Inverse of ``pack_metrics``, for tests and replay tools"""
+    (version, present, timestamp, speed, incline, distance,
+     heart_rate, treadmill_age, hrm_age) = METRICS_FRAME.unpack(frame)
+    if version != VERSION:
+        raise ValueError(f"Unsupported metrics frame version {version}")
+    sample: Dict[str, Any] = {'type': 'metrics', 'timestamp': timestamp}
+    if present & FIELD_SPEED:
+        sample['speed'] = speed / 100
+    if present & FIELD_INCLINE:
+        sample['incline'] = incline / 100
+    if present & FIELD_DISTANCE:
+        sample['distance'] = distance / 100
+    if present & FIELD_HEART_RATE:
+        sample['heart_rate'] = heart_rate
+    ages = {}
+    if present & FIELD_TREADMILL_AGE:
+        ages['treadmill'] = treadmill_age / 1000
+    if present & FIELD_HRM_AGE:
+        ages['hrm'] = hrm_age / 1000
+    sample['ages'] = ages
+    return sample
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from course_index import CourseIndex, haversine_m
+
+
+def route(points=2001):
+    """A wiggly northbound course, roughly 2.2 km long"""
+    i = np.arange(points)
+    lat = -33.87 + i * 1e-5
+    lon = 151.2 + 2e-5 * np.sin(i / 20)
+    metres = np.concatenate([[0.0], np.cumsum([haversine_m(lat[j - 1], lon[j - 1], lat[j], lon[j])
+                                               for j in range(1, points)])])
+    ele = 20 + 10 * np.sin(i / 100)
+    grade = np.concatenate([[0.0], np.diff(ele) / np.maximum(np.diff(metres), 1e-9) * 100])
+    return {'km': metres / 1000, 'lat': lat, 'lon': lon, 'ele': ele, 'grade': grade}
+
+
+@pytest.fixture(scope='session')
+def columns():
+    return route()
+
+
+@pytest.fixture(scope='session')
+def index(columns):
+    return CourseIndex('wiggle', columns['km'].tolist(), columns['lat'].tolist(), columns['lon'].tolist(),
+                       ele=columns['ele'].tolist(), grade_km=[0.0, 1.0], grade=[2.0, -1.5],
+                       ghost=[{'start_m': 0, 'end_m': 1000, 'pace_min_km': 5.0},
+                              {'start_m': 1000, 'end_m': 2000, 'pace_min_km': 6.0}])
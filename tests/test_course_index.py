@@ -0,0 +1,50 @@
+import pytest
+
+from course_index import CourseError, CourseIndex
+
+
+def test_at_interpolates_and_clamps(index, columns):
+    mid = (columns['km'][10] + columns['km'][11]) / 2
+    position = index.at(mid)
+    assert position['lat'] == pytest.approx((columns['lat'][10] + columns['lat'][11]) / 2)
+    assert position['ele'] == pytest.approx((columns['ele'][10] + columns['ele'][11]) / 2)
+
+    assert index.at(-1)['km'] == 0.0
+    end = index.at(index.total_km + 5)
+    assert end['km'] == index.total_km
+    assert end['lat'] == pytest.approx(columns['lat'][-1])
+
+
+def test_grade_is_a_step_function(index):
+    assert index.grade_at(0.5) == 2.0
+    assert index.grade_at(1.0) == -1.5
+    assert index.grade_at(2.0) == -1.5
+
+
+def test_ghost(index):
+    assert index.ghost_pace_at(500) == 5.0
+    assert index.ghost_pace_at(1500) == 6.0
+    assert index.ghost_pace_at(5000) is None
+    assert index.ghost_distance_at(150) == pytest.approx(500)      # 5 min/km: 300 s per km
+    assert index.ghost_distance_at(300 + 180) == pytest.approx(1500)
+    assert index.ghost_distance_at(10_000) == 2000
+
+
+def test_query(index):
+    result = index.query(km=0.5, ghost_s=150)
+    assert result['course'] == 'wiggle'
+    assert result['has_ghost'] is True
+    assert result['position']['km'] == 0.5
+    assert result['ghost_pace'] == 5.0
+    assert result['ghost']['km'] == pytest.approx(0.5)
+
+
+def test_query_without_a_ghost():
+    result = CourseIndex('flat', [0.0, 1.0], [0.0, 0.01], [0.0, 0.0]).query(km=0.5, ghost_s=60)
+    assert result['has_ghost'] is False
+    assert result['ghost'] is None
+
+
+def test_needs_two_points():
+    with pytest.raises(CourseError):
+        CourseIndex('dot', [0.0], [0.0], [0.0])
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from course_lod import MAX_ZOOM, CoursePyramid
+
+
+@pytest.fixture(scope='module')
+def pyramid(index):
+    return CoursePyramid(index)
+
+
+def test_levels_get_coarser(pyramid, index):
+    sizes = [len(level) for level in pyramid.route_levels]
+    assert sizes[0] == len(index.km)
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[-1] < sizes[0]
+    for level, level_km in zip(pyramid.route_levels, pyramid.route_level_km):
+        assert np.array_equal(level_km, np.asarray(index.km)[level])
+
+
+def test_level_for_zoom_is_monotonic(pyramid):
+    levels = [pyramid.level_for_zoom(z) for z in range(0, 22)]
+    assert levels == sorted(levels, reverse=True)
+    assert levels[-1] == 0
+
+
+@pytest.mark.parametrize('from_km,to_km,max_points', [
+    (0.0, None, 50),
+    (0.3, 1.7, 100),
+    (0.5, 0.6, 1000),
+    (1.0, 1.0, 10),
+])
+def test_window(pyramid, index, from_km, to_km, max_points):
+    window = pyramid.window(from_km, to_km, max_points=max_points)
+    to_km = index.total_km if to_km is None else to_km
+    km = window['km']
+    assert km[0] == from_km and km[-1] == to_km
+    assert all(from_km < k < to_km for k in km[1:-1])
+    assert km == sorted(km)
+    assert len(km) == len(window['coordinates']) <= max_points
+    start = index.at(from_km)
+    assert window['coordinates'][0] == [round(start['lon'], 6), round(start['lat'], 6)]
+
+    profile = window['profile']
+    assert profile[0]['km'] == round(from_km, 4) and profile[-1]['km'] == round(to_km, 4)
+    assert len(profile) <= max_points
+
+
+def test_window_clamps_to_course(pyramid, index):
+    window = pyramid.window(-1, index.total_km + 1)
+    assert window['from_km'] == 0.0
+    assert window['to_km'] == index.total_km
+
+
+@pytest.mark.parametrize('zoom', [5000.0, -5000.0, float('inf'), float('-inf')])
+def test_out_of_range_zoom_is_clamped(pyramid, zoom):
+    expected = pyramid.level_for_zoom(MAX_ZOOM if zoom > 0 else 0)
+    assert pyramid.level_for_zoom(zoom) == expected
+    assert pyramid.window(0.0, 1.0, zoom=zoom)['level'] == expected
+
+
+def test_window_for_zoom_uses_that_level(pyramid):
+    window = pyramid.window(0.0, 2.0, zoom=12)
+    assert window['level'] == pyramid.level_for_zoom(12)
+    assert window['tolerance_m'] == pyramid.tolerances[window['level']]
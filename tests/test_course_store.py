@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from course_index import CourseIndex
+from utils.course_store import CompiledCourse, CourseFormatError, write_course
+
+
+def test_compiled_round_trip(tmp_path, columns):
+    path = write_course(tmp_path / 'wiggle.course', 'wiggle', columns)
+    course = CompiledCourse(path)
+    assert len(course) == len(columns['km'])
+    assert course.name == 'wiggle'
+    assert np.array_equal(course.km, columns['km'])
+    assert course.ele.dtype == np.float32
+    assert not course.has('time')
+
+    index = CourseIndex.from_compiled(course)
+    assert index.total_km == pytest.approx(columns['km'][-1])
+    assert index.at(1.0)['lat'] == pytest.approx(CourseIndex('list', columns['km'], columns['lat'],
+                                                             columns['lon']).at(1.0)['lat'])
+    assert index.ghost_distance_at(0) is None   # no timestamps recorded
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'bad.course'
+    path.write_bytes(b'x' * 64)
+    with pytest.raises(CourseFormatError):
+        CompiledCourse(path)
+
+
+def test_column_lengths_must_match(tmp_path, columns):
+    with pytest.raises(ValueError):
+        write_course(tmp_path / 'bad.course', 'bad', {**columns, 'ele': columns['ele'][:-1]})
@@ -0,0 +1,83 @@
+import struct
+from pathlib import Path
+
+import pytest
+import yaml
+
+from ble.frame_decoder import FrameDecoder, FrameLayoutError
+from treadmill_manager import WoodwayTreadmill
+
+CONFIG = Path(__file__).parent.parent / 'configs' / 'woodway_treadmill.yaml'
+LAYOUTS = yaml.safe_load(CONFIG.read_text())['frame_layouts']
+
+
+def frame(speed: int, distance: int, heart_rate: int, incline: int, distance_width: int = 2) -> bytearray:
+    data = bytearray(22)
+    struct.pack_into('<H', data, 6, speed)
+    struct.pack_into('<H' if distance_width == 2 else '<I', data, 8, distance)
+    data[13] = heart_rate
+    struct.pack_into('<H', data, 16, incline)
+    return data
+
+
+def test_woodway_4front_layout():
+    decoder = FrameDecoder.from_layout(LAYOUTS['woodway_4front'])
+    assert decoder.struct.format == '<6xHH3xB2xH'
+    assert decoder.fields == ('speed', 'distance', 'heart_rate', 'incline')
+    assert decoder.min_length == 18
+    assert decoder.max_value('distance') == 0xFFFF
+
+    result = decoder.decode(frame(600, 1234, 128, 25))
+    assert result == {'speed': 6.0, 'distance': 1234.0, 'heart_rate': 128, 'incline': 2.5}
+    assert isinstance(result['heart_rate'], int)
+
+
+def test_u32_distance_layout():
+    decoder = FrameDecoder.from_layout(LAYOUTS['woodway_4front_u32_distance'])
+    assert decoder.max_value('distance') == 0xFFFFFFFF
+    result = decoder.decode(frame(650, 70000, 140, 0, distance_width=4))
+    assert result == {'speed': 6.5, 'distance': 70000.0, 'heart_rate': 140, 'incline': 0.0}
+
+
+def test_signed_field():
+    decoder = FrameDecoder({'incline': [0, 1], 'flags': 2}, {'incline': 10.0}, signed=['incline'])
+    assert decoder.maxima == (0x7FFF, 0xFF)
+    assert decoder.decode(struct.pack('<hB', -25, 3)) == {'incline': -2.5, 'flags': 3}
+
+
+def test_unscaled_layout():
+    assert FrameDecoder({'a': [0, 1], 'b': 2}).decode(b'\x01\x00\x02') == {'a': 1, 'b': 2}
+
+
+@pytest.mark.parametrize('positions', [
+    {'a': [0, 1], 'b': [1, 2]},   # overlap
+    {'a': [0, 2]},                # 3 bytes wide
+])
+def test_invalid_layouts(positions):
+    with pytest.raises(FrameLayoutError):
+        FrameDecoder(positions)
+
+
+def test_layout_without_positions():
+    with pytest.raises(FrameLayoutError):
+        FrameDecoder.from_layout({'scale_factors': {}})
+
+
+def test_treadmill_accepts_u32_distances(tmp_path):
+    config = yaml.safe_load(CONFIG.read_text())
+    config['devices']['treadmill']['model'] = 'woodway_4front_u32_distance'
+    path = tmp_path / 'treadmill.yaml'
+    path.write_text(yaml.safe_dump(config))
+
+    treadmill = WoodwayTreadmill(str(path))
+    treadmill.last_raw_distance = 65500
+    result = treadmill._decode_frame(frame(600, 65600, 0, 0, distance_width=4), received=1.0)
+    assert result['distance'] == 65600.0
+    assert treadmill.last_raw_distance == 65600
+
+
+def test_treadmill_clamps_speed_and_incline():
+    treadmill = WoodwayTreadmill()
+    result = treadmill._decode_frame(frame(3000, 10, 0, 200), received=1.0)
+    assert result['speed'] == treadmill.config['max_speed']
+    assert result['incline'] == treadmill.config['max_incline']
@@ -0,0 +1,58 @@
+import pytest
+
+from fusion import StreamFusion
+
+
+def fusion(**kwargs):
+    kwargs.setdefault('delay', 0.0)
+    kwargs.setdefault('priority', ('hrm', 'treadmill'))
+    return StreamFusion(lambda sample: None, **kwargs)
+
+
+def test_interpolates_between_samples():
+    f = fusion(delay=0.1)
+    f.push('treadmill', {'speed': 6.0, 'heart_rate': 120}, t=10.0)
+    f.push('treadmill', {'speed': 8.0, 'heart_rate': 125}, t=11.0)
+    sample = f.sample(now=10.35)   # evaluated at 10.25
+    assert sample['speed'] == pytest.approx(6.5)
+    assert sample['heart_rate'] == 121   # ints stay ints
+    assert isinstance(sample['heart_rate'], int)
+
+
+def test_holds_outside_the_interval():
+    f = fusion()
+    f.push('treadmill', {'speed': 6.0}, t=10.0)
+    f.push('treadmill', {'speed': 8.0}, t=11.0)
+    assert f.sample(now=9.0)['speed'] == 6.0
+    assert f.sample(now=12.0)['speed'] == 8.0
+
+
+def test_interpolation_can_be_disabled():
+    f = fusion(interpolate=False)
+    f.push('treadmill', {'speed': 6.0}, t=10.0)
+    f.push('treadmill', {'speed': 8.0}, t=11.0)
+    assert f.sample(now=10.5)['speed'] == 8.0
+
+
+def test_priority_and_staleness():
+    f = fusion(max_age=5.0)
+    f.push('treadmill', {'speed': 6.0, 'heart_rate': 100}, t=10.0)
+    f.push('hrm', {'heart_rate': 140}, t=10.0)
+    assert f.sample(now=11.0)['heart_rate'] == 140
+
+    # A stale HRM loses to a fresh treadmill reading, but is still used on its own
+    f.push('treadmill', {'speed': 6.0, 'heart_rate': 101}, t=20.0)
+    sample = f.sample(now=20.0)
+    assert sample['heart_rate'] == 101
+    assert sample['ages'] == {'hrm': 10.0, 'treadmill': 0.0}
+
+    f = fusion(max_age=5.0)
+    f.push('hrm', {'heart_rate': 140}, t=10.0)
+    assert f.sample(now=30.0)['heart_rate'] == 140
+
+
+def test_unknown_sources_are_appended_to_priority():
+    f = fusion(priority=())
+    f.push('footpod', {'cadence': 170}, t=1.0)
+    assert f.priority == ['footpod']
+    assert f.sample(now=1.0)['cadence'] == 170
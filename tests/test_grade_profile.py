@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from grade_profile import FILTERS, GradeProfiles, resample, savgol_coefficients, smooth
+
+
+def interior(profile, margin_m=200.0):
+    """Grades away from the ends, where edge padding bends the smoothed profile"""
+    margin = int(margin_m // profile.step_m)
+    return profile.grade[margin:-margin]
+
+
+def test_resample_covers_the_course():
+    ele = resample(np.array([0.0, 0.1, 0.125]), np.array([0.0, 10.0, 10.0]), 25.0)
+    assert len(ele) == 6
+    assert ele[:5].tolist() == [0.0, 2.5, 5.0, 7.5, 10.0]
+
+
+def test_savgol_keeps_polynomials():
+    weights = savgol_coefficients(7, 2)
+    assert weights.sum() == pytest.approx(1.0)
+    x = np.arange(40, dtype=float)
+    quadratic = 0.05 * x ** 2 - x + 3
+    assert smooth(quadratic, 'savgol', 7)[5:-5] == pytest.approx(quadratic[5:-5])
+
+
+@pytest.mark.parametrize('method', FILTERS)
+def test_constant_grade_survives_every_filter(method):
+    km = np.linspace(0, 2, 81)
+    profiles = GradeProfiles(km, km * 1000 * 0.04, method=method)
+    for step, profile in profiles.profiles.items():
+        assert interior(profile) == pytest.approx(4.0), step
+    assert profiles.grade_at(1.0) == pytest.approx(4.0)
+
+
+def test_smoothing_removes_spikes():
+    km = np.linspace(0, 2, 201)
+    ele = km * 1000 * 0.02
+    ele[100] += 5.0   # one bad GPS fix
+    raw = GradeProfiles(km, ele, method='none')
+    smoothed = GradeProfiles(km, ele, method='median')
+    assert np.abs(interior(raw.profiles[10.0])).max() > 40
+    grade = interior(smoothed.profiles[10.0])
+    assert np.abs(grade).max() <= 4.0
+    assert np.median(grade) == pytest.approx(2.0)
+
+
+def test_resolutions_and_window():
+    km = np.linspace(0, 1, 51)
+    profiles = GradeProfiles(km, km * 1000 * 0.03, resolutions=(50.0, 10.0), default_step_m=20.0)
+    assert profiles.resolutions == [10.0, 50.0]
+    assert profiles.default_step_m == 10.0
+    assert profiles.nearest(40.0) == 50.0
+
+    window = profiles.window(0.2, 0.4, step_m=50.0)
+    assert window['step_m'] == 50.0
+    assert window['start_km'] == 0.2
+    assert len(window['grade']) == len(window['ele']) == 5
+
+
+def test_missing_elevation():
+    km = [0.0, 0.5, 1.0]
+    assert not GradeProfiles(km, [np.nan] * 3)
+    assert GradeProfiles(km, [np.nan, 10.0, 20.0]).total_km == 1.0
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        GradeProfiles([0.0, 1.0], [0.0, 10.0], method='kalman')
@@ -0,0 +1,135 @@
+import pytest
+
+import hr_control
+from hr_control import HRZoneController
+
+
+class FakeTimer:
+    def __init__(self, loop, when, callback):
+        self.loop, self.when, self.callback = loop, when, callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """Manual clock standing in for the running loop and time.monotonic()"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        timer = FakeTimer(self, when, callback)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        self.now += seconds
+        for timer in sorted(self.timers, key=lambda t: t.when):
+            if timer.when <= self.now and not timer.cancelled:
+                self.timers.remove(timer)
+                timer.callback()
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    loop = FakeLoop()
+    monkeypatch.setattr(hr_control.asyncio, 'get_running_loop', lambda: loop)
+    monkeypatch.setattr(hr_control.time, 'monotonic', loop.time)
+    return loop
+
+
+def hr_controller(commands, **kwargs):
+    kwargs.setdefault('max_speed', 16.0)
+    kwargs.setdefault('max_incline', 10.0)
+    kwargs.setdefault('period', 1.0)
+    return HRZoneController(lambda speed, incline: commands.append((speed, incline)), **kwargs)
+
+
+def test_hr_control_refuses_a_stopped_or_silent_belt(loop):
+    controller = hr_controller([])
+    with pytest.raises(ValueError, match='no recent treadmill data'):
+        controller.engage(3)
+    controller.observe({'speed': 0.0, 'ages': {'treadmill': 0.1}})
+    with pytest.raises(ValueError, match='belt below'):
+        controller.engage(3)
+    assert not controller.engaged
+    with pytest.raises(ValueError):
+        controller.engage(6)
+
+
+def test_hr_control_stays_within_limits(loop):
+    commands = []
+    controller = hr_controller(commands, speed_ceiling=12.0, speed_rate=0.5, incline_rate=1.0, kp=1.0)
+    controller.observe({'speed': 11.0, 'incline': 0.0, 'ages': {'treadmill': 0.0}})
+    controller.engage(5)
+    for _ in range(120):
+        # A heart rate that never rises: the controller pushes as hard as it may
+        controller.observe({'speed': 11.0, 'incline': 0.0, 'ages': {'treadmill': 0.0}})
+        controller.push_heart_rate(100)
+        loop.advance(1.0)
+
+    assert controller.engaged and commands
+    speeds = [11.0] + [s for s, _ in commands]
+    inclines = [0.0] + [i for _, i in commands]
+    assert max(speeds) == 12.0
+    assert max(inclines) == 10.0
+    assert all(abs(b - a) <= 0.5 + 1e-9 for a, b in zip(speeds, speeds[1:]))
+    assert all(abs(b - a) <= 1.0 + 1e-9 for a, b in zip(inclines, inclines[1:]))
+
+
+def test_hr_control_never_goes_below_min_speed(loop):
+    commands = []
+    controller = hr_controller(commands, min_speed=4.0, speed_rate=1.0, kp=1.0)
+    controller.observe({'speed': 5.0, 'incline': 0.0, 'ages': {'treadmill': 0.0}})
+    controller.engage(1)
+    for _ in range(30):
+        controller.observe({'speed': 5.0, 'ages': {'treadmill': 0.0}})
+        controller.push_heart_rate(180)
+        loop.advance(1.0)
+    assert commands and min(s for s, _ in commands) == 4.0
+
+
+def test_hr_control_holds_on_stale_heart_rate(loop):
+    commands = []
+    controller = hr_controller(commands, max_hr_age=5.0)
+    controller.observe({'speed': 8.0, 'ages': {'treadmill': 0.0}})
+    controller.push_heart_rate(100)
+    controller.engage(3)
+    for _ in range(5):
+        controller.observe({'speed': 8.0, 'ages': {'treadmill': 0.0}})
+        loop.advance(1.0)
+    sent = len(commands)
+    for _ in range(10):
+        controller.observe({'speed': 8.0, 'ages': {'treadmill': 0.0}})
+        loop.advance(1.0)
+    assert controller.engaged
+    assert controller.held == 10
+    assert len(commands) == sent
+
+
+def test_hr_control_lets_go_when_the_belt_stops(loop):
+    controller = hr_controller([])
+    controller.observe({'speed': 8.0, 'ages': {'treadmill': 0.0}})
+    controller.engage(3)
+    loop.advance(1.0)
+    assert controller.engaged
+    controller.observe({'speed': 0.0, 'ages': {'treadmill': 0.0}})
+    loop.advance(1.0)
+    assert not controller.engaged
+    assert not loop.timers
+
+
+def test_hr_control_lets_go_when_treadmill_data_is_stale(loop):
+    controller = hr_controller([], max_belt_age=3.0)
+    controller.observe({'speed': 8.0, 'ages': {'treadmill': 0.0}})
+    controller.engage(3)
+    loop.advance(3.0)
+    assert controller.engaged
+    loop.advance(1.0)
+    assert not controller.engaged
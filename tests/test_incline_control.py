@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from course_index import CourseIndex
+from grade_profile import GradeProfiles
+from incline_control import InclineController
+
+
+def course(grade_pct, km=2.0):
+    """Straight course climbing at a constant ``grade_pct``"""
+    points = np.linspace(0, km, 201)
+    index = CourseIndex('climb', points.tolist(), (-33.87 + points / 111).tolist(), [151.2] * len(points),
+                        ele=(points * 1000 * grade_pct / 100).tolist())
+    index.grades = GradeProfiles(index.km, index.ele)
+    return index
+
+
+def test_incline_clamps_to_max_incline():
+    commands = []
+    controller = InclineController(commands.append, max_incline=15.0)
+    controller.engage(course(25.0), km=0.5)
+    controller.update({'distance': 0.0, 'speed': 8.0, 'incline': 0.0})
+    assert commands == [15.0]
+
+    controller.engage(course(-25.0), km=0.5)
+    controller.update({'distance': 0.0, 'speed': 8.0, 'incline': 0.0})
+    assert commands[-1] == -15.0
+
+
+def test_incline_deadband_suppresses_small_changes():
+    commands = []
+    controller = InclineController(commands.append, deadband=0.5)
+    controller.engage(course(3.0), km=0.5)
+    for metres in range(0, 500, 10):
+        controller.update({'distance': float(metres), 'speed': 10.0, 'incline': 3.0})
+    assert commands == [3.0]
+    assert controller.suppressed == 49
+
+
+def test_incline_returns_to_flat_at_the_finish():
+    commands = []
+    controller = InclineController(commands.append)
+    index = course(4.0)
+    controller.engage(index, km=1.0)
+    controller.update({'distance': 0.0, 'speed': 10.0, 'incline': 0.0})
+    controller.update({'distance': index.total_km * 1000, 'speed': 10.0, 'incline': 4.0})
+    assert commands == [4.0, 0.0]
+
+
+def test_incline_needs_elevation():
+    index = CourseIndex('flat', [0.0, 1.0], [0.0, 0.01], [0.0, 0.0])
+    with pytest.raises(ValueError):
+        InclineController(lambda incline: None).engage(index)
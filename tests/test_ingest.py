@@ -0,0 +1,135 @@
+import asyncio
+import inspect
+
+import pytest
+
+from ble.ingest import BLOCK, COALESCE_LATEST, DROP_OLDEST, IngestQueue
+from treadmill_manager import WoodwayTreadmill
+
+# Woodway 4Front frame: 6.00 km/h, 128 bpm, 2.0 %
+SAMPLE_FRAME = '0000000000005802d204000000800000140000000000'
+
+
+def fill(policy, items, maxsize=3):
+    """Queue ``items`` with the consumer stopped, then drain; returns what was delivered"""
+    async def run():
+        delivered = []
+        queue = IngestQueue(delivered.append, maxsize=maxsize, policy=policy)
+        for item in items:
+            queue.put_nowait(item)
+        queue.start()
+        while queue.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await queue.stop()
+        return queue, delivered
+    return asyncio.run(run())
+
+
+def test_drop_oldest():
+    queue, delivered = fill(DROP_OLDEST, range(6))
+    assert delivered == [3, 4, 5]
+    assert queue.dropped == 3
+    assert queue.max_depth == 3
+
+
+def test_coalesce_latest():
+    queue, delivered = fill(COALESCE_LATEST, range(6))
+    assert delivered == [0, 1, 5]
+    assert queue.coalesced == 3
+    assert queue.enqueued == 3
+
+
+def test_block_put_nowait_rejects_the_new_frame():
+    async def run():
+        queue = IngestQueue(lambda item: None, maxsize=3, policy=BLOCK)
+        for item in range(3):
+            queue.put_nowait(item)
+        with pytest.raises(asyncio.QueueFull):
+            queue.put_nowait(3)
+        return queue
+
+    queue = asyncio.run(run())
+    assert [item for _, item in queue._items] == [0, 1, 2]
+    assert queue.rejected == 1
+    assert queue.stats()['rejected'] == 1
+
+
+def test_block_policy_device_handler_stays_synchronous():
+    treadmill = WoodwayTreadmill()
+    treadmill.ingest = IngestQueue(treadmill._deliver, maxsize=2, policy=BLOCK, name='treadmill')
+    treadmill.callback = lambda result: None
+    assert not inspect.iscoroutinefunction(treadmill._handle_data)
+
+    async def run():
+        for _ in range(5):
+            treadmill._handle_data(None, bytearray.fromhex(SAMPLE_FRAME))
+        await treadmill.watchdog.stop()
+
+    asyncio.run(run())
+    assert treadmill.frames_received == 5
+    assert treadmill.ingest.depth == 2
+    assert treadmill.ingest.rejected == 3
+
+
+def test_block_put_waits_and_keeps_order():
+    async def run():
+        delivered = []
+
+        async def consumer(item):
+            await asyncio.sleep(0)
+            delivered.append(item)
+
+        queue = IngestQueue(consumer, maxsize=2, policy=BLOCK)
+        queue.start()
+        for item in range(10):
+            await queue.put(item)
+            assert queue.depth <= 2
+        while queue.depth or len(delivered) < 10:
+            await asyncio.sleep(0)
+        await queue.stop()
+        return queue, delivered
+
+    queue, delivered = asyncio.run(run())
+    assert delivered == list(range(10))
+    assert queue.dropped == queue.coalesced == 0
+
+
+def test_consumer_errors_do_not_stop_delivery():
+    def consumer(item):
+        if item == 1:
+            raise RuntimeError('boom')
+        delivered.append(item)
+
+    async def run():
+        queue = IngestQueue(consumer, maxsize=4)
+        for item in range(3):
+            queue.put_nowait(item)
+        queue.start()
+        while queue.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await queue.stop()
+        return queue
+
+    delivered = []
+    queue = asyncio.run(run())
+    assert delivered == [0, 2]
+    assert queue.errors == 1
+
+
+def test_stop_discards_pending_frames():
+    async def run():
+        queue = IngestQueue(lambda item: None, maxsize=4)
+        queue.put_nowait(1)
+        queue.put_nowait(2)
+        await queue.stop()
+        return queue.depth
+
+    assert asyncio.run(run()) == 0
+
+
+@pytest.mark.parametrize('kwargs', [{'policy': 'newest'}, {'maxsize': 0}])
+def test_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        IngestQueue(lambda item: None, **kwargs)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from ble.session_log import SessionLog, SessionLogError, SessionRecorder, SessionReplay
+
+TREADMILL = '0000fff1-0000-1000-8000-00805f9b34fb'
+HRM = '00002a37-0000-1000-8000-00805f9b34fb'
+FRAMES = [
+    (0.0, TREADMILL, b'\x01\x02\x03'),
+    (0.05, HRM, b'\x00\x8c'),
+    (0.1, TREADMILL, b'\x04\x05\x06'),
+]
+
+
+def record(path, frames=FRAMES):
+    with SessionRecorder(path) as recorder:
+        for timestamp, uuid, data in frames:
+            recorder.record(uuid, bytearray(data), timestamp=timestamp)
+
+
+def read(path):
+    with SessionLog(path) as log:
+        return [(t, uuid, bytes(payload)) for t, uuid, payload in log]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'run.bles'
+    record(path)
+    assert read(path) == FRAMES
+    with SessionLog(path) as log:
+        assert sorted(log.channels.values()) == sorted({TREADMILL, HRM})
+
+
+def test_appending_keeps_channel_numbers(tmp_path):
+    path = tmp_path / 'run.bles'
+    record(path)
+    record(path, [(0.2, HRM, b'\x00\x8d')])
+    assert read(path) == FRAMES + [(0.2, HRM, b'\x00\x8d')]
+
+
+def test_truncated_tail_is_ignored(tmp_path, caplog):
+    path = tmp_path / 'run.bles'
+    record(path)
+    path.write_bytes(path.read_bytes()[:-2])
+    assert read(path) == FRAMES[:-1]
+    assert 'truncated' in caplog.text
+
+
+def test_appending_after_a_truncated_tail(tmp_path):
+    path = tmp_path / 'run.bles'
+    record(path)
+    path.write_bytes(path.read_bytes()[:-2])
+    extra = [(0.2, HRM, b'\x00\x8d'), (0.3, 'new-characteristic', b'\x07')]
+    record(path, extra)
+    assert read(path) == FRAMES[:-1] + extra
+    with SessionLog(path) as log:
+        assert 'new-characteristic' in log.channels.values()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'run.bles'
+    path.write_bytes(b'not a session log')
+    with pytest.raises(SessionLogError):
+        SessionLog(path)
+    path.write_bytes(b'')
+    with pytest.raises(SessionLogError):
+        SessionLog(path)
+
+
+def test_replay_delivers_every_subscribed_frame(tmp_path):
+    path = tmp_path / 'run.bles'
+    record(path)
+
+    async def run():
+        replay = SessionReplay(path, speed=0)
+        client = replay.client_factory()('AA:BB')
+        received = []
+        await client.connect()
+        await client.start_notify(TREADMILL, lambda uuid, data: received.append(bytes(data)))
+        await asyncio.wait_for(replay.done.wait(), 1.0)
+        await client.disconnect()
+        return replay, received
+
+    replay, received = asyncio.run(run())
+    assert received == [b'\x01\x02\x03', b'\x04\x05\x06']
+    assert replay.frames_sent == 2
+    assert replay.frames_skipped == 1
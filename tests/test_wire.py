@@ -0,0 +1,84 @@
+import re
+import struct
+from pathlib import Path
+
+import pytest
+
+import wire
+
+APP_JS = (Path(__file__).parent.parent / 'static' / 'js' / 'app.js').read_text()
+
+# DataView getters used by decodeMetricsFrame(), as struct formats
+JS_TYPES = {'Uint8': 'B', 'Uint16': 'H', 'Int16': 'h', 'Uint32': 'I'}
+FIELD_LINE = re.compile(r"if \(present & (0x[0-9a-f]+)\) data\.([\w.]+) = "
+                        r"view\.get(\w+)\((\d+)(?:, true)?\)(?: / (\d+))?;")
+
+SAMPLE = {
+    'timestamp': 1_760_000_000.123,
+    'speed': 12.34,
+    'incline': -3.5,
+    'distance': 70000.25,
+    'heart_rate': 152,
+    'ages': {'treadmill': 0.25, 'hrm': 1.5},
+}
+
+
+def js_decode(frame: bytes):
+    """decodeMetricsFrame() from static/js/app.js, run on ``frame``"""
+    present = frame[1]
+    low, high = struct.unpack_from('<II', frame, 2)
+    data = {'timestamp': low + high * 4294967296, 'ages': {}}
+    for flag, name, getter, offset, scale in FIELD_LINE.findall(APP_JS):
+        if not present & int(flag, 16):
+            continue
+        value = struct.unpack_from('<' + JS_TYPES[getter], frame, int(offset))[0]
+        value = value / int(scale) if scale else value
+        if name.startswith('ages.'):
+            data['ages'][name[5:]] = value
+        else:
+            data[name] = value
+    return data
+
+
+def test_js_layout_matches_struct():
+    assert int(re.search(r'METRICS_FRAME_SIZE = (\d+);', APP_JS).group(1)) == wire.METRICS_FRAME.size
+    assert int(re.search(r'METRICS_FRAME_VERSION = (\d+);', APP_JS).group(1)) == wire.VERSION
+    assert len(FIELD_LINE.findall(APP_JS)) == 6
+
+
+def test_pack_metrics_round_trips_through_js_layout():
+    frame = wire.pack_metrics(SAMPLE)
+    assert len(frame) == wire.METRICS_FRAME.size
+    decoded = js_decode(frame)
+    unpacked = wire.unpack_metrics(frame)
+    assert unpacked.pop('type') == 'metrics'
+    assert decoded == unpacked
+    assert decoded['timestamp'] == 1_760_000_000_123
+    assert decoded['speed'] == pytest.approx(12.34)
+    assert decoded['incline'] == pytest.approx(-3.5)
+    assert decoded['distance'] == pytest.approx(70000.25)
+    assert decoded['heart_rate'] == 152
+    assert decoded['ages'] == {'treadmill': 0.25, 'hrm': 1.5}
+
+
+def test_missing_fields_are_not_flagged():
+    frame = wire.pack_metrics({'timestamp': 1.0, 'heart_rate': 90, 'ages': {'hrm': 0.1}})
+    assert frame[1] == wire.FIELD_HEART_RATE | wire.FIELD_HRM_AGE
+    assert js_decode(frame) == {'timestamp': 1000, 'heart_rate': 90, 'ages': {'hrm': 0.1}}
+
+
+def test_values_saturate():
+    frame = wire.pack_metrics({'timestamp': 0, 'speed': -1, 'incline': 500, 'heart_rate': 300,
+                               'ages': {'treadmill': 120.0}})
+    sample = wire.unpack_metrics(frame)
+    assert sample['speed'] == 0
+    assert sample['incline'] == 0x7FFF / 100
+    assert sample['heart_rate'] == 255
+    assert sample['ages']['treadmill'] == 65.535
+
+
+def test_unpack_rejects_other_versions():
+    frame = bytearray(wire.pack_metrics({'timestamp': 0}))
+    frame[0] = 2
+    with pytest.raises(ValueError):
+        wire.unpack_metrics(bytes(frame))